@@ -4,6 +4,7 @@ from sqlalchemy import engine_from_config, pool
 
 # 重要：确保 models 被 import，使得 Note 表等真正注册到 Base.metadata
 # 需要保证使用node前配置文件要运行一次
+import app.models  # noqa: F401
 from alembic import context
 from app import settings  # 关键：复用你已有的 .env 加载逻辑
 from app.db import Base
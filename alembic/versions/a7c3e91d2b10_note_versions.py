@@ -0,0 +1,52 @@
+"""note version column and collection versions
+
+Revision ID: a7c3e91d2b10
+Revises: e4332cf5334f
+Create Date: 2026-10-19 10:12:03.418275
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a7c3e91d2b10"
+down_revision: Union[str, Sequence[str], None] = "e4332cf5334f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app/models.py 里给 create_all 用的触发器一致（迁移里写死，不随模型代码变化）
+TRIGGER_SQL = """
+CREATE TRIGGER IF NOT EXISTS notes_collection_version_{name}
+AFTER {op} ON notes
+BEGIN
+    UPDATE collection_versions SET version = version + 1 WHERE name = 'notes';
+END
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("notes") as batch_op:
+        batch_op.add_column(sa.Column("version", sa.Integer(), server_default="1", nullable=False))
+    op.create_table(
+        "collection_versions",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.execute("INSERT INTO collection_versions (name, version) VALUES ('notes', 0)")
+    for name in ("insert", "update", "delete"):
+        op.execute(TRIGGER_SQL.format(name=name, op=name.upper()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in ("insert", "update", "delete"):
+        op.execute(f"DROP TRIGGER IF EXISTS notes_collection_version_{name}")
+    op.drop_table("collection_versions")
+    with op.batch_alter_table("notes") as batch_op:
+        batch_op.drop_column("version")
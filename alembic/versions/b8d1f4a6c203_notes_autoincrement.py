@@ -0,0 +1,61 @@
+"""notes id autoincrement
+
+Revision ID: b8d1f4a6c203
+Revises: 0b8e5d2f7a46
+Create Date: 2026-10-19 21:05:37.260418
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b8d1f4a6c203"
+down_revision: Union[str, Sequence[str], None] = "0b8e5d2f7a46"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app/models.py 里给 create_all 用的触发器一致（迁移里写死，不随模型代码变化）
+TRIGGERS = {
+    f"notes_collection_version_{name}": f"""
+    CREATE TRIGGER IF NOT EXISTS notes_collection_version_{name}
+    AFTER {name.upper()} ON notes
+    BEGIN
+        UPDATE collection_versions SET version = version + 1 WHERE name = 'notes';
+    END
+    """
+    for name in ("insert", "update", "delete")
+}
+TRIGGERS["notes_delete_summary"] = """
+    CREATE TRIGGER IF NOT EXISTS notes_delete_summary
+    AFTER DELETE ON notes
+    BEGIN
+        DELETE FROM note_summaries WHERE note_id = OLD.id;
+    END
+    """
+
+
+def _rebuild_notes(autoincrement: bool) -> None:
+    # AUTOINCREMENT 只能建表时指定：整表重建（复制数据、重建索引），表上的触发器会跟着丢掉，
+    # 所以先删后建；复制过程中不触发 collection_versions +1
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    with op.batch_alter_table(
+        "notes", recreate="always", table_kwargs={"sqlite_autoincrement": autoincrement}
+    ):
+        pass
+    for sql in TRIGGERS.values():
+        op.execute(sql)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 复制过来的行会把 sqlite_sequence 推到当前最大 id，之后的新笔记从它往上分配
+    # （已经删掉的、比当前最大 id 还大的那些 id 在迁移前就可能被复用过，这里管不到）
+    _rebuild_notes(autoincrement=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rebuild_notes(autoincrement=False)
@@ -0,0 +1,32 @@
+"""idempotency claim token
+
+Revision ID: c2e9a5f7b314
+Revises: b8d1f4a6c203
+Create Date: 2026-10-19 21:48:12.903527
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c2e9a5f7b314"
+down_revision: Union[str, Sequence[str], None] = "b8d1f4a6c203"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 已有的行没有令牌：处理中的旧占位过期后照常被接手，保存好的响应不受影响
+    with op.batch_alter_table("idempotency_keys") as batch_op:
+        batch_op.add_column(sa.Column("token", sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # SQLite 3.35+ 原生支持 DROP COLUMN，不用重建表
+    op.drop_column("idempotency_keys", "token")
@@ -0,0 +1,48 @@
+"""note summaries
+
+Revision ID: c51f0b7e8d24
+Revises: a7c3e91d2b10
+Create Date: 2026-10-19 14:40:51.207733
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c51f0b7e8d24"
+down_revision: Union[str, Sequence[str], None] = "a7c3e91d2b10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "note_summaries",
+        sa.Column("note_id", sa.Integer(), nullable=False),
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("prompt_key", sa.String(length=100), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["note_id"], ["notes.id"]),
+        sa.PrimaryKeyConstraint("note_id"),
+    )
+    op.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS notes_delete_summary
+        AFTER DELETE ON notes
+        BEGIN
+            DELETE FROM note_summaries WHERE note_id = OLD.id;
+        END
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS notes_delete_summary")
+    op.drop_table("note_summaries")
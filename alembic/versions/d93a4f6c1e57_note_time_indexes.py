@@ -0,0 +1,41 @@
+"""note updated_at and list filter indexes
+
+Revision ID: d93a4f6c1e57
+Revises: c51f0b7e8d24
+Create Date: 2026-10-19 16:05:12.418306
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d93a4f6c1e57"
+down_revision: Union[str, Sequence[str], None] = "c51f0b7e8d24"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # SQLite 的 ADD COLUMN 不能加 NOT NULL 且没有常量默认值的列：先允许为空，再用 created_at 回填
+    # （不改成 NOT NULL：那需要重建 notes 表，会连带删掉表上的触发器；新写入由 ORM 默认值保证非空）
+    with op.batch_alter_table("notes") as batch_op:
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE notes SET updated_at = created_at WHERE updated_at IS NULL")
+    op.create_index("ix_notes_created_at_id", "notes", ["created_at", "id"])
+    op.create_index("ix_notes_updated_at_id", "notes", ["updated_at", "id"])
+    op.create_index("ix_notes_title", "notes", ["title"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_notes_title", table_name="notes")
+    op.drop_index("ix_notes_updated_at_id", table_name="notes")
+    op.drop_index("ix_notes_created_at_id", table_name="notes")
+    # 不用 batch_alter_table：它会重建 notes 表，表上的触发器会跟着丢掉
+    # SQLite 3.35+ 原生支持 DROP COLUMN（列上的索引要先删掉）
+    op.drop_column("notes", "updated_at")
@@ -0,0 +1,37 @@
+"""backfill checkpoints
+
+Revision ID: e6b2d8a4c913
+Revises: d93a4f6c1e57
+Create Date: 2026-10-19 16:48:30.902114
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e6b2d8a4c913"
+down_revision: Union[str, Sequence[str], None] = "d93a4f6c1e57"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "backfill_checkpoints",
+        sa.Column("name", sa.String(length=100), nullable=False),
+        sa.Column("last_key", sa.Integer(), nullable=False),
+        sa.Column("rows_done", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("backfill_checkpoints")
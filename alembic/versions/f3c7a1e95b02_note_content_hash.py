@@ -0,0 +1,60 @@
+"""note content hash
+
+Revision ID: f3c7a1e95b02
+Revises: e6b2d8a4c913
+Create Date: 2026-10-19 17:20:44.115630
+
+"""
+
+import hashlib
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+from app.backfill import reset_checkpoint, run_backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "f3c7a1e95b02"
+down_revision: Union[str, Sequence[str], None] = "e6b2d8a4c913"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_NAME = "notes_content_hash"
+
+
+def _fill_content_hash(conn, rows) -> None:
+    # 和 app.models.content_hash 一致（迁移里写死，不随模型代码变化）
+    conn.execute(
+        sa.text("UPDATE notes SET content_hash = :h WHERE id = :id"),
+        [{"id": r.id, "h": hashlib.sha256(r.content.encode("utf-8")).hexdigest()} for r in rows],
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 先允许为空：ADD COLUMN 是瞬间完成的，回填期间新写入的笔记由应用直接写上 hash
+    with op.batch_alter_table("notes") as batch_op:
+        batch_op.add_column(sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_notes_content_hash", "notes", ["content_hash"])
+    # DDL 先提交，回填按批次各自提交：大表回填期间不长时间锁住数据库，中断后重跑会续上
+    with op.get_context().autocommit_block():
+        run_backfill(
+            op.get_bind().engine,
+            BACKFILL_NAME,
+            table="notes",
+            columns=["content"],
+            where="content_hash IS NULL",
+            process=_fill_content_hash,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_notes_content_hash", table_name="notes")
+    # 不用 batch_alter_table：它会重建 notes 表，表上的触发器会跟着丢掉
+    # SQLite 3.35+ 原生支持 DROP COLUMN（列上的索引要先删掉）
+    op.drop_column("notes", "content_hash")
+    # 进度一起清掉：再次 upgrade 时从头回填
+    with op.get_context().autocommit_block():
+        reset_checkpoint(op.get_bind().engine, BACKFILL_NAME)
@@ -0,0 +1,12 @@
+import sys
+
+
+async def close_upstream() -> None:
+    """
+    关闭当前事件循环上的上游连接池（lifespan 退出、摘要后台线程的 loop 关闭之前调用）。
+    只有真的用过 AI 客户端（模块已导入、池子已建）才需要关；不为关闭而导入 httpx
+    """
+    provider_pool = sys.modules.get("app.ai.provider_pool")
+    pool = getattr(provider_pool, "_pool", None)
+    if pool is not None and hasattr(pool, "aclose"):
+        await pool.aclose()
@@ -5,21 +5,19 @@ import time
 from fastapi import HTTPException
 
 from app import settings
-from app.ai.deepseek_client import DeepSeekClient
+from app.ai.inflight import shared_chat_json
 from app.ai.output_schemas import RewriteOut, SummaryOut
 from app.ai.prompt_registry import PROMPTS
 from app.ai.prompt_render import render_prompt
+from app.ai.provider_pool import ProviderPool, get_provider_pool
+from app.core.timing import span
 
 logger = logging.getLogger("ai.service")
 
 
-def _get_client() -> DeepSeekClient:
-    return DeepSeekClient(
-        api_key=settings.DEEPSEEK_API_KEY,
-        base_url=settings.DEEPSEEK_BASE_URL,
-        model=settings.DEEPSEEK_MODEL,
-        timeout_s=30.0,
-    )
+def _get_client() -> ProviderPool:
+    # provider 池与 DeepSeekClient 的 chat_json 同签名，按延迟/错误率自动选上游
+    return get_provider_pool()
 
 
 async def summarize(content: str, prompt_key: str = "summarize_v1") -> SummaryOut:
@@ -36,12 +34,14 @@ async def summarize(content: str, prompt_key: str = "summarize_v1") -> SummaryOu
     t0 = time.perf_counter()
 
     try:
-        data = await _get_client().chat_json(
+        data = await shared_chat_json(
+            _get_client(),
             prompt,
             max_tokens=600,
             temperature=0.2,
         )
-        out = SummaryOut.model_validate(data)
+        with span("validate"):
+            out = SummaryOut.model_validate(data)
         return out
     except Exception as e:
         # 这里不要把 prompt 全量写日志（可能包含敏感笔记）
@@ -75,12 +75,14 @@ async def rewrite(content: str, style: str, prompt_key: str = "rewrite_v1") -> R
     t0 = time.perf_counter()
 
     try:
-        data = await _get_client().chat_json(
+        data = await shared_chat_json(
+            _get_client(),
             prompt,
             max_tokens=1200,
             temperature=0.4,
         )
-        out = RewriteOut.model_validate(data)
+        with span("validate"):
+            out = RewriteOut.model_validate(data)
         return out
     except Exception as e:
         logger.warning(
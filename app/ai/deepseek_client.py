@@ -1,13 +1,32 @@
 # app/ai/deepseek_client.py
-import json
+import asyncio
 import logging
 import time
+import weakref
 from typing import Any, Optional
 
-import httpx
+from app.ai.json_repair import CLEAN, JsonRepairError, parse_model_json
+from app.core import timing
+from app.core.metrics import AI_JSON_PARSE, UPSTREAM_EMPTY, UPSTREAM_RETRIES, UPSTREAM_SECONDS
 
 logger = logging.getLogger("ai.deepseek")
 
+# 这些状态码换一个上游（或稍后再试）通常就能成功
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class UpstreamError(RuntimeError):
+    """
+    上游调用失败：
+    - retryable=True 表示换一个 provider 重试是有意义的（超时/限流/5xx/空 content）
+    - retryable=False 表示请求本身有问题（鉴权失败/参数错误），换谁都一样
+    """
+
+    def __init__(self, message: str, *, status_code: int | None = None, retryable: bool = False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+
 
 class DeepSeekClient:
     """
@@ -24,11 +43,74 @@ class DeepSeekClient:
         base_url: str = "https://api.siliconflow.cn/v1",
         model: str = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B",
         timeout_s: float = 30.0,
+        max_connections: int = 20,
+        keepalive_s: float = 30.0,
     ):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
         self.model = model
-        self.timeout = httpx.Timeout(timeout_s)
+        self.timeout_s = timeout_s
+        self.max_connections = max_connections
+        self.keepalive_s = keepalive_s
+        # 连接池按事件循环各一份：httpx 的连接绑定在创建它的 loop 上
+        # （服务的主 loop 和摘要后台线程的 loop 不能共用），loop 被回收时对应的条目自动消失
+        self._clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        """当前事件循环上的 httpx.AsyncClient：连接复用，不再每次调用都 DNS + TCP + TLS。"""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout_s,
+                limits=httpx.Limits(
+                    max_connections=None,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_s,
+                ),
+            )
+            self._clients[loop] = client
+        return client
+
+    def _headers(self) -> dict[str, str]:
+        # 文档示例使用 Bearer :contentReference[oaicite:6]{index=6}
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+    async def warm(self, connections: int) -> int:
+        """
+        预先建立 connections 个连接放进当前 loop 的连接池：
+        并发发 GET {base_url}/models（OpenAI 兼容接口都有，不花 token），并发请求各占一个连接，
+        响应读完后连接留在池子里。状态码不重要（401/404 也已经完成了 DNS、TCP、TLS），
+        返回成功建立连接的请求数
+        """
+        import httpx
+
+        client = self._client()
+
+        async def one() -> bool:
+            try:
+                await client.get(f"{self.base_url}/models", headers=self._headers())
+            except httpx.TransportError as e:
+                logger.warning("DeepSeek warm-up connection failed: %r", e)
+                return False
+            return True
+
+        results = await asyncio.gather(*[one() for _ in range(connections)])
+        return sum(results)
+
+    async def aclose(self) -> None:
+        """
+        关闭当前 loop 上的连接池：连接绑定在各自的 loop 上，只能在那个 loop 里关，
+        所以服务主 loop（lifespan 退出）和摘要后台线程的 loop（关闭之前）各调一次
+        """
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
     def _endpoint(self) -> str:
         # DeepSeek 文档：base_url 可以是 https://api.deepseek.com 或
@@ -50,15 +132,14 @@ class DeepSeekClient:
         - DeepSeek 文档要求：
         - response_format + prompt 中包含 'json' + 示例
         - 我们在 system_prompt 里明确写 'json'，模板里也有 JSON 示例
+
+        retry_on_empty：content 为空、或者输出本地修复不了时，最多再请求几次
+        （代码块/多余文字/截断这类小问题在本地修掉，不为它们再付一次生成的钱）
         """
         if not self.api_key:
-            raise RuntimeError("DEEPSEEK_API_KEY is not configured")
+            raise UpstreamError("DEEPSEEK_API_KEY is not configured")
 
-        # 文档示例使用 Bearer :contentReference[oaicite:6]{index=6}
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
+        headers = self._headers()
 
         payload = {
             "model": self.model,
@@ -76,31 +157,69 @@ class DeepSeekClient:
 
         url = self._endpoint()
 
+        # httpx 在第一次真正调用模型时才导入：只跑笔记的 worker 启动时不用付这笔导入开销
+        import httpx
+
+        retry_reason = ""
         for attempt in range(retry_on_empty + 1):
+            if attempt > 0:
+                UPSTREAM_RETRIES.inc(model=self.model, reason=retry_reason)
             t0 = time.perf_counter()
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                resp = await client.post(url, headers=headers, json=payload)
+            try:
+                resp = await self._client().post(url, headers=headers, json=payload)
+            except httpx.TransportError as e:
+                dt_ms = (time.perf_counter() - t0) * 1000
+                UPSTREAM_SECONDS.observe(dt_ms / 1000, model=self.model, outcome=type(e).__name__)
+                timing.add("upstream", dt_ms)
+                # 超时/连接失败：网络层问题，换一个上游可能就好了
+                raise UpstreamError(f"DeepSeek transport error: {e!r}", retryable=True) from e
             dt_ms = (time.perf_counter() - t0) * 1000
+            UPSTREAM_SECONDS.observe(dt_ms / 1000, model=self.model, outcome=str(resp.status_code))
+            timing.add("upstream", dt_ms)
 
             if resp.status_code >= 400:
                 # 不把全量响应返回给用户（安全），但日志里记录关键字段
                 logger.warning(
                     "DeepSeek HTTP %s (%.1fms): %s", resp.status_code, dt_ms, resp.text[:300]
                 )
-                raise RuntimeError(f"DeepSeek API error: HTTP {resp.status_code}")
+                raise UpstreamError(
+                    f"DeepSeek API error: HTTP {resp.status_code}",
+                    status_code=resp.status_code,
+                    retryable=resp.status_code in RETRYABLE_STATUS,
+                )
 
             data = resp.json()
-            content: Optional[str] = data.get("choices", [{}])[0].get("message", {}).get("content")
+            message = data.get("choices", [{}])[0].get("message", {})
+            content: Optional[str] = message.get("content")
+            # 部分推理模型 content 为空，JSON 放在 reasoning_content 里
+            reasoning: Optional[str] = message.get("reasoning_content")
 
             # 文档提示：JSON Output 偶尔可能返回空 content
             # 需要缓解/重试 :contentReference[oaicite:8]{index=8}
-            if content and content.strip():
-                # JSON mode 理论上保证是合法 JSON 字符串
-                # 但我们仍然 json.loads 一次做防线
-                return json.loads(content)
-
+            if (content and content.strip()) or reasoning:
+                try:
+                    out, how = parse_model_json(content, reasoning)
+                except JsonRepairError as e:
+                    AI_JSON_PARSE.inc(model=self.model, outcome="failed")
+                    logger.warning(
+                        "DeepSeek json not repairable (attempt %s/%s): %s",
+                        attempt + 1,
+                        retry_on_empty + 1,
+                        str(e)[:200],
+                    )
+                    if attempt == retry_on_empty:
+                        raise
+                    retry_reason = "invalid_json"
+                    continue
+                AI_JSON_PARSE.inc(model=self.model, outcome=how)
+                if how != CLEAN:
+                    logger.info("DeepSeek json repaired locally: %s", how)
+                return out
+
+            UPSTREAM_EMPTY.inc(model=self.model)
+            retry_reason = "empty"
             logger.warning(
                 "DeepSeek returned empty content (attempt %s/%s)", attempt + 1, retry_on_empty + 1
             )
 
-        raise RuntimeError("DeepSeek returned empty content")
+        raise UpstreamError("DeepSeek returned empty content", retryable=True)
@@ -0,0 +1,140 @@
+# app/ai/inflight.py
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, TypeVar
+
+from fastapi import HTTPException, Request
+
+from app.ai.scheduler import current_request_class, get_scheduler
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger("ai.inflight")
+
+"""
+    客户端断开时取消上游调用：
+    - 路由用 cancel_on_disconnect() 包住业务协程，同时监听 http.disconnect
+      用户关掉页面 -> 取消业务协程 -> 取消正在进行的 httpx 请求（以及后续的重试）
+    - 上游调用经过 SingleFlight：相同 prompt 的并发请求共享同一次调用（引用计数）
+      一个等待者走了只是引用计数减一；最后一个等待者也走了，才真正取消上游调用
+"""
+
+T = TypeVar("T")
+
+CLIENT_DISCONNECTS = REGISTRY.counter(
+    "ai_client_disconnects_total",
+    "AI requests abandoned by the client before completion",
+    ("route",),
+)
+UPSTREAM_CANCELLED = REGISTRY.counter(
+    "ai_upstream_cancelled_total", "Upstream model calls cancelled because no caller was waiting"
+)
+INFLIGHT_SHARED = REGISTRY.counter(
+    "ai_inflight_shared_total", "Callers that joined an identical upstream call already in flight"
+)
+
+# nginx 的约定：客户端在响应之前关闭了连接（响应不会被任何人读到，主要给日志/指标看）
+CLIENT_CLOSED_REQUEST = 499
+
+
+@dataclass
+class _Call:
+    task: asyncio.Future
+    waiters: int = 0
+
+
+class SingleFlight:
+    """同一个 key 同时只有一次真正的调用；其余调用方等同一个结果。"""
+
+    def __init__(self):
+        self._calls: dict[str, _Call] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def run(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        # 任务绑定在创建它的事件循环上：后台线程（有自己的循环）不能加入请求循环里的调用
+        key = f"{id(asyncio.get_running_loop())}:{key}"
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            INFLIGHT_SHARED.inc()
+
+        call.waiters += 1
+        try:
+            # shield：某个等待者被取消时，不连带取消共享的任务
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 没有人在等了：取消上游调用（连同还没开始的重试），新的调用方不会再加入它
+                self._forget(key, call)
+                call.task.cancel()
+                UPSTREAM_CANCELLED.inc()
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+inflight = SingleFlight()
+
+
+def call_key(prompt: str, **kwargs: Any) -> str:
+    """prompt + 调用参数（max_tokens/temperature...）完全相同的调用才共享。"""
+    raw = json.dumps([prompt, kwargs], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def shared_chat_json(client: Any, prompt: str, **kwargs: Any) -> dict[str, Any]:
+    """
+    client.chat_json 的单飞 + 调度版本：ai_service / tool_select 调上游都走这里
+    - 共享的调用只占一个调度名额
+    - 优先级不同的调用不共享：交互请求不该排在批量请求的队里
+    """
+    rc = current_request_class()
+
+    async def call() -> dict[str, Any]:
+        async with get_scheduler().slot(rc):
+            return await client.chat_json(prompt, **kwargs)
+
+    return await inflight.run(call_key(prompt, priority=rc.priority, **kwargs), call)
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # 请求体已经被 FastAPI 读完，之后的 receive() 会一直挂起，直到连接断开（或响应发完）
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, coro: Awaitable[T], *, route: str) -> T:
+    """
+    运行 coro；客户端先断开就取消它：
+    return await cancel_on_disconnect(request, rewrite(...), route="rewrite")
+    """
+    work = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if work.done():
+        return work.result()
+
+    work.cancel()
+    # 等取消真正落地：httpx 连接关闭、SingleFlight 的引用计数减一
+    await asyncio.gather(work, return_exceptions=True)
+    CLIENT_DISCONNECTS.inc(route=route)
+    logger.info("client disconnected, cancelled /ai/%s", route)
+    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
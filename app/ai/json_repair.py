@@ -0,0 +1,196 @@
+# app/ai/json_repair.py
+import itertools
+import json
+import re
+from typing import Any, Iterator, Optional
+
+"""
+    模型 JSON 输出的本地修复（不花钱）：
+    - 绝大多数输出本来就是合法 JSON：先直接 json.loads，成功就返回，不做任何额外处理
+    - 常见的小毛病在本地修掉：```json 代码块、前后夹杂说明文字、<think> 推理块、
+      max_tokens 截断导致的括号/引号没闭合
+    - content 为空但 reasoning_content 里带了 JSON（部分推理模型会这样）时，从推理内容里取
+    - 全都修不好才抛 JsonRepairError，由调用方决定要不要重新请求一次（那才是真的要付费）
+"""
+
+# 返回给调用方的修复方式，也是 ai_json_parse_total 的 outcome 标签
+CLEAN = "clean"
+FENCED = "fenced"
+EXTRACTED = "extracted"
+TRUNCATED = "truncated"
+REASONING = "reasoning"
+
+_THINK_RE = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
+# 在夹杂文字里找 JSON 时，最多尝试这么多个 { 起点（防止超长文本退化成 O(n^2)）
+_MAX_SCAN_STARTS = 20
+
+_decoder = json.JSONDecoder()
+
+
+class JsonRepairError(ValueError):
+    """本地修复失败：输出里找不到可用的 JSON 对象。"""
+
+
+def strip_code_fence(s: str) -> str:
+    s = s.strip()
+    if s.startswith("```"):
+        # 去掉第一行 ```json / ``` 等
+        parts = s.split("\n", 1)
+        s = parts[1] if len(parts) > 1 else ""
+        # 去掉末尾 ```
+        if s.strip().endswith("```"):
+            s = s.strip()[:-3]
+    return s.strip()
+
+
+def extract_json_text(s: str) -> str:
+    """
+    兜底：如果模型没严格输出 JSON（比如前后夹杂文字），
+    尝试截取第一个 { 到最后一个 } 之间的内容。
+    """
+    s = strip_code_fence(s)
+    if not s:
+        return s
+    if s.lstrip().startswith("{") and s.rstrip().endswith("}"):
+        return s
+    la = s.find("{")
+    ra = s.rfind("}")
+    if la != -1 and ra != -1 and ra > la:
+        return s[la : ra + 1]
+    return s
+
+
+def _loads_object(s: str) -> Optional[dict[str, Any]]:
+    try:
+        data = json.loads(s)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _top_level_starts(s: str) -> Iterator[int]:
+    """
+    顶层 { 的位置：不在任何未闭合的 { 里，也不在对象内部的字符串里。
+    被截断的外层对象里那些完整的内层对象（比如 "meta": {...}）不算起点，
+    否则会被当成修复成功的结果返回；对象外面的引号当普通文字，不跟踪
+    """
+    depth = 0
+    in_str = esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == "{":
+            if depth == 0:
+                yield i
+            depth += 1
+        elif ch == "}":
+            depth = max(depth - 1, 0)
+        elif ch == '"' and depth:
+            in_str = True
+
+
+def _scan_object(s: str, *, last: bool = False) -> Optional[dict[str, Any]]:
+    """从每个顶层 { 起点 raw_decode，返回第一个（last=True 时最后一个）完整的 JSON 对象。"""
+    found = None
+    for i in itertools.islice(_top_level_starts(s), _MAX_SCAN_STARTS):
+        try:
+            data, _ = _decoder.raw_decode(s, i)
+        except ValueError:
+            continue
+        if not last:
+            return data
+        found = data
+    return found
+
+
+def close_truncated(s: str) -> Optional[dict[str, Any]]:
+    """
+    补全被截断的 JSON（通常是 max_tokens 不够）：
+    - 扫一遍记下未闭合的 { [ 和字符串，先原样补上引号和括号试一次
+    - 不行（比如断在 "key": 后面）就退回到最近的逗号处再补，最多退 3 次
+    """
+    start = s.find("{")
+    if start == -1:
+        return None
+    s = s[start:]
+    stack: list[str] = []
+    cuts: list[tuple[int, tuple[str, ...]]] = []
+    in_str = esc = False
+    for i, ch in enumerate(s):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack:
+                return None
+            stack.pop()
+        elif ch == ",":
+            cuts.append((i, tuple(stack)))
+    if not stack and not in_str:
+        return None  # 括号是配平的，不是截断问题
+
+    def closers(opened) -> str:
+        return "".join("}" if c == "{" else "]" for c in reversed(opened))
+
+    head = s[:-1] if esc else s
+    candidates = [head + ('"' if in_str else "") + closers(stack)]
+    candidates += [s[:i] + closers(opened) for i, opened in reversed(cuts[-3:])]
+    for candidate in candidates:
+        data = _loads_object(candidate)
+        if data is not None:
+            return data
+    return None
+
+
+def _repair_text(text: str) -> tuple[Optional[dict[str, Any]], str]:
+    s = _THINK_RE.sub("", text).strip()
+    fenced = strip_code_fence(s)
+    if fenced != s:
+        data = _loads_object(fenced)
+        if data is not None:
+            return data, FENCED
+    data = _loads_object(extract_json_text(s)) or _scan_object(fenced)
+    if data is not None:
+        return data, EXTRACTED
+    data = close_truncated(fenced)
+    if data is not None:
+        return data, TRUNCATED
+    return None, ""
+
+
+def parse_model_json(
+    content: Optional[str], reasoning: Optional[str] = None
+) -> tuple[dict[str, Any], str]:
+    """
+    把模型返回解析成 dict，返回 (数据, 修复方式)。
+    修复方式是 clean / fenced / extracted / truncated / reasoning 之一；修不好抛 JsonRepairError。
+    """
+    if content:
+        # 快路径：合法 JSON 直接返回，和原来的 json.loads 一样快
+        data = _loads_object(content)
+        if data is not None:
+            return data, CLEAN
+        data, how = _repair_text(content)
+        if data is not None:
+            return data, how
+    if reasoning:
+        # 推理内容里往往先有草稿再有定稿：取最后一个完整的 JSON 对象
+        data = _scan_object(strip_code_fence(_THINK_RE.sub("", reasoning)), last=True)
+        if data is not None:
+            return data, REASONING
+    preview = (content or reasoning or "")[:80]
+    raise JsonRepairError(f"model output is not repairable json: {preview!r}")
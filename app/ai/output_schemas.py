@@ -1,3 +1,5 @@
+from typing import Any, Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -20,3 +22,9 @@ class QAOut(BaseModel):
     citations: list[str] = Field(
         default_factory=list, description="References (ids/urls/notes) if any"
     )
+
+
+# ToolSelect：工具名+参数（tool_select_v1 的输出合同）
+class ToolSelectOut(BaseModel):
+    tool_name: Literal["search_notes", "create_note", "update_note"]
+    args: dict[str, Any] = Field(default_factory=dict, description="Arguments for the tool")
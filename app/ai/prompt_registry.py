@@ -22,3 +22,7 @@ PROMPTS = {
 PROMPTS["summarize_v1b"] = PromptSpec(
     name="summarize", version="v1b", path="app/prompts/summarize_v1b.txt"
 )
+# v2：v1 的 args schema 花括号没有转义，str.format 渲染会报错；内容不变
+PROMPTS["tool_select_v2"] = PromptSpec(
+    name="tool_select", version="v2", path="app/prompts/tool_select_v2.txt"
+)
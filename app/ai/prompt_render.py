@@ -1,6 +1,7 @@
 from pathlib import Path
 
 from app.ai.prompt_registry import PROMPTS
+from app.core.timing import span
 
 
 def load_prompt(prompt_key: str) -> str:
@@ -9,12 +10,13 @@ def load_prompt(prompt_key: str) -> str:
 
 
 def render_prompt(prompt_key: str, **kwargs) -> str:
-    template = load_prompt(prompt_key)
-    try:
-        return template.format(**kwargs)
-    except KeyError as e:
-        missing = e.args[0]
-        raise ValueError(
-            f"Missing placeholder '{missing}' when rendering prompt '{prompt_key}'. "
-            f"Provided keys: {sorted(kwargs.keys())}"
-        ) from e
+    with span("prompt"):
+        template = load_prompt(prompt_key)
+        try:
+            return template.format(**kwargs)
+        except KeyError as e:
+            missing = e.args[0]
+            raise ValueError(
+                f"Missing placeholder '{missing}' when rendering prompt '{prompt_key}'. "
+                f"Provided keys: {sorted(kwargs.keys())}"
+            ) from e
@@ -0,0 +1,245 @@
+# app/ai/provider_pool.py
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Optional
+
+from app import settings
+from app.ai.deepseek_client import DeepSeekClient, UpstreamError
+from app.ai.json_repair import JsonRepairError
+
+logger = logging.getLogger("ai.pool")
+
+# EWMA 平滑系数：越大越“看重最近一次”
+EWMA_ALPHA = 0.3
+# 错误率惩罚：错误率 50% 的 provider，分数放大到 1 + 4 * 0.5 = 3 倍
+ERROR_PENALTY = 4.0
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    name: str
+    base_url: str
+    model: str
+    api_key: Optional[str] = None
+    weight: float = 1.0
+
+
+@dataclass
+class ProviderStats:
+    requests: int = 0
+    errors: int = 0
+    failovers: int = 0
+    in_flight: int = 0
+    ewma_latency_ms: Optional[float] = None
+    ewma_error_rate: float = 0.0
+    last_error: Optional[str] = None
+
+
+class ProviderPool:
+    """
+    多个 OpenAI 兼容上游组成的池子：
+    - 每次请求按 “EWMA 延迟 × 错误率惩罚 / 权重” 打分，分数越低越容易被选中
+    - 首选按 1/score 加权随机（慢的 provider 仍会偶尔被探测，EWMA 才能恢复）
+    - 可重试的错误（超时/429/5xx/空 content）自动切到下一个 provider
+    - 不可重试的错误（如 400）直接抛出，换谁都一样
+    """
+
+    def __init__(
+        self,
+        specs: list[ProviderSpec],
+        *,
+        timeout_s: float = 30.0,
+        client_factory: Callable[[ProviderSpec, float], Any] | None = None,
+        rng: random.Random | None = None,
+    ):
+        if not specs:
+            raise ValueError("ProviderPool needs at least one provider")
+        self.specs = {s.name: s for s in specs}
+        self.stats = {s.name: ProviderStats() for s in specs}
+        self._rng = rng or random.Random()
+        factory = client_factory or _default_client_factory
+        self._clients = {s.name: factory(s, timeout_s) for s in specs}
+
+    def score(self, name: str) -> float:
+        st = self.stats[name]
+        latency = st.ewma_latency_ms
+        if latency is None:
+            # 还没测过的 provider：按当前最好的延迟算，让它有公平的机会被探测
+            observed = [s.ewma_latency_ms for s in self.stats.values() if s.ewma_latency_ms]
+            latency = min(observed) if observed else 1.0
+        weight = max(self.specs[name].weight, 1e-6)
+        return max(latency, 1e-3) * (1 + ERROR_PENALTY * st.ewma_error_rate) / weight
+
+    def order(self) -> list[str]:
+        """本次请求的尝试顺序：第一个按 1/score 加权随机，其余按分数从低到高兜底。"""
+        scores = {name: self.score(name) for name in self.specs}
+        names = list(scores)
+        first = self._rng.choices(names, weights=[1 / scores[n] for n in names])[0]
+        rest = sorted((n for n in names if n != first), key=lambda n: scores[n])
+        return [first, *rest]
+
+    def _observe_latency(self, name: str, dt_ms: float) -> None:
+        st = self.stats[name]
+        if st.ewma_latency_ms is None:
+            st.ewma_latency_ms = dt_ms
+        else:
+            st.ewma_latency_ms = EWMA_ALPHA * dt_ms + (1 - EWMA_ALPHA) * st.ewma_latency_ms
+
+    def _record(self, name: str, dt_ms: float, err: Optional[Exception]) -> None:
+        st = self.stats[name]
+        st.requests += 1
+        self._observe_latency(name, dt_ms)
+        failed = 1.0 if err is not None else 0.0
+        st.ewma_error_rate = EWMA_ALPHA * failed + (1 - EWMA_ALPHA) * st.ewma_error_rate
+        if err is not None:
+            st.errors += 1
+            st.last_error = str(err)[:200]
+
+    async def chat_json(self, user_prompt: str, **kwargs) -> dict[str, Any]:
+        """与 DeepSeekClient.chat_json 同签名，调用方无感知地换成 provider 池。"""
+        last_err: Optional[Exception] = None
+        for name in self.order():
+            if last_err is not None:
+                self.stats[name].failovers += 1
+            st = self.stats[name]
+            st.in_flight += 1
+            t0 = time.perf_counter()
+            try:
+                data = await self._clients[name].chat_json(user_prompt, **kwargs)
+            except UpstreamError as e:
+                self._record(name, (time.perf_counter() - t0) * 1000, e)
+                if not e.retryable:
+                    raise
+                logger.warning("provider %s failed, trying next: %s", name, str(e)[:200])
+                last_err = e
+                continue
+            except Exception as e:
+                # 例如模型输出不是合法 JSON：不是上游故障，不切换
+                self._record(name, (time.perf_counter() - t0) * 1000, e)
+                raise
+            finally:
+                st.in_flight -= 1
+            self._record(name, (time.perf_counter() - t0) * 1000, None)
+            return data
+
+        raise UpstreamError(f"All providers failed: {last_err}", retryable=True)
+
+    async def warm(self, connections: int, *, prompt: Optional[str] = None) -> dict[str, Any]:
+        """
+        启动预热：每个 provider 预先建立 connections 个连接；
+        给了 prompt 就再对每个 provider 发一次很小的请求，走一遍上游的冷路径，
+        耗时记进 EWMA，第一批真实请求选 provider 时已经有延迟数据。
+        预热请求只记延迟、不计请求数和错误率：推理模型在很小的 max_tokens 下经常返回空/截断的 JSON，
+        这不代表上游有问题，不能每次上线都给所有 provider 记一笔错误
+        """
+
+        async def one(name: str) -> dict[str, Any]:
+            client = self._clients[name]
+            out: dict[str, Any] = {"connections": await client.warm(connections)}
+            if prompt is not None:
+                t0 = time.perf_counter()
+                err: Optional[Exception] = None
+                try:
+                    await client.chat_json(prompt, max_tokens=20, retry_on_empty=0)
+                except Exception as e:
+                    err = e
+                dt_ms = (time.perf_counter() - t0) * 1000
+                # 上游真的生成了内容（哪怕是空的/截断的 JSON）才算一次延迟样本；
+                # HTTP 错误、连不上这类秒回的失败会让 provider 看起来很快，不记
+                if err is None or _generated(err):
+                    self._observe_latency(name, dt_ms)
+                out["prompt_ms"] = round(dt_ms, 1)
+                out["prompt_ok"] = err is None
+                if err is not None:
+                    out["prompt_error"] = str(err)[:200]
+            return out
+
+        names = list(self._clients)
+        results = await asyncio.gather(*[one(n) for n in names])
+        return dict(zip(names, results))
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": name,
+                "model": spec.model,
+                "base_url": spec.base_url,
+                "weight": spec.weight,
+                "score": round(self.score(name), 3),
+                **asdict(self.stats[name]),
+            }
+            for name, spec in self.specs.items()
+        ]
+
+
+def _generated(err: Exception) -> bool:
+    # 空 content（UpstreamError 没有状态码、也不是网络异常引起的）或本地修复不了的 JSON
+    if isinstance(err, JsonRepairError):
+        return True
+    return isinstance(err, UpstreamError) and err.status_code is None and err.__cause__ is None
+
+
+def _default_client_factory(spec: ProviderSpec, timeout_s: float) -> DeepSeekClient:
+    return DeepSeekClient(
+        api_key=spec.api_key,
+        base_url=spec.base_url,
+        model=spec.model,
+        timeout_s=timeout_s,
+        # 池子至少能装下预热的连接，也能装下同时在跑的上游调用
+        max_connections=max(settings.AI_MAX_CONCURRENCY, settings.WARMUP_CONNECTIONS),
+        keepalive_s=settings.AI_KEEPALIVE_S,
+    )
+
+
+def load_provider_specs(raw: str | None = None) -> list[ProviderSpec]:
+    """
+    解析 settings.AI_PROVIDERS（JSON 数组）：
+    - api_key 可以直接写，也可以用 api_key_env 指向另一个环境变量（推荐，避免明文）
+    - 都没写时回退到 DEEPSEEK_API_KEY
+    """
+    raw = settings.AI_PROVIDERS if raw is None else raw
+    if not raw.strip():
+        return [
+            ProviderSpec(
+                name="default",
+                base_url=settings.DEEPSEEK_BASE_URL,
+                model=settings.DEEPSEEK_MODEL,
+                api_key=settings.DEEPSEEK_API_KEY,
+            )
+        ]
+
+    specs = []
+    for i, item in enumerate(json.loads(raw)):
+        api_key = item.get("api_key")
+        if not api_key and item.get("api_key_env"):
+            api_key = os.getenv(item["api_key_env"])
+        specs.append(
+            ProviderSpec(
+                name=item.get("name") or f"p{i}",
+                base_url=item.get("base_url") or settings.DEEPSEEK_BASE_URL,
+                model=item.get("model") or settings.DEEPSEEK_MODEL,
+                api_key=api_key or settings.DEEPSEEK_API_KEY,
+                weight=float(item.get("weight", 1.0)),
+            )
+        )
+    return specs
+
+
+_pool: ProviderPool | None = None
+
+
+def get_provider_pool() -> ProviderPool:
+    # 进程内单例：统计信息（EWMA）需要跨请求累积
+    global _pool
+    if _pool is None:
+        _pool = ProviderPool(load_provider_specs(), timeout_s=settings.AI_TIMEOUT_S)
+    return _pool
@@ -0,0 +1,182 @@
+# app/ai/scheduler.py
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from app import settings
+from app.core import timing
+from app.core.metrics import REGISTRY
+
+"""
+    上游模型并发的加权公平调度（所有上游调用共用一个池子）：
+    - 同时在跑的上游调用最多 capacity 个；batch 最多占 capacity - reserve 个，
+      剩下的 reserve 个只给 interactive，批量任务再多也挤不掉交互请求
+    - 有空位时 interactive 先于 batch
+    - 同一类里按调用方（API key）做加权公平排队（WFQ）：
+      每个请求的虚拟完成时间 = max(类的虚拟时钟, 该调用方上一个请求的完成时间) + 1/weight
+      按它从小到大放行，一个调用方一次塞 1000 个请求，也只是排在自己的队尾
+    - 请求来自不同的事件循环（请求循环 / 摘要后台线程），所以状态用线程锁保护，
+      唤醒用 loop.call_soon_threadsafe
+"""
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "ai_scheduler_queue_wait_seconds",
+    "Time an upstream call waited for a scheduler slot",
+    ("priority",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+@dataclass(frozen=True)
+class RequestClass:
+    caller: str = "anonymous"
+    priority: str = INTERACTIVE
+    weight: float = 1.0
+
+
+_request_class: ContextVar[RequestClass] = ContextVar("ai_request_class", default=RequestClass())
+
+
+def set_request_class(caller: str, priority: str = INTERACTIVE, weight: float = 1.0) -> None:
+    """路由依赖 / 后台任务里调用：之后这个上下文里的上游调用按它排队。"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown priority: {priority}")
+    _request_class.set(RequestClass(caller, priority, weight))
+
+
+def current_request_class() -> RequestClass:
+    return _request_class.get()
+
+
+@dataclass(order=True)
+class _Waiter:
+    tag: float
+    seq: int
+    priority: str = field(compare=False)
+    loop: asyncio.AbstractEventLoop = field(compare=False)
+    fut: asyncio.Future = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+def _wake(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(None)
+
+
+class FairScheduler:
+    def __init__(self, capacity: int, interactive_reserve: int = 0):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = capacity
+        self.reserve = min(max(interactive_reserve, 0), capacity - 1)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._running = {p: 0 for p in PRIORITIES}
+        self._queues: dict[str, list[_Waiter]] = {p: [] for p in PRIORITIES}
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self._vtime = {p: 0.0 for p in PRIORITIES}
+        self._finish: dict[tuple[str, str], float] = {}
+
+    def _can_run(self, priority: str) -> bool:
+        if sum(self._running.values()) >= self.capacity:
+            return False
+        if priority == BATCH:
+            return self._running[BATCH] < self.capacity - self.reserve
+        return True
+
+    def _dispatch(self) -> None:
+        """在锁内调用：按 interactive -> batch 的顺序把能放行的等待者都放行。"""
+        progressed = True
+        while progressed:
+            progressed = False
+            for priority in PRIORITIES:
+                q = self._queues[priority]
+                while q and q[0].cancelled:
+                    heapq.heappop(q)
+                if q and self._can_run(priority):
+                    w = heapq.heappop(q)
+                    self._waiting[priority] -= 1
+                    self._vtime[priority] = max(self._vtime[priority], w.tag)
+                    self._running[priority] += 1
+                    w.granted = True
+                    w.loop.call_soon_threadsafe(_wake, w.fut)
+                    progressed = True
+                    break
+
+    async def acquire(self, rc: RequestClass) -> float:
+        """拿到一个上游名额，返回排队等待的秒数。"""
+        t0 = time.perf_counter()
+        with self._lock:
+            if not self._queues[rc.priority] and self._can_run(rc.priority):
+                self._running[rc.priority] += 1
+                return 0.0
+            key = (rc.priority, rc.caller)
+            start = max(self._vtime[rc.priority], self._finish.get(key, 0.0))
+            tag = start + 1 / max(rc.weight, 1e-6)
+            self._finish[key] = tag
+            loop = asyncio.get_running_loop()
+            waiter = _Waiter(tag, next(self._seq), rc.priority, loop, loop.create_future())
+            heapq.heappush(self._queues[rc.priority], waiter)
+            self._waiting[rc.priority] += 1
+            # 队列里可能只剩已取消的等待者：顺手放行一次，别让空位闲着
+            self._dispatch()
+
+        try:
+            await waiter.fut
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    # 名额已经分给我了但我不要了：还回去，让下一个人用
+                    self._running[rc.priority] -= 1
+                    self._dispatch()
+                else:
+                    waiter.cancelled = True
+                    self._waiting[rc.priority] -= 1
+            raise
+        return time.perf_counter() - t0
+
+    def release(self, priority: str) -> None:
+        with self._lock:
+            self._running[priority] -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, rc: Optional[RequestClass] = None) -> AsyncIterator[None]:
+        rc = rc or current_request_class()
+        waited = await self.acquire(rc)
+        QUEUE_WAIT_SECONDS.observe(waited, priority=rc.priority)
+        timing.add("queue", waited * 1000)
+        try:
+            yield
+        finally:
+            self.release(rc.priority)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "interactive_reserve": self.reserve,
+                "running": dict(self._running),
+                "waiting": dict(self._waiting),
+            }
+
+
+_scheduler: FairScheduler | None = None
+
+
+def get_scheduler() -> FairScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = FairScheduler(settings.AI_MAX_CONCURRENCY, settings.AI_INTERACTIVE_RESERVE)
+    return _scheduler
@@ -0,0 +1,266 @@
+# app/ai/tool_select.py
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from fastapi import HTTPException
+
+from app.ai.inflight import shared_chat_json
+from app.ai.output_schemas import ToolSelectOut
+from app.ai.prompt_render import render_prompt
+from app.ai.provider_pool import get_provider_pool
+
+logger = logging.getLogger("ai.tool_select")
+
+"""
+    工具选择分两级：
+    1) 本地快速路径：规则（正则）+ TF-IDF 相似度（和带标签的样例比），微秒级
+    2) 只有本地“不确定”时才调用 tool_select 模板走一次模型
+"""
+
+# 带标签的样例：新增路由场景时优先往这里加样例，而不是改 prompt
+LABELED_EXAMPLES: list[tuple[str, str]] = [
+    ("搜索关于 FastAPI 的笔记", "search_notes"),
+    ("帮我找一下上周写的会议记录", "search_notes"),
+    ("有没有提到 alembic 迁移的笔记", "search_notes"),
+    ("查一下我记过的读书笔记", "search_notes"),
+    ("之前关于依赖注入的内容在哪里", "search_notes"),
+    ("部署相关的笔记在哪里", "search_notes"),
+    ("find my notes about docker", "search_notes"),
+    ("search notes for sqlite performance", "search_notes"),
+    ("what did I write about pagination", "search_notes"),
+    ("新建一条笔记：明天下午三点开会", "create_note"),
+    ("记一下：周五前提交周报", "create_note"),
+    ("帮我记录今天学习了 pydantic 校验", "create_note"),
+    ("写一条笔记，内容是买牛奶和鸡蛋", "create_note"),
+    ("添加笔记 项目复盘要点", "create_note"),
+    ("create a note: call the dentist tomorrow", "create_note"),
+    ("add a new note about the release checklist", "create_note"),
+    ("remember that the api key rotates monthly", "create_note"),
+    ("把第 3 条笔记的内容改成：会议改到周四", "update_note"),
+    ("修改笔记 12 的标题为 周计划", "update_note"),
+    ("更新 id 为 7 的笔记，内容补充测试结论", "update_note"),
+    ("编辑 5 号笔记，把标题改成 读书清单", "update_note"),
+    ("update note 4 content to buy more coffee", "update_note"),
+    ("change the title of note #9 to weekly plan", "update_note"),
+    ("edit note 2 and set content to done", "update_note"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+_NOTE_ID_RE = re.compile(
+    r"(?:#|\bid\s*(?:为|是|=|:|：)?\s*|第\s*|编号\s*|\bnote\s+#?|笔记\s*)(\d+)|(\d+)\s*号", re.I
+)
+_UPDATE_VERB_RE = re.compile(r"修改|更新|编辑|改成|改为|\bupdate\b|\bedit\b|\bchange\b", re.I)
+_NEW_TITLE_RE = re.compile(
+    r"(?:标题|title)(?:\s+of\s+note\s*#?\d+)?\s*(?:改成|改为|换成|为|to|:|：)\s*"
+    r"(.+?)(?:[,，;；。]|\band\b|$)",
+    re.I,
+)
+_NEW_CONTENT_RE = re.compile(
+    r"(?:内容|content)\s*(?:改成|改为|换成|为|to|:|：)\s*[:：]?\s*(.+)$", re.I
+)
+_CREATE_RE = re.compile(
+    r"^(?:请)?(?:帮我)?(?:新建|创建|添加|记录|记一下|写)(?:一[条个篇])?(?:笔记)?[,，]?\s*"
+    r"(?:内容是)?[:：]?\s*(?P<zh>.+)$"
+    r"|^(?:please\s+)?(?:create|add|write)\s+(?:a\s+)?(?:new\s+)?note\s*(?:about|:)?\s*(?P<en>.+)$",
+    re.I,
+)
+_SEARCH_RE = re.compile(
+    r"^(?:请)?(?:帮我)?(?:搜索|搜一下|查找|查一下|找一下|找找|查询)\s*(?:关于)?\s*(?P<zh>.+?)"
+    r"(?:的笔记|的内容)?$"
+    r"|^(?:please\s+)?(?:search|find|look\s+up)\s+(?:my\s+)?(?:notes?\s+)?(?:about|for)?\s*"
+    r"(?P<en>.+)$",
+    re.I,
+)
+
+
+def _tokens(text: str) -> list[str]:
+    # 英文按单词；中文没有空格，用字符 bigram（单字就保留单字）
+    out: list[str] = []
+    for chunk in _TOKEN_RE.findall(text.lower()):
+        if "\u4e00" <= chunk[0] <= "\u9fff" and len(chunk) > 1:
+            out.extend(chunk[i : i + 2] for i in range(len(chunk) - 1))
+        else:
+            out.append(chunk)
+    return out
+
+
+def _title_from(text: str) -> str:
+    first = re.split(r"[\n。.!！?？,，;；]", text.strip(), maxsplit=1)[0]
+    return first[:20] or text[:20]
+
+
+def _note_id(text: str) -> Optional[int]:
+    m = _NOTE_ID_RE.search(text)
+    if not m:
+        return None
+    return int(m.group(1) or m.group(2))
+
+
+def _update_args(text: str) -> Optional[dict[str, Any]]:
+    # update 必须能拿到 note_id 和至少一个新值，否则交给模型
+    note_id = _note_id(text)
+    title = _NEW_TITLE_RE.search(text)
+    content = _NEW_CONTENT_RE.search(text)
+    if note_id is None or not (title or content):
+        return None
+    return {
+        "note_id": note_id,
+        "title": title.group(1).strip() if title else None,
+        "content": content.group(1).strip() if content else None,
+    }
+
+
+@dataclass
+class ToolDecision:
+    out: ToolSelectOut
+    source: str  # rules / tfidf / llm
+    confidence: float
+
+
+@dataclass
+class ToolSelectStats:
+    total: int = 0
+    by_source: Counter = field(default_factory=Counter)
+
+    def snapshot(self) -> dict[str, Any]:
+        fast = self.by_source["rules"] + self.by_source["tfidf"]
+        return {
+            "total": self.total,
+            "by_source": dict(self.by_source),
+            "fast_path_rate": fast / self.total if self.total else 0.0,
+        }
+
+
+class TfidfIndex:
+    def __init__(self, examples: list[tuple[str, str]]):
+        docs = [Counter(_tokens(text)) for text, _ in examples]
+        df = Counter(tok for d in docs for tok in d)
+        n = len(docs)
+        # 平滑 idf：没见过的词权重最高，但它在样例里也匹配不上，不影响相似度
+        self.idf = {tok: math.log((1 + n) / (1 + c)) + 1 for tok, c in df.items()}
+        self.labels = [label for _, label in examples]
+        self.vectors = [self._vector(d) for d in docs]
+
+    def _vector(self, tf: Counter) -> dict[str, float]:
+        vec = {tok: c * self.idf.get(tok, 0.0) for tok, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {tok: v / norm for tok, v in vec.items() if v}
+
+    def best_by_label(self, text: str) -> list[tuple[str, float]]:
+        """每个标签取最相似样例的 cosine，按相似度从高到低。"""
+        q = self._vector(Counter(_tokens(text)))
+        best: dict[str, float] = {}
+        for label, vec in zip(self.labels, self.vectors):
+            sim = sum(w * vec.get(tok, 0.0) for tok, w in q.items())
+            best[label] = max(best.get(label, 0.0), sim)
+        return sorted(best.items(), key=lambda kv: kv[1], reverse=True)
+
+
+class ToolSelector:
+    """
+    - rule_threshold：规则命中的置信度达到它才直接返回
+    - tfidf_threshold / tfidf_margin：最相似标签的 cosine 要够高，且要明显领先第二名
+    """
+
+    def __init__(
+        self,
+        examples: list[tuple[str, str]] | None = None,
+        *,
+        rule_threshold: float = 0.8,
+        tfidf_threshold: float = 0.35,
+        tfidf_margin: float = 0.1,
+        prompt_key: str = "tool_select_v2",
+    ):
+        self.index = TfidfIndex(examples or LABELED_EXAMPLES)
+        self.rule_threshold = rule_threshold
+        self.tfidf_threshold = tfidf_threshold
+        self.tfidf_margin = tfidf_margin
+        self.prompt_key = prompt_key
+        self.stats = ToolSelectStats()
+
+    def _by_rules(self, text: str) -> Optional[ToolDecision]:
+        if _UPDATE_VERB_RE.search(text):
+            args = _update_args(text)
+            if args is not None:
+                out = ToolSelectOut(tool_name="update_note", args=args)
+                return ToolDecision(out, "rules", 0.95)
+            # 明显是“改”，但缺 id 或新值：不能让 create/search 规则抢走
+            return None
+
+        m = _CREATE_RE.match(text)
+        if m:
+            body = (m.group("zh") or m.group("en") or "").strip()
+            if body:
+                args = {"title": _title_from(body), "content": body}
+                return ToolDecision(ToolSelectOut(tool_name="create_note", args=args), "rules", 0.9)
+
+        m = _SEARCH_RE.match(text)
+        if m:
+            query = (m.group("zh") or m.group("en") or "").strip()
+            if query:
+                out = ToolSelectOut(tool_name="search_notes", args={"query": query})
+                return ToolDecision(out, "rules", 0.9)
+        return None
+
+    def _by_tfidf(self, text: str) -> Optional[ToolDecision]:
+        ranked = self.index.best_by_label(text)
+        if not ranked:
+            return None
+        label, sim = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if sim < self.tfidf_threshold or sim - runner_up < self.tfidf_margin:
+            return None
+
+        if label == "search_notes":
+            args: Optional[dict[str, Any]] = {"query": text}
+        elif label == "create_note":
+            args = {"title": _title_from(text), "content": text}
+        else:
+            args = _update_args(text)
+        if args is None:
+            return None
+        return ToolDecision(ToolSelectOut(tool_name=label, args=args), "tfidf", round(sim, 3))
+
+    def classify_local(self, text: str) -> Optional[ToolDecision]:
+        """只跑本地快速路径；不确定时返回 None。"""
+        text = text.strip()
+        decision = self._by_rules(text)
+        if decision is not None and decision.confidence >= self.rule_threshold:
+            return decision
+        return self._by_tfidf(text)
+
+    async def select(self, text: str) -> ToolDecision:
+        # 先计入 total：走模型失败（llm_failed，抛 502）的请求也要算进分母
+        self.stats.total += 1
+        decision = self.classify_local(text)
+        if decision is None:
+            decision = await self._by_llm(text)
+        self.stats.by_source[decision.source] += 1
+        return decision
+
+    async def _by_llm(self, text: str) -> ToolDecision:
+        prompt = render_prompt(self.prompt_key, request=text)
+        try:
+            data = await shared_chat_json(
+                get_provider_pool(), prompt, max_tokens=300, temperature=0.0
+            )
+            out = ToolSelectOut.model_validate(data)
+        except Exception as e:
+            self.stats.by_source["llm_failed"] += 1
+            logger.warning("tool_select llm failed request_len=%s err=%s", len(text), str(e)[:200])
+            raise HTTPException(status_code=502, detail="Model output invalid or model call failed")
+        return ToolDecision(out, "llm", 1.0)
+
+
+_selector: ToolSelector | None = None
+
+
+def get_tool_selector() -> ToolSelector:
+    global _selector
+    if _selector is None:
+        _selector = ToolSelector()
+    return _selector
@@ -0,0 +1,178 @@
+# app/backfill.py
+import logging
+import math
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine, Row
+
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger("backfill")
+
+"""
+    在线数据回填（给 Alembic 数据迁移用）：
+    - 按主键 keyset 分批（WHERE id > :last ORDER BY id LIMIT n），每批一个事务、提交后释放写锁，
+      批与批之间 sleep 一下，线上写请求能插进来，不会把 SQLite 文件锁上几分钟
+    - 每批的数据修改和进度（backfill_checkpoints.last_key）在同一个事务里提交：
+      中途被杀掉，下次从最后一个提交的批次继续，不重做也不漏
+    - dry_run 只统计还剩多少行、要跑多少批，不写任何东西
+
+    迁移里的用法（先让 DDL 提交，回填用单独的短事务）：
+
+        def upgrade():
+            op.add_column("notes", sa.Column("foo", sa.String(), nullable=True))
+            with op.get_context().autocommit_block():
+                run_backfill(op.get_bind().engine, "notes_foo", table="notes",
+                             columns=["content"], where="foo IS NULL", process=fill_foo)
+
+    迁移里只写 SQL 字符串、不引用模型：回填逻辑不随以后的模型代码变化
+"""
+
+CHECKPOINT_TABLE = "backfill_checkpoints"
+
+BACKFILL_ROWS = REGISTRY.counter("backfill_rows_total", "Rows processed by backfills", ("name",))
+
+# process(conn, rows)：在本批的事务里处理这些行（通常是一条 executemany UPDATE）
+ProcessFn = Callable[[Connection, Sequence[Row]], None]
+
+
+@dataclass
+class BackfillResult:
+    name: str
+    rows: int = 0
+    batches: int = 0
+    last_key: Optional[int] = None
+    done: bool = False
+    dry_run: bool = False
+    # dry_run 时：还剩多少行 / 预计多少批
+    estimated_rows: Optional[int] = None
+    estimated_batches: Optional[int] = None
+
+
+def load_checkpoint(conn: Connection, name: str) -> Optional[Row]:
+    return conn.execute(
+        text(
+            f"SELECT name, last_key, rows_done, finished_at FROM {CHECKPOINT_TABLE} "
+            "WHERE name = :name"
+        ),
+        {"name": name},
+    ).one_or_none()
+
+
+def reset_checkpoint(engine: Engine, name: str) -> None:
+    """从头再跑一遍（比如回填逻辑改了）。"""
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {CHECKPOINT_TABLE} WHERE name = :name"), {"name": name})
+
+
+def _save_checkpoint(conn: Connection, name: str, last_key: int, rows: int, finished: bool):
+    # 和 SQLAlchemy 在 SQLite 里存 DateTime 的格式一致，模型那边能正常读出来
+    now = datetime.utcnow().isoformat(" ", "microseconds")
+    conn.execute(
+        text(
+            f"INSERT INTO {CHECKPOINT_TABLE} "
+            "(name, last_key, rows_done, updated_at, finished_at) "
+            "VALUES (:name, :last_key, :rows, :now, :finished_at) "
+            "ON CONFLICT (name) DO UPDATE SET last_key = excluded.last_key, "
+            "rows_done = rows_done + excluded.rows_done, updated_at = excluded.updated_at, "
+            "finished_at = excluded.finished_at"
+        ),
+        {
+            "name": name,
+            "last_key": last_key,
+            "rows": rows,
+            "now": now,
+            "finished_at": now if finished else None,
+        },
+    )
+
+
+def run_backfill(
+    engine: Engine,
+    name: str,
+    *,
+    table: str,
+    process: ProcessFn,
+    columns: Sequence[str] = (),
+    key: str = "id",
+    where: Optional[str] = None,
+    batch_size: int = 500,
+    sleep_s: float = 0.05,
+    dry_run: bool = False,
+    max_batches: Optional[int] = None,
+) -> BackfillResult:
+    """
+    按 key（整数主键）升序分批处理 table 里满足 where 的行：
+    - columns：每行除 key 以外还要读出来的列（process 拿到的 Row 上有 key 和这些列）
+    - where：只挑还需要处理的行（比如 "content_hash IS NULL"），重跑时天然幂等
+    - sleep_s：每批提交后的停顿，越大对线上写入越友好、回填越慢
+    - max_batches：最多跑几批就返回（分几次跑 / 测试用），进度照样保存
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    result = BackfillResult(name=name, dry_run=dry_run)
+    cond = f" AND ({where})" if where else ""
+    select_cols = ", ".join([key, *columns])
+
+    with engine.connect() as conn:
+        cp = load_checkpoint(conn, name)
+    if cp is not None and cp.finished_at is not None:
+        result.done = True
+        result.last_key = cp.last_key
+        return result
+    last = cp.last_key if cp is not None else -sys.maxsize
+
+    if dry_run:
+        with engine.connect() as conn:
+            remaining = conn.execute(
+                text(f"SELECT count(*) FROM {table} WHERE {key} > :last{cond}"), {"last": last}
+            ).scalar_one()
+        result.last_key = cp.last_key if cp is not None else None
+        result.estimated_rows = remaining
+        result.estimated_batches = math.ceil(remaining / batch_size)
+        return result
+
+    select_sql = text(
+        f"SELECT {select_cols} FROM {table} WHERE {key} > :last{cond} ORDER BY {key} LIMIT :n"
+    )
+    while max_batches is None or result.batches < max_batches:
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            rows = conn.execute(select_sql, {"last": last, "n": batch_size}).all()
+            finished = len(rows) < batch_size
+            if rows:
+                process(conn, rows)
+                last = getattr(rows[-1], key)
+            _save_checkpoint(conn, name, last, len(rows), finished)
+        result.rows += len(rows)
+        result.batches += 1
+        result.last_key = last
+        BACKFILL_ROWS.inc(len(rows), name=name)
+        logger.info(
+            "backfill %s batch=%s rows=%s last_key=%s cost=%.1fms",
+            name,
+            result.batches,
+            len(rows),
+            last,
+            (time.perf_counter() - t0) * 1000,
+        )
+        if finished:
+            result.done = True
+            break
+        if sleep_s > 0:
+            time.sleep(sleep_s)
+    return result
+
+
+if __name__ == "__main__":
+    # 查看回填进度：python -m app.backfill
+    from app.db import engine
+
+    with engine.connect() as conn:
+        for row in conn.execute(text(f"SELECT * FROM {CHECKPOINT_TABLE} ORDER BY name")):
+            print(dict(row._mapping))
@@ -0,0 +1,161 @@
+# app/core/coherence.py
+import atexit
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Hashable, Iterator
+
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger("coherence")
+
+"""
+    多 worker 部署时进程内状态的一致性（python -m app.serve 会 fork 多个 worker）：
+    - 缓存：VersionedCache 整体绑定一个版本号，版本号来自 SQLite 的 collection_versions
+      （触发器维护，任何进程、任何连接的写入都会让它 +1）。读缓存前先查一次版本号（主键查询），
+      别的 worker 写了笔记，这边下一次读就看到新版本号、整个缓存作废，不需要额外的通知通道
+    - 计数：SharedTokenBuckets 把限流令牌桶放进 fork 之前创建的匿名共享内存，
+      N 个 worker 共用同一组桶，限额不会变成 N 倍
+"""
+
+CACHE_LOOKUPS = REGISTRY.counter(
+    "cache_lookups_total", "In-process cache lookups", ("cache", "outcome")
+)
+
+
+class VersionedCache:
+    """
+    进程内 LRU，所有条目共用一个版本号：
+    - get/put 都带上调用方刚读到的版本号；版本号变了（别的 worker 写过）先清空再说
+    - put 的版本号比当前的旧（查询期间有写入、别的请求已经看到了新版本）就不存
+    """
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self._version: int | None = None
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self, version: int) -> bool:
+        # 调用方持有锁；返回 False 表示这个版本号已经过时
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            if self._items:
+                CACHE_LOOKUPS.inc(cache=self.name, outcome="invalidated")
+            self._items.clear()
+            self._version = version
+        return True
+
+    def get(self, version: int, key: Hashable) -> Any | None:
+        with self._lock:
+            if self._sync(version) and key in self._items:
+                self._items.move_to_end(key)
+                CACHE_LOOKUPS.inc(cache=self.name, outcome="hit")
+                return self._items[key]
+        CACHE_LOOKUPS.inc(cache=self.name, outcome="miss")
+        return None
+
+    def put(self, version: int, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if not self._sync(version):
+                return
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._version = None
+
+
+class SharedTokenBuckets:
+    """
+    跨进程的令牌桶表（算法和 app.security.TokenBucket 一样）：
+    - 匿名 mmap 在 fork 后父子进程共享同一块内存，所以必须在 fork 之前（app.serve 的父进程里）创建
+    - 跨进程互斥用 flock 锁一个临时文件：持锁的 worker 被杀掉时内核会释放它，不会把所有人卡死
+      （multiprocessing.Lock 是信号量，持有者死了就永远锁着）
+    - flock 按“打开的文件”区分持有者，fork 继承的 fd 是同一个：每个进程第一次用时自己 open 一次；
+      同一进程的多个线程共用这个 fd，再加一把线程锁
+    - 每个槽位：key 的 8 字节 hash、剩余令牌、上次补充时间（time.monotonic，同一台机器上各进程一致）
+    - 开放寻址；槽位用完就放行，限流失效总比拒绝所有请求好
+    """
+
+    _SLOT = struct.Struct("Qdd")
+
+    def __init__(self, slots: int = 4096):
+        self.slots = slots
+        self._mem = mmap.mmap(-1, slots * self._SLOT.size)
+        fd, self._lock_path = tempfile.mkstemp(prefix="notes-ratelimit-", suffix=".lock")
+        os.close(fd)
+        self._owner_pid = os.getpid()
+        self._lock_fd: int | None = None
+        self._lock_pid: int | None = None
+        self._thread_lock = threading.Lock()
+        atexit.register(self._cleanup)
+
+    def _cleanup(self) -> None:
+        # 只有创建它的进程删锁文件（worker 用 os._exit 退出，不跑 atexit）
+        if os.getpid() == self._owner_pid:
+            try:
+                os.unlink(self._lock_path)
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        import fcntl  # 只在 POSIX 上有；Windows 上 app.serve 不会创建共享桶
+
+        with self._thread_lock:
+            pid = os.getpid()
+            if self._lock_pid != pid:
+                self._lock_fd = os.open(self._lock_path, os.O_RDWR)
+                self._lock_pid = pid
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        h = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+        return h or 1  # 0 表示空槽位
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        """拿到令牌返回 0；否则返回还需要等待的秒数。"""
+        burst = max(burst, 1.0)
+        h = self._hash(key)
+        size = self._SLOT.size
+        with self._locked():
+            now = time.monotonic()
+            start = h % self.slots
+            for i in range(self.slots):
+                offset = ((start + i) % self.slots) * size
+                slot_hash, tokens, updated = self._SLOT.unpack_from(self._mem, offset)
+                if slot_hash == 0:
+                    slot_hash, tokens, updated = h, burst, now
+                elif slot_hash != h:
+                    continue
+                tokens = min(burst, tokens + (now - updated) * rate)
+                wait_s = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait_s = (1 - tokens) / rate
+                self._SLOT.pack_into(self._mem, offset, slot_hash, tokens, now)
+                return wait_s
+        logger.warning("shared rate limit table full (%s slots), allowing %s", self.slots, key)
+        return 0.0
@@ -9,7 +9,9 @@ logger = logging.getLogger("error")
 
 
 # 对error返回格式进行规范
-def error_response(code: str, message: str, status_code: int, details=None) -> JSONResponse:
+def error_response(
+    code: str, message: str, status_code: int, details=None, headers=None
+) -> JSONResponse:
     """
     全项目统一错误返回结构：
     {
@@ -21,7 +23,7 @@ def error_response(code: str, message: str, status_code: int, details=None) -> J
     }
     """
     payload = {"error": {"code": code, "message": message, "details": details}}
-    return JSONResponse(status_code=status_code, content=payload)
+    return JSONResponse(status_code=status_code, content=payload, headers=headers)
 
 
 # 规定错误代码对应的名称
@@ -32,10 +34,24 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         code = "unauthorized"
     elif exc.status_code == 404:
         code = "not_found"
+    elif exc.status_code == 409:
+        code = "conflict"
+    elif exc.status_code == 412:
+        code = "precondition_failed"
+    elif exc.status_code == 429:
+        code = "rate_limited"
+    elif exc.status_code == 499:
+        code = "client_closed_request"
     elif exc.status_code == 500:
         code = "server_misconfigured"
 
-    return error_response(code=code, message=str(exc.detail), status_code=exc.status_code)
+    # 像 429 的 Retry-After 这类 header 要原样带回给客户端
+    return error_response(
+        code=code,
+        message=str(exc.detail),
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
+    )
 
 
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -0,0 +1,89 @@
+# app/core/etag.py
+import hashlib
+from typing import Any
+
+from fastapi import Response
+
+"""
+    条件请求（ETag）：
+    - 单条笔记：ETag 来自 notes.version（每次更新 +1）
+    - 列表页：ETag 来自集合版本号（notes 表任何写入都 +1）+ 分页/过滤参数
+    - If-None-Match 命中 -> 304，只查一次版本号，不查正文、不序列化
+    - If-Match（PUT/DELETE）-> 强比较，版本对不上返回 412，防止覆盖别人刚写的内容
+"""
+
+# 笔记属于调用方私有数据：允许客户端缓存，但每次都要带 If-None-Match 回来验证
+CACHE_CONTROL = "private, no-cache"
+
+
+def note_etag(note_id: int, version: int) -> str:
+    return f'"note-{note_id}-v{version}"'
+
+
+def list_etag(
+    collection_version: int,
+    *,
+    limit: int,
+    offset: int,
+    sort: str,
+    filters: dict[str, Any] | None = None,
+) -> str:
+    tag = f"notes-c{collection_version}-{sort}-{offset}-{limit}"
+    # 过滤条件不同结果就不同：取没为空的条件做一个短 hash，没有过滤时 ETag 保持原样
+    active = sorted((k, str(v)) for k, v in (filters or {}).items() if v is not None)
+    if active:
+        tag += "-f" + hashlib.sha1(repr(active).encode("utf-8")).hexdigest()[:12]
+    return f'"{tag}"'
+
+
+def parse_etags(header: str, *, strong_only: bool = False) -> list[str]:
+    """
+    'W/"a", "b"' -> ['"a"', '"b"']（去掉弱校验前缀 W/；"*" 原样保留）
+    strong_only=True 时直接丢掉弱 ETag：If-Match 要求强比较，W/"x" 永远不匹配
+    """
+    tags = []
+    for part in header.split(","):
+        tag = part.strip()
+        if tag.startswith("W/"):
+            if strong_only:
+                continue
+            tag = tag[2:]
+        if tag:
+            tags.append(tag)
+    return tags
+
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """If-None-Match 用弱比较：W/"x" 和 "x" 视为相同。"""
+    if not header:
+        return False
+    tags = parse_etags(header)
+    return "*" in tags or etag in tags
+
+
+def if_match_versions(header: str | None, note_id: int) -> list[int] | None:
+    """
+    If-Match 里属于这条笔记的版本号：
+    - None：没带 If-Match 或者是 "*"（只要求笔记存在，按原来的 404 逻辑走）
+    - []：带了但没有一个是这条笔记的（强）ETag，一定会 412
+    """
+    if not header:
+        return None
+    tags = parse_etags(header, strong_only=True)
+    if "*" in tags:
+        return None
+    prefix = f'"note-{note_id}-v'
+    versions = []
+    for tag in tags:
+        if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix) : -1].isdigit():
+            versions.append(int(tag[len(prefix) : -1]))
+    return versions
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
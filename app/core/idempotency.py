@@ -0,0 +1,439 @@
+# app/core/idempotency.py
+import asyncio
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+import anyio
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import security, settings
+from app.core.errors import error_response
+from app.core.metrics import REGISTRY
+from app.models import IdempotencyKey as T
+
+logger = logging.getLogger("idempotency")
+
+"""
+    Idempotency-Key（客户端超时重试时不重复写库、不重复付上游的钱）：
+    - 只管带了 Idempotency-Key 头的 POST（创建笔记、AI 调用）；PUT/DELETE 本身就是幂等的
+    - key 按调用方（X-API-Key 的 hash）+ 方法 + 路径隔离，别人的 key 撞上了也读不到你的响应
+    - 占位/回放之前先校验 X-API-Key：无效的 key 直接交给路由（401），不碰 SQLite；
+      回放也照常扣限流令牌，key 被吊销或超限的调用方拿不到保存的响应
+    - 第一次请求的 2xx 响应存进 SQLite（idempotency_keys，带过期时间），进程内再放一份 LRU：
+      重试直接回放原响应（带 Idempotent-Replayed: true），路由函数不会再执行
+    - 并发的重复请求：同进程的等第一个请求的 future，别的进程的轮询 SQLite 里的占位行
+    - 占位带令牌，请求还在跑就定期续期：上游超时 + 故障转移 + 排队比 IDEMPOTENCY_LOCK_S 还久，
+      别的进程也接手不了；真被接手了（进程卡死过），原请求的保存/放弃按令牌匹配，不会动别人的行
+    - 非 2xx（401/422/429/499/5xx…）不保存，占位删掉：重试会真正重新执行
+    - 同一个 key 换了请求体 -> 422；第一个请求等太久还没完成 -> 409
+"""
+
+IDEMPOTENCY_REQUESTS = REGISTRY.counter(
+    "idempotency_requests_total", "Requests carrying an Idempotency-Key by outcome", ("outcome",)
+)
+
+HEADER = b"idempotency-key"
+MAX_KEY_LENGTH = 200
+# 只保存不超过这么大的响应（笔记 / AI 结果都远小于它）
+MAX_STORED_BODY = 1024 * 1024
+# 其他进程占着 key 时的轮询间隔
+POLL_INTERVAL_S = 0.05
+# 每这么多次 claim 顺手清理一次过期行
+PURGE_EVERY = 256
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    expires_at: datetime
+
+
+class IdempotencyStore:
+    """SQLite 里的 key 表：claim 占位 / extend 续期 / complete 保存响应 / release 放弃占位。"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._claims = itertools.count(1)
+
+    def claim(
+        self, key: str, fingerprint: str, lock_s: float, token: str
+    ) -> tuple[str, Optional[StoredResponse]]:
+        """
+        返回 (状态, 已保存的响应)：
+        - claimed：用 token 占位成功，由我来执行（过期的旧行会被覆盖）
+        - done：已经有保存的响应；mismatch：同一个 key 但请求体不同；pending：别人正在执行
+        """
+        now = datetime.utcnow()
+        stmt = sqlite_insert(T).values(
+            key=key,
+            fingerprint=fingerprint,
+            created_at=now,
+            token=token,
+            expires_at=now + timedelta(seconds=lock_s),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[T.key],
+            set_={
+                "fingerprint": stmt.excluded.fingerprint,
+                "status_code": None,
+                "headers": None,
+                "body": None,
+                "created_at": stmt.excluded.created_at,
+                "token": stmt.excluded.token,
+                "expires_at": stmt.excluded.expires_at,
+            },
+            where=T.expires_at < now,
+        ).returning(T.key)
+
+        with self.engine.begin() as conn:
+            if next(self._claims) % PURGE_EVERY == 0:
+                conn.execute(delete(T).where(T.expires_at < now))
+            if conn.execute(stmt).first() is not None:
+                return "claimed", None
+            row = conn.execute(
+                select(T.fingerprint, T.status_code, T.headers, T.body, T.expires_at).where(
+                    T.key == key
+                )
+            ).one()
+        if row.fingerprint != fingerprint:
+            return "mismatch", None
+        if row.status_code is None:
+            return "pending", None
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(row.headers)]
+        return "done", StoredResponse(
+            row.fingerprint, row.status_code, headers, row.body, row.expires_at
+        )
+
+    def extend(self, key: str, token: str, lock_s: float) -> bool:
+        """续期自己的占位；返回 False 表示占位已经不是我的了（过期后被别人接手）。"""
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(T)
+                .where(T.key == key, T.token == token, T.status_code.is_(None))
+                .values(expires_at=datetime.utcnow() + timedelta(seconds=lock_s))
+            )
+        return result.rowcount > 0
+
+    def complete(self, key: str, token: str, response: StoredResponse) -> bool:
+        """保存响应；占位已经被别人接手时什么都不写，返回 False。"""
+        headers = json.dumps(
+            [(k.decode("latin-1"), v.decode("latin-1")) for k, v in response.headers]
+        )
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(T)
+                .where(T.key == key, T.token == token, T.status_code.is_(None))
+                .values(
+                    status_code=response.status_code,
+                    headers=headers,
+                    body=response.body,
+                    expires_at=response.expires_at,
+                )
+            )
+        return result.rowcount > 0
+
+    def release(self, key: str, token: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(T).where(T.key == key, T.token == token, T.status_code.is_(None)))
+
+
+class IdempotencyMiddleware:
+    """
+    纯 ASGI 中间件，放在最内层（响应头里还没有 Server-Timing 之类每次都不同的东西）。
+    paths：以 / 结尾的按前缀匹配，否则按整个路径匹配。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        paths: tuple[str, ...] = ("/v1/notes", "/ai/"),
+        store: Optional[IdempotencyStore] = None,
+    ):
+        self.app = app
+        self.paths = paths
+        self._store = store
+        self._memory: OrderedDict[str, StoredResponse] = OrderedDict()
+        self._lock = threading.Lock()
+        # 本进程里正在执行的 key -> (事件循环, 完成时 set 的 future)
+        self._inflight: dict[str, tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+    @property
+    def store(self) -> IdempotencyStore:
+        # 延迟到第一次用时再取 engine：import app.main 不连数据库
+        if self._store is None:
+            from app.db import engine
+
+            self._store = IdempotencyStore(engine)
+        return self._store
+
+    def _applies(self, path: str) -> bool:
+        return any(path == p or (p.endswith("/") and path.startswith(p)) for p in self.paths)
+
+    def _remember(self, key: str, response: StoredResponse) -> None:
+        with self._lock:
+            self._memory[key] = response
+            self._memory.move_to_end(key)
+            while len(self._memory) > settings.IDEMPOTENCY_MEMORY_ITEMS:
+                self._memory.popitem(last=False)
+
+    def _recall(self, key: str) -> Optional[StoredResponse]:
+        with self._lock:
+            response = self._memory.get(key)
+            if response is not None and response.expires_at < datetime.utcnow():
+                del self._memory[key]
+                return None
+            return response
+
+    def forget(self) -> None:
+        """清空进程内缓存（测试用；SQLite 里的记录不受影响）。"""
+        with self._lock:
+            self._memory.clear()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or not self._applies(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        raw_key = headers.get(HEADER)
+        if raw_key is None:
+            await self.app(scope, receive, send)
+            return
+        idem_key = raw_key.decode("latin-1").strip()
+        if not idem_key or len(idem_key) > MAX_KEY_LENGTH:
+            resp = error_response(
+                "invalid_idempotency_key",
+                f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters",
+                400,
+            )
+            await resp(scope, receive, send)
+            return
+
+        # 鉴权在路由依赖里：这里先查一次，无效的 key 不占位、不回放，由路由返回 401
+        client = security.lookup_api_key(headers.get(b"x-api-key", b"").decode("latin-1"))
+        if client is None:
+            await self.app(scope, receive, send)
+            return
+
+        # 先把请求体读完：算指纹要用，之后原样交给路由
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # 请求体之后的 receive（比如等 http.disconnect）交给原来的连接
+            return await receive()
+
+        caller = hashlib.sha256(headers.get(b"x-api-key", b"")).hexdigest()[:16]
+        key = f"{caller}:{scope['method']}:{scope['path']}:{idem_key}"
+        fingerprint = hashlib.sha256(
+            scope["path"].encode() + b"?" + scope.get("query_string", b"") + b"\n" + body
+        ).hexdigest()
+
+        loop = asyncio.get_running_loop()
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_S
+        waited = False
+        while True:
+            stored = self._recall(key)
+            if stored is not None:
+                await self._replay(stored, fingerprint, waited, client, scope, receive, send)
+                return
+
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is loop:
+                # 同一个进程里的第一个请求还在跑：等它结束再回到循环开头看结果
+                waited = True
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(entry[1]), max(deadline - time.monotonic(), 0)
+                    )
+                except asyncio.TimeoutError:
+                    await self._still_running(scope, receive, send)
+                    return
+                continue
+
+            fut = loop.create_future()
+            self._inflight[key] = (loop, fut)
+            try:
+                status, stored = await anyio.to_thread.run_sync(
+                    self.store.claim, key, fingerprint, settings.IDEMPOTENCY_LOCK_S, token
+                )
+            except BaseException:
+                self._finish(key, fut)
+                raise
+            if status == "claimed":
+                break
+            self._finish(key, fut)
+
+            if status == "done":
+                self._remember(key, stored)
+                await self._replay(stored, fingerprint, waited, client, scope, receive, send)
+                return
+            if status == "mismatch":
+                await self._mismatch(scope, receive, send)
+                return
+            # pending：别的进程正在执行
+            waited = True
+            if time.monotonic() >= deadline:
+                await self._still_running(scope, receive, send)
+                return
+            await asyncio.sleep(POLL_INTERVAL_S)
+
+        await self._execute(key, token, fut, fingerprint, scope, replay_receive, send)
+
+    def _finish(self, key: str, fut: asyncio.Future) -> None:
+        if self._inflight.get(key, (None, None))[1] is fut:
+            del self._inflight[key]
+        if not fut.done():
+            fut.set_result(None)
+
+    async def _keep_claim(self, key: str, token: str) -> None:
+        # 每过 1/3 个 IDEMPOTENCY_LOCK_S 续一次：占位只会在进程真的崩了/卡死之后过期
+        lock_s = settings.IDEMPOTENCY_LOCK_S
+        while True:
+            await asyncio.sleep(lock_s / 3)
+            if not await anyio.to_thread.run_sync(self.store.extend, key, token, lock_s):
+                logger.warning("idempotency claim lost while the request was running key=%s", key)
+                return
+
+    async def _execute(
+        self,
+        key: str,
+        token: str,
+        fut: asyncio.Future,
+        fingerprint: str,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        status_code: Optional[int] = None
+        response_headers: list[tuple[bytes, bytes]] = []
+        parts: list[bytes] = []
+        size = 0
+        complete = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_headers, size, complete
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_headers = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                size += len(chunk)
+                if size <= MAX_STORED_BODY:
+                    parts.append(chunk)
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        heartbeat = asyncio.create_task(self._keep_claim(key, token))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            heartbeat.cancel()
+            keep = (
+                complete
+                and status_code is not None
+                and 200 <= status_code < 300
+                and size <= MAX_STORED_BODY
+            )
+            # 请求被取消时也要把结果落库 / 放掉占位，否则重试要等占位过期
+            with anyio.CancelScope(shield=True):
+                try:
+                    if keep:
+                        stored = StoredResponse(
+                            fingerprint,
+                            status_code,
+                            response_headers,
+                            b"".join(parts),
+                            datetime.utcnow() + timedelta(seconds=settings.IDEMPOTENCY_TTL_S),
+                        )
+                        if await anyio.to_thread.run_sync(self.store.complete, key, token, stored):
+                            self._remember(key, stored)
+                            IDEMPOTENCY_REQUESTS.inc(outcome="stored")
+                        else:
+                            IDEMPOTENCY_REQUESTS.inc(outcome="claim_lost")
+                    else:
+                        await anyio.to_thread.run_sync(self.store.release, key, token)
+                        IDEMPOTENCY_REQUESTS.inc(outcome="not_stored")
+                finally:
+                    self._finish(key, fut)
+
+    async def _replay(
+        self,
+        stored: StoredResponse,
+        fingerprint: str,
+        waited: bool,
+        client: security.ApiClient,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        if stored.fingerprint != fingerprint:
+            await self._mismatch(scope, receive, send)
+            return
+        # 回放不经过路由依赖：限流在这里补上（和路由用同一组令牌桶）
+        rate_scope = "ai" if scope["path"].startswith("/ai/") else "notes"
+        wait_s = security.take_token(client, rate_scope)
+        if wait_s > 0:
+            resp = error_response(
+                "rate_limited",
+                "Rate limit exceeded",
+                429,
+                headers={"Retry-After": security.retry_after(wait_s)},
+            )
+            await resp(scope, receive, send)
+            return
+        IDEMPOTENCY_REQUESTS.inc(outcome="waited" if waited else "replayed")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": stored.status_code,
+                "headers": [*stored.headers, (b"idempotent-replayed", b"true")],
+            }
+        )
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def _mismatch(self, scope: Scope, receive: Receive, send: Send) -> None:
+        IDEMPOTENCY_REQUESTS.inc(outcome="mismatch")
+        resp = error_response(
+            "idempotency_key_reused",
+            "Idempotency-Key was already used with a different request",
+            422,
+        )
+        await resp(scope, receive, send)
+
+    async def _still_running(self, scope: Scope, receive: Receive, send: Send) -> None:
+        IDEMPOTENCY_REQUESTS.inc(outcome="in_progress")
+        resp = error_response(
+            "idempotency_key_in_progress",
+            "A request with this Idempotency-Key is still being processed",
+            409,
+            headers={"Retry-After": "1"},
+        )
+        await resp(scope, receive, send)
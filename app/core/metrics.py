@@ -0,0 +1,201 @@
+# app/core/metrics.py
+import threading
+from bisect import bisect_left
+from typing import Callable
+
+import anyio.to_thread
+
+"""
+    进程内指标（Prometheus 文本格式）：
+    - 不引第三方依赖；每次记录只是一次加锁 + 字典/列表加法
+    - 同步路由跑在线程池里（DB 事件也在那），所以计数要加锁
+    - GET /metrics 时才把数字拼成文本
+"""
+
+# 默认桶（秒）：覆盖 1ms 的 DB 查询到 30s 的模型调用
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_str(labelnames: tuple[str, ...], key: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    return repr(float(v)) if v != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[n]) for n in self.labelnames), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_fmt(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # 每个 label 组合：[各桶计数（非累计，最后一个是 +Inf）, sum, count]
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def count(self, **labels: str) -> int:
+        s = self._series.get(tuple(str(labels[n]) for n in self.labelnames))
+        return s[2] if s else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._series.items()]
+        for key, (counts, total, n) in items:
+            acc = 0
+            for le, c in zip((*self.buckets, float("inf")), counts):
+                acc += c
+                labels = _label_str(self.labelnames, key, f'le="{_fmt(le)}"')
+                lines.append(f"{self.name}_bucket{labels} {acc}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {n}")
+        return lines
+
+
+class Gauge:
+    """取值型指标：抓取时才调用 fn() 读当前值，平时零开销。"""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_fmt(self.fn())}",
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help, fn))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    ("op",),
+)
+DB_QUERY_ERRORS = REGISTRY.counter("db_query_errors_total", "Failed SQL statements", ("op",))
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "ai_upstream_duration_seconds",
+    "Model provider HTTP call latency",
+    ("model", "outcome"),
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "ai_upstream_retries_total",
+    "Model calls re-requested (empty content / unrepairable json)",
+    ("model", "reason"),
+)
+UPSTREAM_EMPTY = REGISTRY.counter(
+    "ai_upstream_empty_content_total", "Model responses with empty content", ("model",)
+)
+# outcome：clean 原样可解析；fenced/extracted/truncated/reasoning 本地修好；failed 要重新请求
+AI_JSON_PARSE = REGISTRY.counter(
+    "ai_json_parse_total",
+    "Model json outputs by parse / local repair outcome",
+    ("model", "outcome"),
+)
+
+
+# 线程池饱和度：同步路由/依赖都跑在 anyio 默认线程池里，busy 接近 max 时请求开始排队
+# 只能在事件循环里读（/metrics 是 async 路由，满足）
+def _limiter():
+    return anyio.to_thread.current_default_thread_limiter()
+
+
+REGISTRY.gauge(
+    "threadpool_busy_threads",
+    "Worker threads currently running sync endpoints",
+    lambda: _limiter().borrowed_tokens,
+)
+REGISTRY.gauge("threadpool_max_threads", "Thread pool capacity", lambda: _limiter().total_tokens)
+REGISTRY.gauge(
+    "threadpool_waiting_tasks",
+    "Tasks waiting for a free worker thread",
+    lambda: _limiter().statistics().tasks_waiting,
+)
@@ -2,36 +2,118 @@
 import logging
 import time
 
-from fastapi import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import timing
+from app.core.metrics import HTTP_REQUEST_SECONDS
 
 """
     - 中间件（middleware）是一层统一拦截器
     - 路由执行前后都能工作：记录耗时、加header、限流、审计等
+    - 这里都是“纯 ASGI”中间件：只包装 send，不经过 BaseHTTPMiddleware，
+      不额外起 task、不复制响应流，StreamingResponse 也能真正边算边发
 """
 logger = logging.getLogger("request")
 
 
-async def log_requests(request: Request, call_next):
+class JsonUtf8Middleware:
+    """
+    JSON 响应补上 charset=utf-8（中文客户端不会乱码）：
+    只在 http.response.start 里改 header，响应体原样透传
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                ct = headers.get("content-type", "")
+                if ct.startswith("application/json") and "charset=" not in ct.lower():
+                    headers["content-type"] = "application/json; charset=utf-8"
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class RequestLogMiddleware:
     """
-    FastAPI 中间件：
-    - 每个请求进来都会经过这里
-    - call_next(request) 会继续执行路由逻辑并拿到 response
+    记录每个请求的耗时：
+    - status 从 http.response.start 里拿
+    - 耗时算到响应体发完为止（流式响应也准确）
+    - 路由抛异常时还没有 response.start，status 记为 500
+    - 开启了 Server-Timing 时，把耗时拆分作为结构化字段 timing 一起记录
     """
-    start = time.perf_counter()
-    response = None
-    try:
-        response = await call_next(request)
-        return response
-    finally:
-        duration_ms = (time.perf_counter() - start) * 1000
-
-        # 注意：response 可能在异常时为 None
-        status_code = getattr(response, "status_code", 500)
-
-        logger.info(
-            "%s %s -> %s (%.1fms)",
-            request.method,
-            request.url.path,
-            status_code,
-            duration_ms,
-        )
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            breakdown = timing.current()
+            logger.info(
+                "%s %s -> %s (%.1fms)",
+                scope["method"],
+                scope["path"],
+                status_code,
+                duration_ms,
+                extra={"timing": breakdown} if breakdown is not None else None,
+            )
+
+
+class MetricsMiddleware:
+    """
+    按“路由模板”记录延迟直方图（/v1/notes/{note_id}，而不是每个具体 id 一条线）：
+    路由匹配后 FastAPI 会把 route 写回 scope，请求结束时读出来
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # 没匹配上的路径（404 扫描）统一归一条，避免 label 爆炸
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "<unmatched>"),
+                status=status_code,
+            )
@@ -0,0 +1,152 @@
+# app/core/profiling.py
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+import anyio.to_thread
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import settings
+from app.security import is_valid_api_key
+
+logger = logging.getLogger("profiling")
+
+"""
+    按需剖析单个请求（生产环境也能安全使用）：
+    - 默认关闭（PROFILING_ENABLED=0），关闭时中间件只读一个配置就直接放行
+    - 触发方式：请求头 X-Profile: 1 且 X-API-Key 正确；或按 PROFILING_SAMPLE_RATE 随机抽样
+    - 同一时间只剖析一个请求，其余请求照常处理、不排队
+    - 结果写到 outputs/profiles/，响应头 X-Profile-Id 告诉你是哪个文件
+"""
+
+_busy = threading.Lock()
+
+
+class StackSampler:
+    """
+    采样剖析器：后台线程每隔 interval 抓一次所有线程的调用栈，
+    按 “线程;外层函数;...;内层函数 次数” 的 folded 格式累计（flamegraph 通用输入）。
+    async 路由跑在事件循环线程，同步路由跑在线程池，所以每个线程都要采。
+    """
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.counts[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+def _should_profile(scope: Scope) -> bool:
+    headers = dict(scope["headers"])
+    if headers.get(b"x-profile") == b"1":
+        api_key = headers.get(b"x-api-key", b"").decode("latin-1")
+        return is_valid_api_key(api_key)
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _profile_path(scope: Scope, suffix: str) -> Path:
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return Path(settings.PROFILING_DIR) / f"{ts}_{scope['method']}_{slug}{suffix}"
+
+
+class ProfilingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            not settings.PROFILING_ENABLED
+            or scope["type"] != "http"
+            or not _should_profile(scope)
+            or not _busy.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            _busy.release()
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        cprofile = settings.PROFILING_MODE == "cprofile"
+        path = _profile_path(scope, ".prof" if cprofile else ".folded")
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", path.name)
+            await send(message)
+
+        t0 = time.perf_counter()
+        if cprofile:
+            # 确定性剖析只能看到事件循环线程（同步路由在线程池里，看不到）
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                await anyio.to_thread.run_sync(_dump_cprofile, profiler, path)
+        else:
+            sampler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000)
+            sampler.start()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                sampler.stop()
+                await anyio.to_thread.run_sync(_write_text, path, sampler.folded())
+
+        logger.info(
+            "profiled %s %s (%.1fms) -> %s",
+            scope["method"],
+            scope["path"],
+            (time.perf_counter() - t0) * 1000,
+            path,
+        )
+
+
+def _dump_cprofile(profiler: cProfile.Profile, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(path))
+
+
+def _write_text(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
@@ -0,0 +1,100 @@
+# app/core/timing.py
+import time
+from contextvars import ContextVar
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import settings
+
+"""
+    单个请求的耗时拆分（auth / db / prompt / upstream / validate / render）：
+    - TimingMiddleware 在请求开始时往 contextvar 里放一个空 dict
+    - 各处用 add() / span() 往里累加耗时；同步路由跑在线程池里，
+      anyio 会复制 context，dict 是同一个对象，所以线程里的累加也能看到
+    - 响应开始时写成 Server-Timing 头，RequestLogMiddleware 把它带进日志
+    - 关闭时 contextvar 为 None，add() 只多一次 get()，几乎零开销
+"""
+
+_timings: ContextVar[dict[str, list[float]] | None] = ContextVar("request_timings", default=None)
+
+
+def add(name: str, dur_ms: float) -> None:
+    t = _timings.get()
+    if t is None:
+        return
+    entry = t.get(name)
+    if entry is None:
+        t[name] = [dur_ms, 1]
+    else:
+        entry[0] += dur_ms
+        entry[1] += 1
+
+
+class span:
+    """with span("prompt"): ... 统计一段代码的耗时（关闭时不计时）。"""
+
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.t0 = 0.0
+
+    def __enter__(self) -> "span":
+        if _timings.get() is not None:
+            self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self.t0:
+            add(self.name, (time.perf_counter() - self.t0) * 1000)
+
+
+def current() -> dict[str, Any] | None:
+    """当前请求的耗时拆分：{"db": {"ms": 1.2, "n": 3}, ...}；未开启时为 None。"""
+    t = _timings.get()
+    if t is None:
+        return None
+    return {name: {"ms": round(ms, 2), "n": int(n)} for name, (ms, n) in t.items()}
+
+
+def server_timing_header(t: dict[str, list[float]], total_ms: float) -> str:
+    parts = [f'{name};dur={ms:.1f};desc="n={int(n)}"' for name, (ms, n) in t.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class TimedJSONResponse(JSONResponse):
+    """把响应序列化（json.dumps）的耗时记为 render。"""
+
+    def render(self, content: Any) -> bytes:
+        with span("render"):
+            return super().render(content)
+
+
+class TimingMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.SERVER_TIMING:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: dict[str, list[float]] = {}
+        token = _timings.set(timings)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", server_timing_header(timings, total_ms))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
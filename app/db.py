@@ -1,7 +1,12 @@
-from sqlalchemy import create_engine
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 
 from app import settings
+from app.core import timing
+from app.core.metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS
 
 engine = create_engine(
     settings.DATABASE_URL,
@@ -21,3 +26,30 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# SQL 计时：挂在 Engine 类上，对所有 engine 生效（包括测试里单独建的那个）
+# conn.info 是每个连接自己的字典，同一连接上的语句串行执行，用栈存开始时间即可
+def _op(statement: str) -> str:
+    head = statement.lstrip()[:10].split(None, 1)
+    return head[0].lower() if head else "other"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    dt = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_SECONDS.observe(dt, op=_op(statement))
+    timing.add("db", dt * 1000)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+    DB_QUERY_ERRORS.inc(op=_op(exception_context.statement or ""))
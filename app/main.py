@@ -1,57 +1,96 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.exceptions import RequestValidationError
 
-from app import (
-    settings,
-)
+from app import settings
+from app.ai import close_upstream
 from app.core.errors import (
     http_exception_handler,
     unhandled_exception_handler,
     validation_exception_handler,
 )
-from app.core.logging import setup_logging
-from app.core.middleware import log_requests
+from app.core.idempotency import IdempotencyMiddleware
+from app.core.logging import setup_logging, shutdown_logging
+from app.core.middleware import JsonUtf8Middleware, MetricsMiddleware, RequestLogMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.timing import TimedJSONResponse, TimingMiddleware
 from app.db import Base, engine
-from app.routers.ai import router as ai_router
+from app.routers.metrics import router as metrics_router
 from app.routers.notes import router as notes_router
+from app.services.summary_service import get_summary_worker
+from app.warmup import get_warmup
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时的初始化放在这里，而不是 import 时：
+    - import app.main 只构建路由（测试、脚本、alembic 导入它都不会有副作用）
+    - 日志后台线程、dev 环境建表、摘要后台任务，在服务真正开始接请求前做一次
+    - WARMUP=1 时在后台预热上游连接和 SQLite 页缓存，完成前 /health/ready 返回 503
+    """
+    setup_logging()
+    if settings.ENV == "dev":
+        # 学习阶段可以保留兜底，但你要逐步习惯用 alembic upgrade head
+        # 简单做法：启动时自动建表（学习阶段够用）
+        Base.metadata.create_all(bind=engine)
+    summary_worker = get_summary_worker()
+    summary_worker.start()
+    warmup = get_warmup()
+    warmup.start()
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        summary_worker.stop()
+        await close_upstream()
+        # 把日志队列写完：fork 出来的 worker 是 os._exit 退出的，atexit 不会执行
+        shutdown_logging()
+
+
+app = FastAPI(
+    title="Notes API",
+    version="0.1.0",
+    default_response_class=TimedJSONResponse,
+    lifespan=lifespan,
+)
 
-# 需要让ORM见过模型（Note类），才知道应当创建哪张表，确保Note被加载
-
-
-app = FastAPI(title="Notes API", version="0.1.0")
-
-setup_logging()
-
-app = FastAPI()
-
-
-@app.middleware("http")
-async def ensure_json_utf8(request, call_next):
-    response = await call_next(request)
-    ct = response.headers.get("content-type", "")
-    if ct.startswith("application/json") and "charset=" not in ct.lower():
-        response.headers["content-type"] = "application/json; charset=utf-8"
-    return response
-
-
-app.include_router(ai_router)
-
-# 中间件：记录每个请求耗时
-app.middleware("http")(log_requests)
+# 中间件：纯 ASGI 实现；后添加的在外层，所以记录耗时的包在最外面
+# TimingMiddleware 要在 RequestLogMiddleware 外层，日志里才能带上耗时拆分
+# IdempotencyMiddleware 在最内层：保存的是路由的原始响应，回放时外层照常记日志/指标/计时
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(JsonUtf8Middleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestLogMiddleware)
+app.add_middleware(TimingMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 # 异常处理：统一错误格式
 app.add_exception_handler(HTTPException, http_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(Exception, unhandled_exception_handler)
 
-if settings.ENV == "dev":
-    # 学习阶段可以保留兜底，但你要逐步习惯用 alembic upgrade head
-    # 简单做法：启动时自动建表（学习阶段够用）
-    Base.metadata.create_all(bind=engine)
-
 app.include_router(notes_router, prefix="/v1")
+app.include_router(metrics_router)
 
+if settings.AI_ENABLED:
+    # 只有开启 AI 时才导入 /ai 路由（模型客户端等在第一次调用时才加载）
+    from app.routers.ai import router as ai_router
 
+    app.include_router(ai_router)
+
+
+# 存活探针：进程能响应就是 200
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+# 就绪探针：启动预热（WARMUP=1）完成之前 503，负载均衡等它 200 再导流量
+@app.get("/health/ready")
+def ready(response: Response):
+    warmup = get_warmup()
+    if not warmup.ready:
+        response.status_code = 503
+    return warmup.snapshot()
@@ -1,11 +1,33 @@
+import hashlib
 from datetime import datetime
+from typing import Optional
 
-from sqlalchemy import DateTime, String, Text
+from sqlalchemy import (
+    DDL,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    event,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db import Base
 
 
+def content_hash(content: str) -> str:
+    """正文的 sha256（hex）：notes.content_hash 和 note_summaries.content_hash 都用它。"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _content_hash_default(context) -> str:
+    # ORM / Core insert 没显式给 content_hash 时，按本次插入的 content 算
+    return content_hash(context.get_current_parameters()["content"])
+
+
 # Note代表一张数据库表
 class Note(Base):
     # 定义表名叫“notes”
@@ -16,3 +38,121 @@ class Note(Base):
     title: Mapped[str] = mapped_column(String(200))
     content: Mapped[str] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Core 的 update(Note) 语句同样会带上 onupdate，不需要每个写路径手动赋值
+    # 库里允许为空：迁移是 ADD COLUMN 后回填的（改 NOT NULL 要重建表），和迁移保持一致
+    updated_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+    # 正文 hash：更新时和它比较，内容没变就不写库；客户端也可以拿它判断要不要上传
+    # 和 updated_at 一样是 ADD COLUMN + 分批回填的，库里允许为空（回填完成前的旧行）
+    content_hash: Mapped[Optional[str]] = mapped_column(
+        String(64), nullable=True, default=_content_hash_default
+    )
+    # 每次更新 +1：单条笔记的 ETag 由它生成，If-Match 也拿它做乐观并发控制
+    version: Mapped[int] = mapped_column(Integer, default=1, server_default="1")
+
+    # 列表页的时间窗口 / 标题前缀过滤都走索引范围查询（SEARCH），不扫全表
+    # 带上 id：和列表的 (时间, id) 排序一致，按时间排序时不需要额外的临时排序
+    __table_args__ = (
+        Index("ix_notes_created_at_id", "created_at", "id"),
+        Index("ix_notes_updated_at_id", "updated_at", "id"),
+        Index("ix_notes_title", "title"),
+        Index("ix_notes_content_hash", "content_hash"),
+        # AUTOINCREMENT：删掉的 id 不再复用。ETag（note-{id}-v{version}）、摘要都按 id 认笔记，
+        # 复用了 id 的新笔记会被当成那条已删除的旧笔记（旧 ETag 拿到 304 / 通过 If-Match）
+        {"sqlite_autoincrement": True},
+    )
+
+
+# 集合版本号：notes 表任何一次写入（增/改/删）都 +1，列表页的 ETag 由它生成
+# 一行一个集合（name="notes"），读它只是一次主键查询，比重新查整页便宜得多
+class CollectionVersion(Base):
+    __tablename__ = "collection_versions"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+
+# 笔记摘要（后台生成）：按 note_id 一行，content_hash 记录摘要是根据哪一版正文生成的
+# 读的时候和当前正文的 hash 比较：一致是 ready，不一致是 stale（旧摘要先顶着，新的在排队）
+class NoteSummary(Base):
+    __tablename__ = "note_summaries"
+
+    note_id: Mapped[int] = mapped_column(ForeignKey("notes.id"), primary_key=True)
+    content_hash: Mapped[str] = mapped_column(String(64))
+    prompt_key: Mapped[str] = mapped_column(String(100))
+    # SummaryOut 的 JSON
+    summary: Mapped[str] = mapped_column(Text)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# 数据回填进度（app/backfill.py）：每个回填任务一行，key <= last_key 的行都已处理并提交
+# 回填代码用 SQL 字符串读写它；这里定义是为了 create_all 和 alembic autogenerate
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoints"
+
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    last_key: Mapped[int] = mapped_column(Integer)
+    rows_done: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    updated_at: Mapped[datetime] = mapped_column(DateTime)
+    # 非空表示已经跑完，再调用 run_backfill 直接返回
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+# Idempotency-Key（app/core/idempotency.py）：同一个 key 的重试直接拿到第一次的响应
+# status_code 为空表示第一次请求还在处理中（其他进程的重复请求轮询等待它）
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    # 调用方 + 方法 + 路径 + 客户端给的 key
+    key: Mapped[str] = mapped_column(String(300), primary_key=True)
+    # 请求体指纹：同一个 key 换了请求内容要报错，而不是返回不相干的旧响应
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    status_code: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # 响应头 JSON（[[name, value], ...]）和响应体
+    headers: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    # 占位令牌：谁占的位谁才能续期 / 保存响应 / 放弃占位（过期被别人接手后，原请求的写入不生效）
+    token: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    # 处理中：锁的过期时间（进程崩了别人可以接手）；完成后：响应的保存期限
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+
+
+# 由 SQLite 触发器负责 +1：写路径仍然是一条语句，不会漏掉任何一种写法（包括手工 SQL）
+# alembic 迁移里建同样的触发器；这里是给 create_all（dev/测试）用的
+NOTES_VERSION_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS notes_collection_version_{op.lower()}
+    AFTER {op} ON notes
+    BEGIN
+        UPDATE collection_versions SET version = version + 1 WHERE name = 'notes';
+    END
+    """
+    for op in ("INSERT", "UPDATE", "DELETE")
+]
+# 笔记删除时顺带删掉它的摘要（SQLite 默认不执行外键的 ON DELETE CASCADE）
+NOTE_SUMMARY_CLEANUP_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS notes_delete_summary
+    AFTER DELETE ON notes
+    BEGIN
+        DELETE FROM note_summaries WHERE note_id = OLD.id;
+    END
+    """
+SEED_COLLECTION_VERSION = (
+    "INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('notes', 0)"
+)
+
+event.listen(
+    CollectionVersion.__table__,
+    "after_create",
+    DDL(SEED_COLLECTION_VERSION).execute_if(dialect="sqlite"),
+)
+for _sql in NOTES_VERSION_TRIGGERS:
+    event.listen(Note.__table__, "after_create", DDL(_sql).execute_if(dialect="sqlite"))
+# 触发器里引用了 note_summaries，所以挂在它的 after_create 上（此时两张表都已存在）
+event.listen(
+    NoteSummary.__table__,
+    "after_create",
+    DDL(NOTE_SUMMARY_CLEANUP_TRIGGER).execute_if(dialect="sqlite"),
+)
@@ -1,15 +1,36 @@
 # app/routers/ai.py
-from fastapi import APIRouter, Depends
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Header, Request
 from pydantic import BaseModel, Field
 
-from app.ai.ai_service import rewrite, summarize
-from app.ai.output_schemas import RewriteOut, SummaryOut
-from app.security import verify_api_key
+from app.ai.inflight import cancel_on_disconnect
+from app.ai.output_schemas import RewriteOut, SummaryOut, ToolSelectOut
+from app.ai.scheduler import get_scheduler, set_request_class
+from app.security import ApiClient, rate_limit, verify_api_key
+
+# 注意：ai_service / provider_pool / tool_select 在路由函数里才导入
+# 路由注册只需要上面的请求/响应模型；模型客户端、TF-IDF 索引等第一次调用时才加载
+
+
+async def ai_request_class(
+    client: ApiClient = Depends(verify_api_key),
+    x_priority: Literal["interactive", "batch"] = Header("interactive"),
+) -> None:
+    # 必须是 async 依赖：和路由函数在同一个上下文里，contextvar 才能传到上游调度器
+    # 批量任务请带 X-Priority: batch，它们只能用非预留的那部分上游并发
+    set_request_class(client.name, x_priority, client.weight)
+
 
 router = APIRouter(
     prefix="/ai",
     tags=["ai"],
-    dependencies=[Depends(verify_api_key)],  # 继续沿用你现有的 X-API-Key 保护
+    # 继续沿用你现有的 X-API-Key 保护；AI 调用贵，单独一档限流
+    dependencies=[
+        Depends(verify_api_key),
+        Depends(rate_limit("ai")),
+        Depends(ai_request_class),
+    ],
 )
 
 
@@ -24,11 +45,58 @@ class RewriteIn(BaseModel):
     prompt_key: str = "rewrite_v1"
 
 
+class ToolSelectIn(BaseModel):
+    request: str = Field(..., min_length=1)
+
+
+class ToolSelectResp(ToolSelectOut):
+    source: str = Field(..., description="rules / tfidf / llm")
+    confidence: float
+
+
 @router.post("/summarize", response_model=SummaryOut)
-async def summarize_api(body: SummarizeIn):
-    return await summarize(content=body.content, prompt_key=body.prompt_key)
+async def summarize_api(body: SummarizeIn, request: Request):
+    from app.ai.ai_service import summarize
+
+    # 客户端中途断开就取消上游调用，不再为没人看的结果付 token
+    return await cancel_on_disconnect(
+        request, summarize(content=body.content, prompt_key=body.prompt_key), route="summarize"
+    )
 
 
 @router.post("/rewrite", response_model=RewriteOut)
-async def rewrite_api(body: RewriteIn):
-    return await rewrite(content=body.content, style=body.style, prompt_key=body.prompt_key)
+async def rewrite_api(body: RewriteIn, request: Request):
+    from app.ai.ai_service import rewrite
+
+    return await cancel_on_disconnect(
+        request,
+        rewrite(content=body.content, style=body.style, prompt_key=body.prompt_key),
+        route="rewrite",
+    )
+
+
+@router.get("/providers")
+def providers_api():
+    from app.ai.provider_pool import get_provider_pool
+
+    # 每个上游的 EWMA 延迟、错误率、failover 次数，方便排查“哪个 provider 在拖慢”
+    # scheduler：各优先级正在跑 / 排队中的上游调用数
+    return {"providers": get_provider_pool().snapshot(), "scheduler": get_scheduler().snapshot()}
+
+
+@router.post("/tool_select", response_model=ToolSelectResp)
+async def tool_select_api(body: ToolSelectIn, request: Request):
+    from app.ai.tool_select import get_tool_selector
+
+    d = await cancel_on_disconnect(
+        request, get_tool_selector().select(body.request), route="tool_select"
+    )
+    return ToolSelectResp(**d.out.model_dump(), source=d.source, confidence=d.confidence)
+
+
+@router.get("/tool_select/stats")
+def tool_select_stats_api():
+    from app.ai.tool_select import get_tool_selector
+
+    # fast_path_rate：本地规则/TF-IDF 直接答出的比例，越高省下的模型调用越多
+    return get_tool_selector().stats.snapshot()
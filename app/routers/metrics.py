@@ -0,0 +1,16 @@
+# app/routers/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import REGISTRY
+
+# Prometheus 抓取用：不走 X-API-Key（抓取器一般不带业务鉴权），也不进 OpenAPI 文档
+router = APIRouter(include_in_schema=False)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # 必须是 async：线程池相关的 gauge 只能在事件循环里读取
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,44 +1,114 @@
-from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Header, Query, Response
 from sqlalchemy.orm import Session
 
+from app.core.etag import (
+    etag_matches,
+    if_match_versions,
+    list_etag,
+    not_modified,
+    note_etag,
+    set_etag,
+)
 from app.db import get_db
-from app.schemas.notes import NoteCreate, NoteOut
-from app.security import verify_api_key
+from app.schemas.notes import NoteCreate, NoteOut, NoteSummaryOut
+from app.security import rate_limit, verify_api_key
 from app.services.notes_service import NotesService
+from app.services.summary_service import SummaryService
 
-# 给整个router加入鉴权依赖
-router = APIRouter(dependencies=[Depends(verify_api_key)])
+# 给整个router加入鉴权依赖 + 按 key 限流
+router = APIRouter(dependencies=[Depends(verify_api_key), Depends(rate_limit("notes"))])
 service = NotesService()
+summary_service = SummaryService()
 
 
 # Depends(get_db)是FastAPI的依赖注入，会自动执行get_db()，返回一个可用的session，并在结束时自动关闭
 @router.post("/notes", response_model=NoteOut)
-def create_note(payload: NoteCreate, db: Session = Depends(get_db)):
-    return service.create(db, payload)
+def create_note(payload: NoteCreate, response: Response, db: Session = Depends(get_db)):
+    note = service.create(db, payload)
+    set_etag(response, note_etag(note.id, note.version))
+    return note
 
 
 # 规定单次获取的数量、起点的下限
+# 时间窗口左闭右开（after <= t < before），ISO 8601；不带时区按 UTC 处理
 @router.get("/notes", response_model=list[NoteOut])
 def list_notes(
+    response: Response,
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
     sort: str = Query("created_at_desc"),
+    created_after: datetime | None = Query(None),
+    created_before: datetime | None = Query(None),
+    updated_after: datetime | None = Query(None),
+    updated_before: datetime | None = Query(None),
+    title_prefix: str | None = Query(None, min_length=1, max_length=200),
+    content_hash: str | None = Query(None, pattern="^[0-9a-f]{64}$"),
+    if_none_match: str | None = Header(None),
     db: Session = Depends(get_db),
 ):
-    return service.list(db, limit=limit, offset=offset, sort=sort)
+    filters = {
+        "created_after": created_after,
+        "created_before": created_before,
+        "updated_after": updated_after,
+        "updated_before": updated_before,
+        "title_prefix": title_prefix,
+        "content_hash": content_hash,
+    }
+    # 先读集合版本号再查数据：中间有写入时 ETag 只会偏旧（多一次 200），不会把新数据当成没变
+    # 同一个版本号也是列表页缓存的钥匙：别的 worker 写过，版本号变了，缓存跟着作废
+    version = service.collection_version(db)
+    etag = list_etag(version, limit=limit, offset=offset, sort=sort, filters=filters)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    notes = service.list(db, limit=limit, offset=offset, sort=sort, version=version, **filters)
+    set_etag(response, etag)
+    return notes
 
 
 @router.get("/notes/{note_id}", response_model=NoteOut)
-def get_note(note_id: int, db: Session = Depends(get_db)):
-    return service.get(db, note_id)
+def get_note(
+    note_id: int,
+    response: Response,
+    if_none_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    # 带了 If-None-Match 才先查一次版本号：命中就 304，不查正文、不序列化
+    if if_none_match:
+        version = service.version(db, note_id)
+        if version is not None and etag_matches(if_none_match, note_etag(note_id, version)):
+            return not_modified(note_etag(note_id, version))
+    note = service.get(db, note_id)
+    set_etag(response, note_etag(note.id, note.version))
+    return note
+
+
+# 摘要由后台任务生成并存库：这里只查库，不调用模型（status 说明是否最新）
+@router.get("/notes/{note_id}/summary", response_model=NoteSummaryOut)
+def get_note_summary(note_id: int, db: Session = Depends(get_db)):
+    return summary_service.get(db, note_id)
 
 
 @router.put("/notes/{note_id}", response_model=NoteOut)
-def update_note(note_id: int, payload: NoteCreate, db: Session = Depends(get_db)):
-    return service.update(db, note_id, payload)
+def update_note(
+    note_id: int,
+    payload: NoteCreate,
+    response: Response,
+    if_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    # If-Match：只有版本没变才更新，否则 412（乐观并发控制）
+    note = service.update(db, note_id, payload, if_versions=if_match_versions(if_match, note_id))
+    set_etag(response, note_etag(note.id, note.version))
+    return note
 
 
 @router.delete("/notes/{note_id}")
-def delete_note(note_id: int, db: Session = Depends(get_db)):
-    service.delete(db, note_id)
+def delete_note(
+    note_id: int,
+    if_match: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    service.delete(db, note_id, if_versions=if_match_versions(if_match, note_id))
     return {"deleted": True}
@@ -1,7 +1,10 @@
 from datetime import datetime
+from typing import Literal, Optional
 
 from pydantic import BaseModel
 
+from app.ai.output_schemas import SummaryOut
+
 # pydantic是FastAPI的数据校验器和数据模型
 
 
@@ -11,9 +14,28 @@ class NoteCreate(BaseModel):
     content: str
 
 
-# 规定“我们给用户返回的笔记长什么样(id\title\content\created_at)
+# 规定“我们给用户返回的笔记长什么样(id\title\content\created_at\updated_at\version)
+# version 每次更新 +1，和响应头里的 ETag 对应
+# content_hash 是正文的 sha256（hex）：客户端本地算一下，一样就不用再上传正文
+# （迁移回填完成之前的旧笔记可能还是 null）
 class NoteOut(BaseModel):
     id: int
     title: str
     content: str
     created_at: datetime
+    updated_at: datetime
+    version: int
+    content_hash: Optional[str] = None
+
+
+# 笔记摘要的读取结果：
+# - ready：摘要对应当前正文
+# - stale：正文改过了，summary 是旧正文的摘要，新的已在排队
+# - pending：还没有摘要，已在排队
+# - failed：当前正文的摘要生成失败（下次修改笔记会重试）
+# - unavailable：服务没开启摘要后台任务
+class NoteSummaryOut(BaseModel):
+    note_id: int
+    status: Literal["ready", "stale", "pending", "failed", "unavailable"]
+    summary: Optional[SummaryOut] = None
+    updated_at: Optional[datetime] = None
@@ -1,28 +1,33 @@
 import argparse
+import asyncio
+import hashlib
 import json
 import os
+import random
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional
 
 import httpx
 from dotenv import load_dotenv
 
+from app.ai.json_repair import parse_model_json
 from app.ai.output_schemas import SummaryOut
 from app.ai.prompt_render import render_prompt
+from app.scripts.stats import mean, percentile
 
 load_dotenv()
 
 
-def load_jsonl(path: str) -> list[dict[str, Any]]:
-    items = []
+def iter_jsonl(path: str) -> Iterator[dict[str, Any]]:
+    # 逐行读取：数据集再大也只占一行的内存
     with open(path, "r", encoding="utf-8") as f:
         for line in f:
             line = line.strip()
             if not line:
                 continue
-            items.append(json.loads(line))
-    return items
+            yield json.loads(line)
 
 
 def dump_jsonl(path: str, rows: list[dict[str, Any]]) -> None:
@@ -38,35 +43,6 @@ def looks_chinese(text: str) -> bool:
     return cn / max(len(text), 1) >= 0.2
 
 
-def strip_code_fence(s: str) -> str:
-    s = s.strip()
-    if s.startswith("```"):
-        # 去掉第一行 ```json / ``` 等
-        parts = s.split("\n", 1)
-        s = parts[1] if len(parts) > 1 else ""
-        # 去掉末尾 ```
-        if s.strip().endswith("```"):
-            s = s.strip()[:-3]
-    return s.strip()
-
-
-def extract_json_text(s: str) -> str:
-    """
-    兜底：如果模型没严格输出 JSON（比如前后夹杂文字），
-    尝试截取第一个 { 到最后一个 } 之间的内容。
-    """
-    s = strip_code_fence(s)
-    if not s:
-        return s
-    if s.lstrip().startswith("{") and s.rstrip().endswith("}"):
-        return s
-    la = s.find("{")
-    ra = s.rfind("}")
-    if la != -1 and ra != -1 and ra > la:
-        return s[la : ra + 1]
-    return s
-
-
 def call_model_stub(prompt: str) -> str:
     return json.dumps(
         {"summary": "这是一段中文摘要。", "bullets": ["要点一", "要点二"]},
@@ -74,9 +50,56 @@ def call_model_stub(prompt: str) -> str:
     )
 
 
-def call_model_real(
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "Output MUST be valid JSON only. "
+    "All JSON string values MUST be in Simplified Chinese."
+)
+
+
+def build_payload(
+    prompt: str, *, model: str, temperature: float, max_tokens: int, use_response_format: bool
+) -> dict[str, Any]:
+    payload: dict[str, Any] = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": False,
+    }
+    if use_response_format:
+        payload["response_format"] = {"type": "json_object"}
+    return payload
+
+
+def extract_content(data: dict[str, Any]) -> str:
+    msg = (data.get("choices") or [{}])[0].get("message") or {}
+    # 有些推理模型会额外带 reasoning_content，但我们只需要 content
+    # （你的 prompt 要求输出 JSON，因此 content 应该就是 JSON）
+    return msg.get("content") or ""
+
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+
+def new_call_meta() -> dict[str, Any]:
+    # 一次“逻辑调用”的开销：所有重试的耗时与 token 都算进去（每次重试都是真金白银）
+    return {"latency_ms": 0.0, "attempts": 0, "usage": dict.fromkeys(USAGE_FIELDS, 0)}
+
+
+def add_usage(meta: dict[str, Any], data: dict[str, Any]) -> None:
+    usage = data.get("usage") or {}
+    for k in USAGE_FIELDS:
+        meta["usage"][k] += int(usage.get(k) or 0)
+
+
+async def call_model_real_async(
     prompt: str,
     *,
+    client: httpx.AsyncClient,
     api_key: str,
     base_url: str,
     model: str,
@@ -85,60 +108,45 @@ def call_model_real(
     timeout_s: float = 60.0,
     use_response_format: bool = True,
     retry: int = 1,
+    meta: Optional[dict[str, Any]] = None,
 ) -> str:
     """
-    SiliconFlow OpenAI 兼容接口：
-    POST {base_url}/chat/completions
-    Header: Authorization: Bearer <API_KEY> :contentReference[oaicite:3]{index=3}
-
-    说明：
-    - use_response_format=True 会带上 response_format（SiliconFlow 文档列出了该字段）:
-    - - contentReference[oaicite:4]{index=4}
-    - 如果遇到 400（有些模型/网关不支持该字段），会自动降级重试一次：去掉 response_format
+    SiliconFlow OpenAI 兼容接口：POST {base_url}/chat/completions，Bearer 鉴权
+    - 复用调用方传入的 AsyncClient 连接池
+    - use_response_format=True 会带上 response_format；遇到 400（有些模型/网关不支持该字段）
+      自动降级：去掉 response_format 再试
+    - 传入 meta（new_call_meta()）时，累计记录耗时、尝试次数和上游 usage
     """
     if not api_key:
         raise RuntimeError("DEEPSEEK_API_KEY is not set")
 
     url = base_url.rstrip("/") + "/chat/completions"
-
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
-
-    payload: dict[str, Any] = {
-        "model": model,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a helpful assistant. "
-                    "Output MUST be valid JSON only. "
-                    "All JSON string values MUST be in Simplified Chinese."
-                ),
-            },
-            {"role": "user", "content": prompt},
-        ],
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "stream": False,
-    }
-
-    if use_response_format:
-        payload["response_format"] = {"type": "json_object"}
+    payload = build_payload(
+        prompt,
+        model=model,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        use_response_format=use_response_format,
+    )
 
     last_err: Optional[str] = None
+    meta = new_call_meta() if meta is None else meta
 
     for attempt in range(retry + 1):
-        # t0 = time.perf_counter()
+        t0 = time.perf_counter()
+        meta["attempts"] += 1
         try:
-            with httpx.Client(timeout=timeout_s) as client:
-                resp = client.post(url, headers=headers, json=payload)
-            # dt_ms = (time.perf_counter() - t0) * 1000
+            try:
+                resp = await client.post(url, headers=headers, json=payload, timeout=timeout_s)
+            finally:
+                meta["latency_ms"] += (time.perf_counter() - t0) * 1000
 
             if resp.status_code >= 400:
                 last_err = f"HTTP {resp.status_code}: {resp.text[:300]}"
-                # 如果是 response_format 导致的 400，降级再试
                 if use_response_format and resp.status_code == 400:
                     payload.pop("response_format", None)
                     use_response_format = False
@@ -147,18 +155,14 @@ def call_model_real(
                 raise RuntimeError(last_err)
 
             data = resp.json()
-            msg = (data.get("choices") or [{}])[0].get("message") or {}
-            content = msg.get("content") or ""
-
-            # 有些推理模型会额外带 reasoning_content，但我们只需要 content
-            # （你的 prompt 要求输出 JSON，因此 content 应该就是 JSON）
+            add_usage(meta, data)
+            content = extract_content(data)
             if not content.strip():
                 last_err = "Empty content"
                 if attempt < retry:
                     continue
                 raise RuntimeError(last_err)
 
-            # 这里返回“原始文本”，下游统一 json.loads + schema 校验
             return content
 
         except Exception as e:
@@ -170,89 +174,327 @@ def call_model_real(
     raise RuntimeError(last_err or "Unknown error")
 
 
-def evaluate_summarize(
-    items: list[dict[str, Any]],
-    prompt_key: str,
-    mode: str,
-    *,
-    api_key: str,
-    base_url: str,
-    model: str,
-) -> tuple[list[dict], dict]:
-    rows = []
-    parse_ok = 0
-    total = 0
-    total_summary_len = 0
-    empty_bullets = 0
-    chinese_ok = 0
+def prompt_hash(prompt: str) -> str:
+    # 对渲染后的完整 prompt 取 hash：模板或笔记内容任一变化，都视为“新的一次调用”
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
 
-    for it in items:
-        total += 1
-        note_id = it.get("id")
-        content = it.get("content", "")
 
-        prompt = render_prompt(prompt_key, content=content)
+def row_key(row: dict[str, Any]) -> tuple[str, str, str]:
+    return (str(row.get("note_id")), row.get("prompt_key") or "", row.get("prompt_hash") or "")
 
-        ok = False
-        parsed = None
-        err = None
-        raw = ""
 
-        try:
-            if mode == "stub":
-                raw = call_model_stub(prompt)
-            else:
-                raw = call_model_real(
-                    prompt,
-                    api_key=api_key,
-                    base_url=base_url,
-                    model=model,
-                    temperature=0.2,
-                    max_tokens=800,
-                    timeout_s=90.0,
-                    use_response_format=True,
-                    retry=1,
-                )
+def is_done(row: dict[str, Any]) -> bool:
+    # 拿到了模型输出就算“付过费”（即使解析失败也是有效的评测结果）；
+    # 网络错误/HTTP 错误这类没有 raw 的行，续跑时需要重新调用
+    return bool(row.get("raw"))
 
-            raw_json_text = extract_json_text(raw)
-            data = json.loads(raw_json_text)
-            parsed_obj = SummaryOut.model_validate(data)
-            parsed = parsed_obj.model_dump()
-            ok = True
 
+def build_row(
+    note_id: Any, prompt_key: str, raw: str, err: Optional[str], **extra: Any
+) -> dict[str, Any]:
+    """把一次模型输出解析成一行结果。"""
+    ok = False
+    parsed = None
+    if err is None:
+        try:
+            # 和线上 DeepSeekClient 用同一套本地修复，评测结果才和线上一致
+            data, _ = parse_model_json(raw)
+            parsed = SummaryOut.model_validate(data).model_dump()
+            ok = True
         except Exception as e:
             err = str(e)
 
-        if ok:
-            parse_ok += 1
-            summary_text = parsed.get("summary", "")
-            total_summary_len += len(summary_text)
-            if not parsed.get("bullets"):
-                empty_bullets += 1
-            joined = summary_text + " " + " ".join(parsed.get("bullets", []))
-            if looks_chinese(joined):
-                chinese_ok += 1
-
-        rows.append(
-            {
-                "note_id": note_id,
-                "prompt_key": prompt_key,
-                "ok": ok,
-                "error": err,
-                "raw": raw,
-                "parsed": parsed,
-            }
-        )
+    return {
+        "note_id": note_id,
+        "prompt_key": prompt_key,
+        "ok": ok,
+        "error": err,
+        "raw": raw,
+        "parsed": parsed,
+        **extra,
+    }
 
-    metrics = {
+
+def compute_metrics(
+    prompt_key: str,
+    rows: list[dict[str, Any]],
+    *,
+    price_in: float = 0.0,
+    price_out: float = 0.0,
+) -> dict[str, Any]:
+    """
+    price_in / price_out：每百万 prompt / completion token 的价格（与厂商报价单位一致），
+    用来估算本次评测的花费；不传就是 0。
+    """
+    total = len(rows)
+    parse_ok = 0
+    total_summary_len = 0
+    empty_bullets = 0
+    chinese_ok = 0
+
+    for r in rows:
+        if not r["ok"]:
+            continue
+        parsed = r["parsed"]
+        parse_ok += 1
+        summary_text = parsed.get("summary", "")
+        total_summary_len += len(summary_text)
+        if not parsed.get("bullets"):
+            empty_bullets += 1
+        joined = summary_text + " " + " ".join(parsed.get("bullets", []))
+        if looks_chinese(joined):
+            chinese_ok += 1
+
+    # 旧格式的行没有计量字段，跳过即可
+    metered = [r for r in rows if r.get("attempts")]
+    latencies = [r["latency_ms"] for r in metered]
+    attempts = [r["attempts"] for r in metered]
+    usage = {k: sum(r["usage"][k] for r in metered) for k in USAGE_FIELDS}
+    cost = (usage["prompt_tokens"] * price_in + usage["completion_tokens"] * price_out) / 1e6
+
+    return {
         "prompt_key": prompt_key,
         "total": total,
         "parse_success_rate": parse_ok / total if total else 0.0,
         "avg_summary_len": (total_summary_len / parse_ok) if parse_ok else 0.0,
         "empty_bullets_rate": (empty_bullets / parse_ok) if parse_ok else 0.0,
         "chinese_rate": (chinese_ok / parse_ok) if parse_ok else 0.0,
+        "latency_ms": {
+            "mean": round(mean(latencies), 1),
+            "p50": round(percentile(latencies, 50), 1),
+            "p95": round(percentile(latencies, 95), 1),
+            "p99": round(percentile(latencies, 99), 1),
+        },
+        "avg_attempts": mean(attempts),
+        "retry_rate": (sum(1 for a in attempts if a > 1) / len(attempts)) if attempts else 0.0,
+        "tokens_per_item": {k: mean([r["usage"][k] for r in metered]) for k in USAGE_FIELDS},
+        "tokens_total": usage,
+        "estimated_cost": round(cost, 6),
+        "estimated_cost_per_item": round(cost / len(metered), 8) if metered else 0.0,
+    }
+
+
+def paired_bootstrap(
+    a: list[float],
+    b: list[float],
+    stat=mean,
+    *,
+    n_boot: int = 2000,
+    seed: int = 0,
+    alpha: float = 0.05,
+) -> dict[str, Any]:
+    """
+    配对 bootstrap：同一条笔记的 A、B 成对重采样，估计 stat(A) - stat(B) 的置信区间。
+    区间不含 0 就认为差异显著（默认 95%）。固定 seed，结果可复现。
+    """
+    n = len(a)
+    if n == 0:
+        return {"diff": 0.0, "ci_low": 0.0, "ci_high": 0.0, "significant": False, "n": 0}
+    rng = random.Random(seed)
+    diffs = []
+    for _ in range(n_boot):
+        idx = [rng.randrange(n) for _ in range(n)]
+        diffs.append(stat([a[i] for i in idx]) - stat([b[i] for i in idx]))
+    low = percentile(diffs, 100 * alpha / 2)
+    high = percentile(diffs, 100 * (1 - alpha / 2))
+    return {
+        "diff": round(stat(a) - stat(b), 4),
+        "ci_low": round(low, 4),
+        "ci_high": round(high, 4),
+        "significant": low > 0 or high < 0,
+        "n": n,
+    }
+
+
+def compare_ab(
+    rows_a: list[dict[str, Any]], rows_b: list[dict[str, Any]], **kwargs: Any
+) -> dict[str, Any]:
+    """按 index 配对 A/B，输出 A−B 的差值及 bootstrap 置信区间。"""
+    by_index_b = {r.get("index"): r for r in rows_b}
+    pairs = [(r, by_index_b[r.get("index")]) for r in rows_a if r.get("index") in by_index_b]
+
+    def p95(xs: list[float]) -> float:
+        return percentile(xs, 95)
+
+    metered = [(ra, rb) for ra, rb in pairs if ra.get("attempts") and rb.get("attempts")]
+    lat_a = [ra["latency_ms"] for ra, _ in metered]
+    lat_b = [rb["latency_ms"] for _, rb in metered]
+    return {
+        "parse_success_rate": paired_bootstrap(
+            [float(ra["ok"]) for ra, _ in pairs], [float(rb["ok"]) for _, rb in pairs], **kwargs
+        ),
+        "latency_ms_mean": paired_bootstrap(lat_a, lat_b, **kwargs),
+        "latency_ms_p95": paired_bootstrap(lat_a, lat_b, p95, **kwargs),
+        "total_tokens_per_item": paired_bootstrap(
+            [ra["usage"]["total_tokens"] for ra, _ in metered],
+            [rb["usage"]["total_tokens"] for _, rb in metered],
+            **kwargs,
+        ),
+        "attempts_per_item": paired_bootstrap(
+            [ra["attempts"] for ra, _ in metered], [rb["attempts"] for _, rb in metered], **kwargs
+        ),
     }
-    return rows, metrics
+
+
+MODEL_KWARGS = {
+    "temperature": 0.2,
+    "max_tokens": 800,
+    "timeout_s": 90.0,
+    "use_response_format": True,
+    "retry": 1,
+}
+
+
+def load_done_rows(
+    paths: Iterable[Path], *, model: str, prompt_keys: set[str]
+) -> dict[tuple[str, str, str], dict[str, Any]]:
+    """
+    从已有的 A/B.jsonl 里收集“已完成”的结果，key = (note_id, prompt_key, prompt_hash)。
+    只认同一个 model 的结果；旧格式（没有 prompt_hash）的行会被忽略。
+    """
+    done: dict[tuple[str, str, str], dict[str, Any]] = {}
+    for path in paths:
+        if not path.exists():
+            continue
+        for row in iter_jsonl(str(path)):
+            if (
+                row.get("model") == model
+                and row.get("prompt_key") in prompt_keys
+                and row.get("prompt_hash")
+                and is_done(row)
+            ):
+                done[row_key(row)] = row
+    return done
+
+
+class ResultAppender:
+    """
+    每完成一条笔记就把 A、B 两行追加到 A/B.jsonl 并 flush：崩溃时最多丢在途的几条。
+    并发执行时按完成顺序写，文件里的行序是乱的；结束后 compact_results 按 index 排回输入顺序。
+    """
+
+    def __init__(self, path_a: Path, path_b: Path):
+        self._files = (path_a.open("a", encoding="utf-8"), path_b.open("a", encoding="utf-8"))
+
+    def put(self, row_a: dict[str, Any], row_b: dict[str, Any]) -> None:
+        for f, row in zip(self._files, (row_a, row_b)):
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def close(self) -> None:
+        for f in self._files:
+            f.close()
+
+
+async def evaluate_ab_async(
+    items: Iterable[dict[str, Any]],
+    prompt_a: str,
+    prompt_b: str,
+    mode: str,
+    *,
+    api_key: str,
+    base_url: str,
+    model: str,
+    concurrency: int = 8,
+    done: Optional[dict[tuple[str, str, str], dict[str, Any]]] = None,
+    on_pair: Optional[Any] = None,
+) -> dict[str, int]:
+    """
+    asyncio 执行：
+    - 全程一个 AsyncClient（连接池大小 = concurrency），不再每次调用都握手
+    - 同一条笔记的 A、B 同时发出，两边看到的是同一时刻的上游状况
+    - semaphore 限制同时在途的模型调用数；输入按需读取，在途的笔记数也有上限
+    - done 里已有结果的 (note_id, prompt_key, prompt_hash) 直接复用，不再调用模型
+    - 每条笔记完成后回调 on_pair(index, row_a, row_b)，由调用方决定如何落盘
+    """
+    done = done or {}
+    run_model = "stub" if mode == "stub" else model
+    sem = asyncio.Semaphore(concurrency)
+    window = asyncio.Semaphore(concurrency * 4)
+    counts = {"items": 0, "calls": 0, "reused": 0}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits) as client:
+
+        async def run_one(index: int, it: dict[str, Any], prompt_key: str) -> dict[str, Any]:
+            prompt = render_prompt(prompt_key, content=it.get("content", ""))
+            extra = {"index": index, "prompt_hash": prompt_hash(prompt), "model": run_model}
+            cached = done.get((str(it.get("id")), prompt_key, extra["prompt_hash"]))
+            if cached is not None:
+                counts["reused"] += 1
+                return {**cached, "index": index}
+
+            raw = ""
+            err = None
+            meta = new_call_meta()
+            async with sem:
+                counts["calls"] += 1
+                try:
+                    if mode == "stub":
+                        meta["attempts"] = 1
+                        raw = call_model_stub(prompt)
+                    else:
+                        raw = await call_model_real_async(
+                            prompt,
+                            client=client,
+                            api_key=api_key,
+                            base_url=base_url,
+                            model=model,
+                            meta=meta,
+                            **MODEL_KWARGS,
+                        )
+                except Exception as e:
+                    err = str(e)
+            meta["latency_ms"] = round(meta["latency_ms"], 1)
+            return build_row(it.get("id"), prompt_key, raw, err, **extra, **meta)
+
+        async def run_pair(index: int, it: dict[str, Any]) -> None:
+            try:
+                results = await asyncio.gather(
+                    run_one(index, it, prompt_a),
+                    run_one(index, it, prompt_b),
+                    return_exceptions=True,
+                )
+                # run_one 自己出错（比如渲染 prompt 失败）也写一行错误结果：这条照样落盘，
+                # 续跑时没有 raw 的行会被重新执行
+                row_a, row_b = (
+                    build_row(it.get("id"), key, "", repr(r), index=index, model=run_model)
+                    if isinstance(r, Exception)
+                    else r
+                    for key, r in zip((prompt_a, prompt_b), results)
+                )
+                if on_pair is not None:
+                    on_pair(index, row_a, row_b)
+            finally:
+                # 这一条已经交给 on_pair 落盘，才让出窗口给下一条
+                window.release()
+
+        tasks = set()
+        for index, it in enumerate(items):
+            await window.acquire()
+            counts["items"] += 1
+            task = asyncio.create_task(run_pair(index, it))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        while tasks:
+            await asyncio.gather(*tasks)
+
+    return counts
+
+
+def compact_results(path: Path) -> list[dict[str, Any]]:
+    """
+    整理输出文件：同一条（index, prompt_key）只保留最后一次结果，按输入顺序重写。
+    运行时按完成顺序追加、续跑把重试的行追加在文件末尾，这里把它们放回原位。
+    """
+    latest: dict[Any, dict[str, Any]] = {}
+    for row in iter_jsonl(str(path)):
+        latest[(row.get("index"), row.get("prompt_key"))] = row
+    rows = sorted(latest.values(), key=lambda r: r.get("index", 0))
+    tmp = path.with_suffix(".jsonl.tmp")
+    dump_jsonl(str(tmp), rows)
+    os.replace(tmp, path)
+    return rows
 
 
 def main():
@@ -261,36 +503,112 @@ def main():
     parser.add_argument("--prompt_a", default="summarize_v1")
     parser.add_argument("--prompt_b", default="summarize_v1b")
     parser.add_argument("--mode", choices=["stub", "real"], default="real")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="同时在途的模型调用数；1 即串行执行",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="OUT_DIR",
+        help="继续一次中断的评测：沿用该目录的 run.json 参数，跳过已完成的条目",
+    )
+    parser.add_argument(
+        "--price_in", type=float, default=0.0, help="每百万 prompt token 的价格，用于估算花费"
+    )
+    parser.add_argument(
+        "--price_out", type=float, default=0.0, help="每百万 completion token 的价格"
+    )
+    parser.add_argument("--bootstrap", type=int, default=2000, help="bootstrap 重采样次数")
+    parser.add_argument(
+        "--no-reuse",
+        action="store_true",
+        help="不复用 outputs/ 下历史评测中相同 prompt 的结果，全部重新调用模型",
+    )
     args = parser.parse_args()
 
     api_key = os.getenv("DEEPSEEK_API_KEY") or ""
     base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.siliconflow.cn/v1")
     model = os.getenv("DEEPSEEK_MODEL", "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B")
 
-    items = load_jsonl(args.data)
-
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_dir = Path("outputs") / f"ab_{ts}"
-    out_dir.mkdir(parents=True, exist_ok=True)
+    if args.resume:
+        out_dir = Path(args.resume)
+        run = json.loads((out_dir / "run.json").read_text(encoding="utf-8"))
+        args.data, args.prompt_a, args.prompt_b, args.mode = (
+            run["data"],
+            run["prompt_a"],
+            run["prompt_b"],
+            run["mode"],
+        )
+        model = run["model"]
+    else:
+        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+        out_dir = Path("outputs") / f"ab_{ts}"
+        out_dir.mkdir(parents=True, exist_ok=True)
+        run = {
+            "data": args.data,
+            "prompt_a": args.prompt_a,
+            "prompt_b": args.prompt_b,
+            "mode": args.mode,
+            "model": model,
+        }
+        (out_dir / "run.json").write_text(
+            json.dumps(run, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
 
-    rows_a, metrics_a = evaluate_summarize(
-        items, args.prompt_a, args.mode, api_key=api_key, base_url=base_url, model=model
-    )
-    rows_b, metrics_b = evaluate_summarize(
-        items, args.prompt_b, args.mode, api_key=api_key, base_url=base_url, model=model
+    path_a, path_b = out_dir / "A.jsonl", out_dir / "B.jsonl"
+    sources = [path_a, path_b]
+    if not args.no_reuse:
+        sources = [*sorted(Path("outputs").glob("ab_*/[AB].jsonl")), *sources]
+    done = load_done_rows(
+        dict.fromkeys(sources),
+        model="stub" if args.mode == "stub" else model,
+        prompt_keys={args.prompt_a, args.prompt_b},
     )
 
-    dump_jsonl(str(out_dir / "A.jsonl"), rows_a)
-    dump_jsonl(str(out_dir / "B.jsonl"), rows_b)
+    appender = ResultAppender(path_a, path_b)
+    try:
+        counts = asyncio.run(
+            evaluate_ab_async(
+                iter_jsonl(args.data),
+                args.prompt_a,
+                args.prompt_b,
+                args.mode,
+                api_key=api_key,
+                base_url=base_url,
+                model=model,
+                concurrency=max(args.concurrency, 1),
+                done=done,
+                # 行里自带 index，追加时用不到下标
+                on_pair=lambda index, row_a, row_b: appender.put(row_a, row_b),
+            )
+        )
+    finally:
+        appender.close()
+
+    rows_a = compact_results(path_a)
+    rows_b = compact_results(path_b)
+    prices = {"price_in": args.price_in, "price_out": args.price_out}
+    metrics_a = compute_metrics(args.prompt_a, rows_a, **prices)
+    metrics_b = compute_metrics(args.prompt_b, rows_b, **prices)
+    diff = compare_ab(rows_a, rows_b, n_boot=args.bootstrap)
 
     with open(out_dir / "metrics.json", "w", encoding="utf-8") as f:
-        json.dump({"A": metrics_a, "B": metrics_b}, f, ensure_ascii=False, indent=2)
+        json.dump(
+            {"A": metrics_a, "B": metrics_b, "A_minus_B": diff}, f, ensure_ascii=False, indent=2
+        )
 
     print("=== A metrics ===")
     print(json.dumps(metrics_a, ensure_ascii=False, indent=2))
     print("=== B metrics ===")
     print(json.dumps(metrics_b, ensure_ascii=False, indent=2))
-    print(f"\nSaved results to: {out_dir}")
+    print("=== A - B (paired bootstrap 95% CI) ===")
+    for name, d in diff.items():
+        flag = "  <-- significant" if d["significant"] else ""
+        print(f"{name}: {d['diff']:+.3f} [{d['ci_low']:+.3f}, {d['ci_high']:+.3f}]{flag}")
+    print(f"\nitems={counts['items']} model_calls={counts['calls']} reused={counts['reused']}")
+    print(f"Saved results to: {out_dir}")
 
 
 if __name__ == "__main__":
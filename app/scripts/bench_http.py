@@ -0,0 +1,306 @@
+"""
+HTTP benchmark：进程内（httpx.ASGITransport）对真实 app 打请求，衡量 NotesService / 路由的快慢
+- 临时 SQLite 库，先灌 --seed 条笔记
+- notes：create / get / list_shallow（offset=0）/ list_deep（offset 接近末尾）/ update / delete
+- ai：summarize / rewrite / tool_select，上游换成本地桩（可用 --ai_latency_ms 模拟模型耗时）
+- 每个场景输出吞吐（req/s）和 p50/p99 延迟；限流在跑的时候关掉
+
+用法：
+  python -m app.scripts.bench_http --save outputs/bench/http_baseline.json
+  python -m app.scripts.bench_http --compare outputs/bench/http_baseline.json
+  # 每个场景跑 --repeat 轮取 p50 最好的一轮（第一轮顺便预热，也压住机器抖动）
+  # p50 变慢或吞吐下降超过 --threshold（默认 15%）记为回归，退出码为 1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import security, settings
+from app.ai import provider_pool
+from app.db import Base, get_db
+from app.models import Note
+from app.scripts.stats import percentile
+
+NOTES_SCENARIOS = ["create", "get", "list_shallow", "list_deep", "update", "delete"]
+AI_SCENARIOS = ["ai_summarize", "ai_rewrite", "ai_tool_select"]
+
+
+class StubModelClient:
+    """
+    替身上游：和 ProviderPool.chat_json 同签名，直接返回能通过所有输出合同的 JSON
+    （多余字段 pydantic 会忽略），只测我们自己的开销
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_s = latency_ms / 1000
+
+    async def chat_json(self, user_prompt: str, **kwargs: Any) -> dict[str, Any]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return {
+            "summary": "stub summary",
+            "bullets": ["a", "b"],
+            "rewritten": "stub rewrite",
+            "style": "formal",
+            "tool_name": "search_notes",
+            "args": {"query": "stub"},
+        }
+
+
+@contextmanager
+def bench_env(app, seed: int, ai_latency_ms: float):
+    """临时库 + 关限流 + 替身上游；退出时全部还原，不影响同进程里的其它代码（比如测试）。"""
+    tmp = tempfile.mkdtemp(prefix="bench_http_")
+    engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    with SessionLocal() as db:
+        db.add_all(Note(title=f"note {i}", content=f"content {i} " * 20) for i in range(seed))
+        db.commit()
+
+    def bench_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    saved = {
+        "override": app.dependency_overrides.get(get_db),
+        "api_key": settings.API_KEY,
+        "ai_rps": settings.RATE_LIMIT_AI_RPS,
+        "notes_rps": settings.RATE_LIMIT_NOTES_RPS,
+        "pool": provider_pool._pool,
+    }
+    app.dependency_overrides[get_db] = bench_get_db
+    settings.API_KEY = settings.API_KEY or "bench-key"
+    settings.RATE_LIMIT_AI_RPS = 0
+    settings.RATE_LIMIT_NOTES_RPS = 0
+    security._keys = None  # 按新的限流配置重新加载
+    provider_pool._pool = StubModelClient(ai_latency_ms)
+    try:
+        yield settings.API_KEY
+    finally:
+        if saved["override"] is None:
+            app.dependency_overrides.pop(get_db, None)
+        else:
+            app.dependency_overrides[get_db] = saved["override"]
+        settings.API_KEY = saved["api_key"]
+        settings.RATE_LIMIT_AI_RPS = saved["ai_rps"]
+        settings.RATE_LIMIT_NOTES_RPS = saved["notes_rps"]
+        security._keys = None
+        provider_pool._pool = saved["pool"]
+        engine.dispose()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def build_scenarios(
+    seed: int, rng: random.Random, created: list[int]
+) -> dict[str, Callable[[int], tuple]]:
+    """场景名 -> f(i) 返回 (method, url, json body)；created 是 create 场景新建的 id。"""
+    ids = list(range(1, seed + 1))
+
+    def note_body(i: int) -> dict[str, str]:
+        return {"title": f"bench {i}", "content": "lorem ipsum " * 20}
+
+    return {
+        "create": lambda i: ("POST", "/v1/notes", note_body(i)),
+        "get": lambda i: ("GET", f"/v1/notes/{rng.choice(ids)}", None),
+        "list_shallow": lambda i: ("GET", "/v1/notes?limit=20&offset=0", None),
+        "list_deep": lambda i: ("GET", f"/v1/notes?limit=20&offset={max(0, seed - 20)}", None),
+        "update": lambda i: ("PUT", f"/v1/notes/{rng.choice(ids)}", note_body(i)),
+        # 只删 create 阶段新建的，灌进去的数据保持不变，后面的场景结果可比
+        "delete": lambda i: ("DELETE", f"/v1/notes/{created.pop()}", None),
+        "ai_summarize": lambda i: ("POST", "/ai/summarize", {"content": "lorem ipsum " * 50}),
+        "ai_rewrite": lambda i: (
+            "POST",
+            "/ai/rewrite",
+            {"content": "lorem ipsum " * 50, "style": "formal"},
+        ),
+        "ai_tool_select": lambda i: ("POST", "/ai/tool_select", {"request": f"搜索笔记 {i}"}),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    make: Callable[[int], tuple],
+    n: int,
+    concurrency: int,
+    on_response: Callable[[httpx.Response], None] | None = None,
+) -> dict[str, float]:
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(n))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, body = make(i)
+            t0 = time.perf_counter()
+            resp = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if resp.status_code >= 400:
+                errors += 1
+            elif on_response is not None:
+                on_response(resp)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    return {
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / wall, 1) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+async def run_suite(
+    app,
+    *,
+    seed: int = 1000,
+    requests: int = 200,
+    concurrency: int = 1,
+    scenarios: list[str] | None = None,
+    ai_latency_ms: float = 0.0,
+    repeat: int = 1,
+    rng: random.Random | None = None,
+) -> dict[str, dict[str, float]]:
+    scenarios = scenarios or NOTES_SCENARIOS + AI_SCENARIOS
+    rng = rng or random.Random(0)
+    results: dict[str, dict[str, float]] = {}
+    with bench_env(app, seed, ai_latency_ms) as api_key:
+        created: list[int] = []
+        makers = build_scenarios(seed, rng, created)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", headers={"X-API-Key": api_key}
+        ) as client:
+            for name in scenarios:
+                n = requests
+                on_response = None
+                if name == "create":
+                    on_response = lambda r: created.append(r.json()["id"])  # noqa: E731
+                runs = []
+                for _ in range(repeat):
+                    if name == "delete":
+                        n = min(requests, len(created))  # 没跑 create 就没东西可删
+                    runs.append(
+                        await run_scenario(client, makers[name], n, concurrency, on_response)
+                    )
+                results[name] = min(runs, key=lambda r: r["p50_ms"])
+    return results
+
+
+def compare(
+    current: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float
+) -> list[str]:
+    """p50 变慢或吞吐下降超过 threshold（比例）的场景，返回可读的说明。"""
+    regressions = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p50_ms"] and cur["p50_ms"] > base["p50_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p50 {base['p50_ms']:.3f}ms -> {cur['p50_ms']:.3f}ms")
+        if base["rps"] and cur["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: rps {base['rps']:.1f} -> {cur['rps']:.1f}")
+    return regressions
+
+
+def print_table(results: dict[str, dict[str, float]], baseline: dict | None = None) -> None:
+    print(f"{'scenario':<16}{'rps':>10}{'p50_ms':>10}{'p99_ms':>10}{'errors':>8}  vs baseline p50")
+    for name, r in results.items():
+        delta = ""
+        base = (baseline or {}).get(name)
+        if base and base["p50_ms"]:
+            delta = f"{(r['p50_ms'] / base['p50_ms'] - 1) * 100:+.1f}%"
+        print(
+            f"{name:<16}{r['rps']:>10.1f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+            f"{r['errors']:>8}  {delta}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=5000, help="notes in the table before running")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenarios", default="", help="comma separated; default: all")
+    parser.add_argument("--ai_latency_ms", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, best p50 kept")
+    parser.add_argument("--save", default="", help="write results as a baseline JSON")
+    parser.add_argument("--compare", default="", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    from app.main import app
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()] or None
+    config = {
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ai_latency_ms": args.ai_latency_ms,
+        "repeat": args.repeat,
+    }
+    results = asyncio.run(
+        run_suite(
+            app,
+            seed=args.seed,
+            requests=args.requests,
+            concurrency=args.concurrency,
+            scenarios=scenarios,
+            ai_latency_ms=args.ai_latency_ms,
+            repeat=args.repeat,
+        )
+    )
+
+    baseline = None
+    if args.compare:
+        saved = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if saved.get("config") != config:
+            print(f"warning: baseline config differs: {saved.get('config')} vs {config}")
+        baseline = saved["results"]
+
+    print(json.dumps(config, ensure_ascii=False))
+    print_table(results, baseline)
+
+    if args.save:
+        out = Path(args.save)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "config": config,
+            "results": results,
+        }
+        out.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"saved baseline -> {out}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nREGRESSIONS (> {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+日志吞吐 benchmark：模拟 stdout 管道很慢（每次写入卡 --stall_ms），
+在事件循环里连续打 N 条 request 日志，测量协程侧每条日志的耗时与丢弃数。
+
+用法：python -m app.scripts.bench_logging --records 50000 --stall_ms 1
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import sys
+import time
+
+from app import settings
+from app.core import logging as app_logging
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, stall_s: float):
+        super().__init__()
+        self.stall_s = stall_s
+
+    def write(self, s: str) -> int:
+        time.sleep(self.stall_s)
+        return len(s)
+
+
+async def emit(n: int) -> float:
+    logger = logging.getLogger("request")
+    t0 = time.perf_counter()
+    for i in range(n):
+        logger.info("%s %s -> %s (%.1fms)", "GET", "/v1/notes", 200, 1.0)
+        if i % 1000 == 0:
+            await asyncio.sleep(0)  # 给其它协程让出事件循环，模拟真实请求
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--stall_ms", type=float, default=1.0)
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    args = parser.parse_args()
+
+    settings.LOG_FORMAT = args.format
+    sys.stdout = SlowStream(args.stall_ms / 1000)
+    app_logging.setup_logging()
+    try:
+        elapsed = asyncio.run(emit(args.records))
+    finally:
+        dropped = app_logging.LOG_DROPPED.value()
+        sys.stdout = sys.__stdout__
+
+    print(f"records={args.records} loop_time={elapsed * 1000:.1f}ms")
+    print(f"per_record={elapsed / args.records * 1e6:.2f}us ({args.records / elapsed:,.0f}/s)")
+    print(f"dropped={dropped:.0f} (queue size {settings.LOG_QUEUE_SIZE})")
+    # 不等后台线程把慢 stdout 写完
+    app_logging._listener = None
+
+
+if __name__ == "__main__":
+    main()
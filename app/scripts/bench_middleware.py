@@ -0,0 +1,91 @@
+"""
+中间件开销 micro-benchmark：同一个最小 app，分别挂
+- none：不挂中间件（基线）
+- decorator：旧写法 @app.middleware("http")（BaseHTTPMiddleware）
+- asgi：app/core/middleware.py 里的纯 ASGI 实现
+在进程内通过 ASGITransport 打 N 次请求，输出每个请求的平均耗时和相对基线的额外开销。
+
+用法：python -m app.scripts.bench_middleware --requests 5000
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.core.middleware import JsonUtf8Middleware, RequestLogMiddleware
+
+
+async def legacy_ensure_json_utf8(request, call_next):
+    response = await call_next(request)
+    ct = response.headers.get("content-type", "")
+    if ct.startswith("application/json") and "charset=" not in ct.lower():
+        response.headers["content-type"] = "application/json; charset=utf-8"
+    return response
+
+
+async def legacy_log_requests(request, call_next):
+    start = time.perf_counter()
+    response = None
+    try:
+        response = await call_next(request)
+        return response
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        status_code = getattr(response, "status_code", 500)
+        logging.getLogger("request").info(
+            "%s %s -> %s (%.1fms)", request.method, request.url.path, status_code, duration_ms
+        )
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if variant == "decorator":
+        app.middleware("http")(legacy_ensure_json_utf8)
+        app.middleware("http")(legacy_log_requests)
+    elif variant == "asgi":
+        app.add_middleware(JsonUtf8Middleware)
+        app.add_middleware(RequestLogMiddleware)
+    return app
+
+
+async def run(variant: str, n: int) -> float:
+    transport = httpx.ASGITransport(app=build_app(variant))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(min(n // 10, 200)):  # 预热
+            await client.get("/ping")
+        t0 = time.perf_counter()
+        for _ in range(n):
+            resp = await client.get("/ping")
+            assert resp.status_code == 200
+        return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3, help="每个变体跑几轮，取最好的一轮")
+    args = parser.parse_args()
+
+    # 日志两边都一样会写，这里关掉，只比较中间件机制本身的开销
+    logging.getLogger("request").setLevel(logging.WARNING)
+
+    results = {}
+    for variant in ("none", "decorator", "asgi"):
+        results[variant] = min(asyncio.run(run(variant, args.requests)) for _ in range(args.rounds))
+
+    base = results["none"]
+    for variant, us in results.items():
+        print(f"{variant:>10}: {us:8.1f} us/request  ({us - base:+7.1f} us vs none)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+冷启动 benchmark：每轮起一个全新的 Python 子进程，测量
+- interpreter：解释器启动到开始 import（子进程内看不到，用父进程总耗时减出来）
+- import：import app.main
+- lifespan：启动钩子（日志线程、dev 建表）
+- first_request：第一个请求 GET /health 返回（首次请求会触发各种惰性初始化）
+- total：父进程 spawn 到子进程报告“第一个请求完成”
+
+用法：
+  python -m app.scripts.bench_startup --runs 5
+  python -m app.scripts.bench_startup --runs 5 --ai 0       # 只跑笔记的 worker
+  python -m app.scripts.bench_startup --top 15              # 额外列出 import 最慢的模块
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+# 子进程里执行：手动跑 lifespan + 通过 ASGITransport 发第一个请求（不需要 uvicorn、不占端口）
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import app.main
+t_import = time.perf_counter()
+
+async def first_request():
+    import httpx
+    app_ = app.main.app
+    async with app_.router.lifespan_context(app_):
+        t_lifespan = time.perf_counter()
+        transport = httpx.ASGITransport(app=app_)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+            r = await c.get(PATH)
+            assert r.status_code < 500, r.status_code
+        return t_lifespan, time.perf_counter()
+
+t_lifespan, t_first = asyncio.run(first_request())
+print("BENCH " + json.dumps({
+    "import": (t_import - t0) * 1000,
+    "lifespan": (t_lifespan - t_import) * 1000,
+    "first_request": (t_first - t_lifespan) * 1000,
+}), file=sys.stderr)
+"""
+
+
+def child_env(ai: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("API_KEY", "bench-key")
+    env["AI_ENABLED"] = ai
+    return env
+
+
+def run_once(path: str, ai: str) -> dict[str, float]:
+    code = CHILD.replace("PATH", repr(path))
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        env=child_env(ai),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = (time.perf_counter() - t0) * 1000
+    # 结果写在 stderr（stdout 上有日志后台线程在写，会和 print 交错）
+    line = next(x for x in out.stderr.splitlines() if x.startswith("BENCH "))
+    row = json.loads(line[len("BENCH ") :])
+    row["total"] = total
+    row["interpreter"] = total - row["import"] - row["lifespan"] - row["first_request"]
+    return row
+
+
+def slowest_imports(ai: str, top: int) -> list[tuple[float, str]]:
+    """python -X importtime 的输出里，按“自身耗时”排序的模块（单位 ms）。"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=child_env(ai),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)) / 1000, len(m.group(3)) // 2, m.group(4)))
+    # 只看顶层和 app.* 的累计耗时，第三方库内部的细节意义不大
+    picked = [(ms, name) for ms, depth, name in rows if depth == 0 or name.startswith("app.")]
+    return sorted(picked, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/health")
+    parser.add_argument("--ai", choices=["0", "1"], default="1", help="AI_ENABLED")
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest imports")
+    args = parser.parse_args()
+
+    rows = [run_once(args.path, args.ai) for _ in range(args.runs)]
+    keys = ["interpreter", "import", "lifespan", "first_request", "total"]
+    print(f"AI_ENABLED={args.ai} runs={args.runs} path={args.path}")
+    for k in keys:
+        vals = sorted(r[k] for r in rows)
+        print(f"{k:>14}: median={vals[len(vals) // 2]:7.1f}ms  min={vals[0]:7.1f}ms")
+
+    if args.top:
+        print(f"\nslowest imports (cumulative, AI_ENABLED={args.ai}):")
+        for ms, name in slowest_imports(args.ai, args.top):
+            print(f"{ms:8.1f}ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+# app/scripts/stats.py
+# 评测/压测脚本共用的小统计函数：只依赖标准库，导入它不会带进 httpx、prompt 渲染等
+
+
+def percentile(values: list[float], q: float) -> float:
+    """线性插值分位数（q 取 0~100），与 numpy.percentile 的默认行为一致。"""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    pos = (len(xs) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (pos - lo)
+
+
+def mean(values: list[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
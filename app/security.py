@@ -1,26 +1,217 @@
+import hashlib
+import hmac
+import json
+import math
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
 from fastapi import Depends, HTTPException
 from fastapi.security import APIKeyHeader
 
 from app import settings
+from app.core.coherence import SharedTokenBuckets
+from app.core.metrics import REGISTRY
+from app.core.timing import span
 
 # 定义：我们从请求 Header 的 X-API-Key 里取值
 # APIKeyHeader会将需要X-API-Key的项目规则写入OpenAPI文档
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+API_REQUESTS = REGISTRY.counter(
+    "api_key_requests_total", "Requests per API key and scope", ("key", "scope", "outcome")
+)
+
+# 限流的两个作用域：AI 路由很贵，笔记 CRUD 很便宜，分开限
+SCOPES = ("ai", "notes")
+
+
+@dataclass(frozen=True)
+class ApiClient:
+    """
+    一个调用方（一把 key）：
+    - name 用于日志/指标，limits 是各作用域的 (每秒速率, 桶容量)
+    - weight 是上游模型调度里的公平份额（weight=2 的 key 排队时拿到两倍的名额）
+    """
+
+    name: str
+    limits: dict[str, tuple[float, float]] = field(default_factory=dict, hash=False)
+    weight: float = 1.0
+
+
+def hash_api_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _default_limits() -> dict[str, tuple[float, float]]:
+    return {
+        "ai": (settings.RATE_LIMIT_AI_RPS, settings.RATE_LIMIT_AI_BURST),
+        "notes": (settings.RATE_LIMIT_NOTES_RPS, settings.RATE_LIMIT_NOTES_BURST),
+    }
+
+
+# 按 hash 的前 16 位建索引，整串 hash 再做常数时间比较
+_INDEX_LEN = 16
+
+
+def load_api_keys(raw: str | None = None) -> dict[str, tuple[str, ApiClient]]:
+    """
+    返回 {sha256 前缀: (完整 sha256, ApiClient)}：服务端只存 hash，不存明文 key。
+    - settings.API_KEYS：JSON 数组，如
+      [{"name": "web", "sha256": "...", "ai_rps": 0.5, "ai_burst": 3, "weight": 2}]
+    - settings.API_KEY（旧的单 key 配置）仍然有效，名字叫 default
+    """
+    raw = settings.API_KEYS if raw is None else raw
+    entries: list[tuple[str, ApiClient]] = []
+    if settings.API_KEY:
+        entries.append((hash_api_key(settings.API_KEY), ApiClient("default", _default_limits())))
+    for item in json.loads(raw) if raw.strip() else []:
+        limits = _default_limits()
+        for scope in SCOPES:
+            rps, burst = limits[scope]
+            limits[scope] = (
+                float(item.get(f"{scope}_rps", rps)),
+                float(item.get(f"{scope}_burst", burst)),
+            )
+        weight = float(item.get("weight", 1.0))
+        entries.append((item["sha256"].lower(), ApiClient(item["name"], limits, weight)))
+    return {digest[:_INDEX_LEN]: (digest, client) for digest, client in entries}
+
+
+_keys: dict[str, tuple[str, ApiClient]] | None = None
+
+
+def get_api_keys() -> dict[str, tuple[str, ApiClient]]:
+    global _keys
+    if _keys is None:
+        _keys = load_api_keys()
+    return _keys
+
+
+def lookup_api_key(api_key: str | None) -> ApiClient | None:
+    """
+    O(1) 查找：先算提交的 key 的 sha256，用前缀查字典（key 再多也是一次查找）；
+    命中后对完整 hash 用 hmac.compare_digest 做常数时间比较，不给时序攻击留线索
+    """
+    if not api_key:
+        return None
+    digest = hash_api_key(api_key)
+    entry = get_api_keys().get(digest[:_INDEX_LEN])
+    if entry is None:
+        return None
+    stored, client = entry
+    return client if hmac.compare_digest(stored, digest) else None
+
+
+def is_valid_api_key(api_key: str | None) -> bool:
+    # 给不走依赖注入的地方用（比如中间件里判断“是不是自己人”）
+    return lookup_api_key(api_key) is not None
+
 
 # verify_api_key是一个依赖，FastAPI会在每一个请求前先执行它
-def verify_api_key(api_key: str | None = Depends(api_key_header)) -> None:
+def verify_api_key(api_key: str | None = Depends(api_key_header)) -> ApiClient:
     """
     鉴权依赖：
-    - 读取环境变量 API_KEY 作为“正确的钥匙”
+    - 服务端配置的 key（API_KEY / API_KEYS）以 sha256 形式保存
     - 读取请求头 X-API-Key 作为“用户提交的钥匙”
-    - 不匹配就 401
+    - 找不到就 401；找到了返回调用方，后面的限流/调度按它来区分
+    """
+    with span("auth"):
+        keys = get_api_keys()
+
+        # 学习阶段：如果你忘了设置 API_KEY，直接报错提醒
+        if not keys:
+            raise HTTPException(status_code=500, detail="API_KEY is not configured on server")
+
+        client = lookup_api_key(api_key)
+        if client is None:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        return client
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多攒 burst 个；每个请求消耗 1 个。"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """拿到令牌返回 0；否则返回还需要等待的秒数。"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    每个 (key, 作用域) 一个令牌桶。
+    shared 不为空时桶放在跨进程共享内存里（app.serve 多 worker 部署），否则每个进程各一份
+    """
+
+    def __init__(self, shared: SharedTokenBuckets | None = None):
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.shared = shared
+
+    def take(self, client: ApiClient, scope: str) -> float:
+        rate, burst = client.limits.get(scope, (0.0, 0.0))
+        if rate <= 0:
+            return 0.0  # 0 表示不限流
+        if self.shared is not None:
+            return self.shared.take(f"{client.name}:{scope}", rate, burst)
+        key = (client.name, scope)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(rate, burst))
+        return bucket.take()
+
+
+limiter = RateLimiter()
+
+
+def take_token(client: ApiClient, scope: str) -> float:
+    """限流并计数：返回 0 表示放行，否则是还需要等待的秒数（不走依赖注入的地方也用它）。"""
+    wait_s = limiter.take(client, scope)
+    API_REQUESTS.inc(key=client.name, scope=scope, outcome="limited" if wait_s > 0 else "allowed")
+    return wait_s
+
+
+def retry_after(wait_s: float) -> str:
+    # Retry-After 是整数秒：向上取整，至少 1
+    return str(max(1, math.ceil(wait_s)))
+
+
+def rate_limit(scope: str):
     """
-    expected = settings.API_KEY
+    生成某个作用域的限流依赖：
+    router = APIRouter(dependencies=[Depends(verify_api_key), Depends(rate_limit("ai"))])
+    超限返回 429 + Retry-After（秒，向上取整）
+    """
+
+    def dependency(client: ApiClient = Depends(verify_api_key)) -> ApiClient:
+        wait_s = take_token(client, scope)
+        if wait_s > 0:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": retry_after(wait_s)},
+            )
+        return client
+
+    return dependency
 
-    # 学习阶段：如果你忘了设置 API_KEY，直接报错提醒
-    if not expected:
-        raise HTTPException(status_code=500, detail="API_KEY is not configured on server")
 
-    if api_key != expected:
-        raise HTTPException(status_code=401, detail="Invalid API key")
+if __name__ == "__main__":
+    # 生成写进 API_KEYS 的 hash：python -m app.security <key>
+    print(hash_api_key(sys.argv[1]))
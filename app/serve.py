@@ -0,0 +1,146 @@
+# app/serve.py
+import argparse
+import logging
+import os
+import signal
+import socket
+import time
+
+from app import settings
+from app.core.logging import shutdown_logging
+
+logger = logging.getLogger("serve")
+
+"""
+    多进程启动（preload + fork）：python -m app.serve --workers 4
+    - 父进程先 import app.main（路由、pydantic 模型、SQLAlchemy 元数据都在这时建好），再 fork：
+      子进程直接继承这些内存（copy-on-write），不用各自再导入一遍
+    - fork 之前创建跨进程共享的限流令牌桶（app.core.coherence.SharedTokenBuckets），
+      N 个 worker 共用一份限额；列表页缓存按 SQLite 里的集合版本号失效，不需要额外处理
+    - 父进程绑定监听 socket，所有 worker accept 同一个 socket，由内核分发连接
+    - lifespan（日志线程、摘要后台任务）在每个 worker 里各跑一次：线程不能跨 fork 继承，
+      所以父进程里不启动任何线程、不留数据库连接
+    - worker 意外退出会被重新拉起；SIGTERM 转发给所有 worker，等它们处理完手上的请求再退出
+      （终端里 Ctrl-C 的 SIGINT 本来就会发给整个进程组，父进程只负责不再拉起）
+    - 没有 os.fork 的平台（Windows）或 --workers 1：在当前进程里跑一个 uvicorn
+"""
+
+RESTART_DELAY_S = 1.0
+
+
+def preload():
+    """在父进程里做所有 worker 共用的准备工作，返回 ASGI app。"""
+    import app.security as security
+    from app.core.coherence import SharedTokenBuckets
+    from app.db import engine
+    from app.main import app
+
+    security.limiter = security.RateLimiter(SharedTokenBuckets(settings.SHARED_RATE_LIMIT_SLOTS))
+    # SQLite 连接不能跨 fork 共用：父进程的连接池清空，worker 第一次查询时自己建
+    engine.dispose()
+    return app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, log_level: str) -> None:
+    # uvicorn 只在真正启动服务时才导入（测试、脚本导入本模块不需要它）
+    import uvicorn
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    """父进程：fork 出 workers 个子进程，挂了就补，收到 SIGTERM 就一起退出。"""
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.children: set[int] = set()
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            # 子进程：信号交给 uvicorn 自己处理；无论怎么结束都不回到父进程的代码里
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.log_level)
+            except BaseException:
+                logger.exception("worker %s crashed", os.getpid())
+                code = 1
+            finally:
+                # os._exit 不跑 atexit：崩溃日志和队列里剩下的日志在这里写完
+                shutdown_logging()
+                os._exit(code)
+        self.children.add(pid)
+        logger.info("started worker pid=%s", pid)
+
+    def _on_sigterm(self, signum, frame) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _on_sigint(self, signum, frame) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._on_sigterm)
+        signal.signal(signal.SIGINT, self._on_sigint)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.children.discard(pid)
+            if self.stopping:
+                continue
+            logger.warning("worker pid=%s exited (status=%s), restarting", pid, status)
+            time.sleep(RESTART_DELAY_S)
+            if not self.stopping:
+                self.spawn()
+        logger.info("all workers exited")
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the Notes API with several worker processes")
+    parser.add_argument("--host", default=settings.HOST)
+    parser.add_argument("--port", type=int, default=settings.PORT)
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    parser.add_argument("--log-level", default=settings.LOG_LEVEL.lower())
+    args = parser.parse_args(argv)
+
+    # 父进程只用最简单的 stdout 日志：app 的日志后台线程在每个 worker 的 lifespan 里各自启动
+    logging.basicConfig(
+        level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s - %(message)s"
+    )
+    app = preload()
+    sock = bind_socket(args.host, args.port)
+    logger.info("listening on %s:%s workers=%s", args.host, args.port, args.workers)
+
+    if args.workers <= 1 or not hasattr(os, "fork"):
+        run_worker(app, sock, args.log_level)
+        return
+    Supervisor(app, sock, args.workers, args.log_level).run()
+
+
+if __name__ == "__main__":
+    main()
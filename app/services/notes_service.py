@@ -1,9 +1,66 @@
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
 from fastapi import HTTPException
-from sqlalchemy import asc, desc
+from sqlalchemy import asc, delete, desc, insert, or_, select, update
 from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import UnaryExpression
+from sqlalchemy.sql.operators import custom_op
 
-from app.models import Note
+from app import settings
+from app.core.coherence import VersionedCache
+from app.models import CollectionVersion, Note, content_hash
 from app.schemas.notes import NoteCreate, NoteOut
+from app.services.summary_service import get_summary_worker
+
+# 写操作用 INSERT/UPDATE/DELETE ... RETURNING（SQLite 3.35+ 支持）：
+# 一条语句既完成写入又带回 NoteOut 需要的列，不再有“先 SELECT 再写、写完再 refresh”的往返
+_OUT_COLUMNS = (
+    Note.id,
+    Note.title,
+    Note.content,
+    Note.created_at,
+    Note.updated_at,
+    Note.version,
+    Note.content_hash,
+)
+
+
+def _to_out(row) -> NoteOut:
+    return NoteOut(
+        id=row.id,
+        title=row.title,
+        content=row.content,
+        created_at=row.created_at,
+        updated_at=row.updated_at,
+        version=row.version,
+        content_hash=row.content_hash,
+    )
+
+
+# 排序白名单：sort 参数 -> (排序列, 方向)；两个时间列都有 (列, id) 复合索引
+_SORTS = {
+    "created_at_desc": (Note.created_at, desc),
+    "created_at_asc": (Note.created_at, asc),
+    "updated_at_desc": (Note.updated_at, desc),
+    "updated_at_asc": (Note.updated_at, asc),
+}
+
+
+def _utc_naive(dt: datetime) -> datetime:
+    # 库里存的是 naive UTC（datetime.utcnow）；带时区的参数先换成 UTC 再去掉 tzinfo
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """'abc' -> 'abd'：title >= 'abc' AND title < 'abd' 就是前缀匹配，能走普通索引。"""
+    while prefix and prefix[-1] == chr(0x10FFFF):
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
 class NotesService:
@@ -12,66 +69,188 @@ class NotesService:
     每个方法接收一个 db(Session)，代表一次数据库会话。
     """
 
+    def __init__(self):
+        # 列表页缓存：按 notes 集合版本号整体失效，多 worker 下别的进程写入同样能让它作废
+        self._list_cache = VersionedCache("notes_list", settings.NOTES_LIST_CACHE_ITEMS)
+
     def create(self, db: Session, payload: NoteCreate) -> NoteOut:
-        note = Note(title=payload.title, content=payload.content)
-        # 将对象加入本次会话
-        db.add(note)
-        # 将对象真正的写入到数据库中
-        db.commit()
-        db.refresh(note)  # 拿到自增 id 等数据库生成的字段
-        return NoteOut(
-            id=note.id, title=note.title, content=note.content, created_at=note.created_at
+        # created_at 的默认值（datetime.utcnow）在 Core insert 里同样生效
+        # 自增 id 等数据库生成的字段由 RETURNING 直接带回，不需要 refresh
+        stmt = (
+            insert(Note)
+            .values(
+                title=payload.title,
+                content=payload.content,
+                content_hash=content_hash(payload.content),
+            )
+            .returning(*_OUT_COLUMNS)
         )
+        row = db.execute(stmt).one()
+        db.commit()
+        # 提交之后再排队：后台线程读到的一定是已经落库的正文
+        get_summary_worker().enqueue(row.id)
+        return _to_out(row)
 
     # 对获取的结果进行分页（20条/页，并进行排序）
     def list(
-        self, db: Session, limit: int = 20, offset: int = 0, sort: str = "created_at_desc"
+        self,
+        db: Session,
+        limit: int = 20,
+        offset: int = 0,
+        sort: str = "created_at_desc",
+        *,
+        created_after: datetime | None = None,
+        created_before: datetime | None = None,
+        updated_after: datetime | None = None,
+        updated_before: datetime | None = None,
+        title_prefix: str | None = None,
+        content_hash: str | None = None,
+        version: int | None = None,
     ) -> list[NoteOut]:
+        """
+        时间窗口是左闭右开：after <= t < before，相邻两个窗口不会重复也不会漏
+        title_prefix 区分大小写：改写成 title 的范围比较，而不是 LIKE（SQLite 的 LIKE
+        默认不区分大小写，用不上普通索引）
+        content_hash：按正文 hash 精确查找，客户端上传新笔记前可以先查有没有一样的
+        version：调用方刚读到的 collection_version()；传了就先查/再写进程内的列表页缓存
+        """
         # 1) 排序字段白名单（避免乱传）
         # 首先按照场景时间排序，再使用id作为第二排序
-        if sort == "created_at_desc":
-            order_clause = [desc(Note.created_at), desc(Note.id)]
-        elif sort == "created_at_asc":
-            order_clause = [asc(Note.created_at), asc(Note.id)]
-        else:
-            raise HTTPException(
-                status_code=400, detail="Invalid sort. Use created_at_desc or created_at_asc"
-            )
+        if sort not in _SORTS:
+            raise HTTPException(status_code=400, detail=f"Invalid sort. Use {', '.join(_SORTS)}")
+        sort_col, direction = _SORTS[sort]
 
-        # 2) 查询 + 排序 + 分页
-        q = db.query(Note).order_by(*order_clause).offset(offset).limit(limit)
-        notes = q.all()
+        cache_key = (
+            limit,
+            offset,
+            sort,
+            created_after,
+            created_before,
+            updated_after,
+            updated_before,
+            title_prefix,
+            content_hash,
+        )
+        if version is not None:
+            cached = self._list_cache.get(version, cache_key)
+            if cached is not None:
+                return cached
+
+        # 2) 过滤条件：每一个都是某个索引上的范围；filtered 记下用到了哪些列
+        filters = []
+        filtered: set[str] = set()
+        for col, lower, upper in (
+            (Note.created_at, created_after, created_before),
+            (Note.updated_at, updated_after, updated_before),
+        ):
+            if lower is not None:
+                filters.append(col >= _utc_naive(lower))
+            if upper is not None:
+                filters.append(col < _utc_naive(upper))
+            if lower is not None or upper is not None:
+                filtered.add(col.key)
+        if title_prefix:
+            filters.append(Note.title >= title_prefix)
+            upper_bound = _prefix_upper_bound(title_prefix)
+            if upper_bound is not None:
+                filters.append(Note.title < upper_bound)
+            filtered.add("title")
+        if content_hash:
+            filters.append(Note.content_hash == content_hash)
+            filtered.add("content_hash")
 
-        return [
-            NoteOut(id=n.id, title=n.title, content=n.content, created_at=n.created_at)
-            for n in notes
-        ]
+        # 只按别的列过滤时，SQLite 没有统计信息会倾向于顺着排序列的索引扫全表（省一次排序）；
+        # 排序列写成 +col 让它不能用索引排序，改走过滤列的索引范围查询，再对命中的行排序
+        sort_key = sort_col
+        if filtered and sort_col.key not in filtered:
+            sort_key = UnaryExpression(sort_col, operator=custom_op("+"), type_=sort_col.type)
+        order_clause = [direction(sort_key), direction(Note.id)]
+
+        # 3) 查询 + 排序 + 分页
+        q = db.query(Note).filter(*filters).order_by(*order_clause).offset(offset).limit(limit)
+        notes = [_to_out(n) for n in q.all()]
+        if version is not None:
+            self._list_cache.put(version, cache_key, notes)
+        return notes
 
     def get(self, db: Session, note_id: int) -> NoteOut:
         note = db.query(Note).filter(Note.id == note_id).first()
         if note is None:
             raise HTTPException(status_code=404, detail="Note not found")
-        return NoteOut(
-            id=note.id, title=note.title, content=note.content, created_at=note.created_at
-        )
+        return _to_out(note)
 
-    def update(self, db: Session, note_id: int, payload: NoteCreate) -> NoteOut:
-        note = db.query(Note).filter(Note.id == note_id).first()
-        if note is None:
-            raise HTTPException(status_code=404, detail="Note not found")
+    def version(self, db: Session, note_id: int) -> int | None:
+        """只查版本号（主键查询），给 If-None-Match 判断 304 用；不存在返回 None。"""
+        return db.execute(select(Note.version).where(Note.id == note_id)).scalar_one_or_none()
 
-        note.title = payload.title
-        note.content = payload.content
-        db.commit()
-        db.refresh(note)
-        return NoteOut(
-            id=note.id, title=note.title, content=note.content, created_at=note.created_at
+    def collection_version(self, db: Session) -> int:
+        """notes 集合的版本号：任何写入都会让它 +1（由触发器维护）。"""
+        stmt = select(CollectionVersion.version).where(CollectionVersion.name == "notes")
+        return db.execute(stmt).scalar_one_or_none() or 0
+
+    def update(
+        self,
+        db: Session,
+        note_id: int,
+        payload: NoteCreate,
+        if_versions: Sequence[int] | None = None,
+    ) -> NoteOut:
+        """
+        if_versions：If-Match 给出的版本号；只有当前版本在其中才更新（乐观并发控制）
+        - 标题和正文 hash 都和库里一样的行不匹配 UPDATE：不写库、不触发触发器，
+          version / ETag / 列表缓存都不失效，直接返回当前行（同步客户端反复 PUT 原样内容很常见）
+        - 没有匹配的行时 RETURNING 为空，再查一次当前行区分 404 / 412 / 内容没变
+        - synchronize_session=False：会话里没有加载过这条记录，不需要同步
+        """
+        h = content_hash(payload.content)
+        stmt = update(Note).where(
+            Note.id == note_id,
+            or_(Note.title != payload.title, Note.content_hash.is_distinct_from(h)),
+        )
+        if if_versions is not None:
+            stmt = stmt.where(Note.version.in_(if_versions))
+        stmt = (
+            stmt.values(
+                title=payload.title,
+                content=payload.content,
+                content_hash=h,
+                version=Note.version + 1,
+            )
+            .returning(*_OUT_COLUMNS)
+            .execution_options(synchronize_session=False)
         )
+        # 两条语句之间被别人改了内容（既不是 no-op 也没更新上）时重试；正常最多执行一轮
+        for _ in range(3):
+            row = db.execute(stmt).one_or_none()
+            if row is not None:
+                db.commit()
+                get_summary_worker().enqueue(row.id)
+                return _to_out(row)
+            db.rollback()
 
-    def delete(self, db: Session, note_id: int) -> None:
-        note = db.query(Note).filter(Note.id == note_id).first()
-        if note is None:
-            raise HTTPException(status_code=404, detail="Note not found")
+            current = db.execute(select(*_OUT_COLUMNS).where(Note.id == note_id)).one_or_none()
+            if current is None:
+                raise HTTPException(status_code=404, detail="Note not found")
+            if if_versions is not None and current.version not in if_versions:
+                raise HTTPException(status_code=412, detail="Note has been modified")
+            if current.title == payload.title and current.content_hash == h:
+                return _to_out(current)
+        raise HTTPException(status_code=409, detail="Note is being modified concurrently")
 
-        db.delete(note)
+    def delete(self, db: Session, note_id: int, if_versions: Sequence[int] | None = None) -> None:
+        stmt = delete(Note).where(Note.id == note_id)
+        if if_versions is not None:
+            stmt = stmt.where(Note.version.in_(if_versions))
+        stmt = stmt.returning(Note.id).execution_options(synchronize_session=False)
+        deleted = db.execute(stmt).scalar_one_or_none()
+        if deleted is None:
+            db.rollback()
+            self._raise_missing(db, note_id, if_versions)
         db.commit()
+        get_summary_worker().forget(note_id)
+
+    def _raise_missing(self, db: Session, note_id: int, if_versions: Sequence[int] | None) -> None:
+        # 写语句没有命中：带了 If-Match 且笔记还在，说明是版本不匹配
+        if if_versions is not None and self.version(db, note_id) is not None:
+            raise HTTPException(status_code=412, detail="Note has been modified")
+        raise HTTPException(status_code=404, detail="Note not found")
@@ -0,0 +1,288 @@
+# app/services/summary_service.py
+import asyncio
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, and_, literal, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from app import settings
+from app.ai import close_upstream
+from app.ai.output_schemas import SummaryOut
+from app.ai.scheduler import BATCH, set_request_class
+from app.core.metrics import REGISTRY
+from app.models import Note, NoteSummary, content_hash
+from app.schemas.notes import NoteSummaryOut
+
+logger = logging.getLogger("summary.worker")
+
+"""
+    笔记摘要物化：
+    - NotesService 创建/更新笔记后 enqueue(note_id)，只是往内存队列里放一个 id
+    - 后台线程（自己的事件循环）逐个调用 ai_service.summarize，结果写进 note_summaries
+    - GET /v1/notes/{id}/summary 只做一次主键 join 查询，不调用模型
+    - 队列是进程内的：重启丢了也没关系，读摘要时发现缺失/过期会重新排队
+"""
+
+SUMMARY_JOBS = REGISTRY.counter(
+    "summary_jobs_total", "Background note summary jobs by outcome", ("outcome",)
+)
+
+
+SummarizeFn = Callable[[str, str], Awaitable[SummaryOut]]
+
+
+async def _default_summarize(content: str, prompt_key: str) -> SummaryOut:
+    # 延迟导入：只跑笔记、不开 AI 的 worker 不需要加载模型客户端
+    from app.ai.ai_service import summarize
+
+    return await summarize(content=content, prompt_key=prompt_key)
+
+
+class SummaryWorker:
+    """
+    单线程后台摘要任务：
+    - 同一个 note_id 排队中只保留一份（连续改 10 次只摘要最后的正文）
+    - 队列满了直接丢弃并计数，读摘要时会补排队，不阻塞写请求
+    - 一次只处理一条，天然限制了对上游的并发
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        *,
+        summarize: SummarizeFn | None = None,
+        prompt_key: str | None = None,
+        queue_size: int | None = None,
+        failed_items: int | None = None,
+        enabled: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.summarize = summarize or _default_summarize
+        self.prompt_key = prompt_key or settings.SUMMARY_PROMPT_KEY
+        self.enabled = enabled
+        self._queue: queue.Queue[int] = queue.Queue(
+            maxsize=queue_size or settings.SUMMARY_QUEUE_SIZE
+        )
+        self._queued: set[int] = set()
+        self._lock = threading.Lock()
+        # 当前正文摘要失败的笔记：{note_id: content_hash}；LRU，超过上限丢最久的
+        self.failed: OrderedDict[int, str] = OrderedDict()
+        self.failed_items = failed_items or settings.SUMMARY_FAILED_ITEMS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, note_id: int) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            if note_id in self._queued:
+                return True
+            try:
+                self._queue.put_nowait(note_id)
+            except queue.Full:
+                SUMMARY_JOBS.inc(outcome="dropped")
+                return False
+            self._queued.add(note_id)
+        return True
+
+    def forget(self, note_id: int) -> None:
+        """笔记删除了：失败记录也不再需要。"""
+        with self._lock:
+            self.failed.pop(note_id, None)
+
+    def _mark_failed(self, note_id: int, h: str) -> None:
+        with self._lock:
+            self.failed[note_id] = h
+            self.failed.move_to_end(note_id)
+            while len(self.failed) > self.failed_items:
+                self.failed.popitem(last=False)
+
+    def is_queued(self, note_id: int) -> bool:
+        return note_id in self._queued
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="summary-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _next(self, timeout: float) -> Optional[int]:
+        try:
+            note_id = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        # 先移出 _queued：处理期间笔记又被修改，可以再次排队
+        with self._lock:
+            self._queued.discard(note_id)
+        return note_id
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        try:
+            while not self._stop.is_set():
+                note_id = self._next(timeout=0.5)
+                if note_id is not None:
+                    self.process(note_id, loop)
+        finally:
+            self._close_loop(loop)
+
+    def run_pending(self) -> int:
+        """在当前线程里把队列处理完（测试、一次性补摘要脚本用），返回处理条数。"""
+        loop = asyncio.new_event_loop()
+        n = 0
+        try:
+            while (note_id := self._next(timeout=0)) is not None:
+                self.process(note_id, loop)
+                n += 1
+        finally:
+            self._close_loop(loop)
+        return n
+
+    def _close_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        # 上游连接池按 loop 各一份：这个 loop 上建的连接要在它关闭之前关掉
+        try:
+            loop.run_until_complete(close_upstream())
+        except Exception:
+            logger.warning("closing upstream connections failed", exc_info=True)
+        finally:
+            loop.close()
+
+    def process(self, note_id: int, loop: asyncio.AbstractEventLoop) -> None:
+        with self.session_factory() as db:
+            content = db.execute(select(Note.content).where(Note.id == note_id)).scalar()
+            if content is None:
+                self.forget(note_id)
+                return  # 笔记已删除
+            h = content_hash(content)
+            existing = db.get(NoteSummary, note_id)
+            if existing and existing.content_hash == h and existing.prompt_key == self.prompt_key:
+                SUMMARY_JOBS.inc(outcome="skipped")
+                return
+
+        # 后台摘要是批量流量：只用非预留的上游并发，不和交互请求抢
+        set_request_class("summary-worker", BATCH)
+        try:
+            out = loop.run_until_complete(self.summarize(content, self.prompt_key))
+        except Exception as e:
+            SUMMARY_JOBS.inc(outcome="failed")
+            self._mark_failed(note_id, h)
+            logger.warning("summary failed note_id=%s err=%s", note_id, str(e)[:200])
+            return
+
+        # 写入和"笔记还在、正文没变"放在同一条语句里：模型调用期间笔记被删了（摘要触发器已经跑过），
+        # 或者正文被改了，这里一行都不写，不会留下一条挂在（之后可能被复用的）note_id 上的孤儿摘要
+        stmt = sqlite_insert(NoteSummary).from_select(
+            ["note_id", "content_hash", "prompt_key", "summary", "updated_at"],
+            select(
+                Note.id,
+                literal(h),
+                literal(self.prompt_key),
+                literal(out.model_dump_json()),
+                literal(datetime.utcnow(), DateTime),
+            ).where(
+                Note.id == note_id,
+                # content_hash 为空：回填还没到这一行，直接比正文
+                or_(
+                    Note.content_hash == h,
+                    and_(Note.content_hash.is_(None), Note.content == content),
+                ),
+            ),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[NoteSummary.note_id],
+            set_={
+                "content_hash": stmt.excluded.content_hash,
+                "prompt_key": stmt.excluded.prompt_key,
+                "summary": stmt.excluded.summary,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        with self.session_factory() as db:
+            written = db.execute(stmt).rowcount
+            db.commit()
+        self.forget(note_id)
+        if not written:
+            # 删了就没什么要做的；改了的话更新时已经重新排队
+            SUMMARY_JOBS.inc(outcome="discarded")
+            return
+        SUMMARY_JOBS.inc(outcome="ready")
+
+
+_worker: SummaryWorker | None = None
+
+
+def get_summary_worker() -> SummaryWorker:
+    global _worker
+    if _worker is None:
+        from app.db import SessionLocal
+
+        _worker = SummaryWorker(
+            SessionLocal, enabled=settings.AI_ENABLED and settings.SUMMARY_WORKER
+        )
+    return _worker
+
+
+REGISTRY.gauge(
+    "summary_queue_depth",
+    "Notes waiting for a background summary",
+    lambda: _worker.depth() if _worker is not None else 0,
+)
+
+
+class SummaryService:
+    def get(self, db: Session, note_id: int) -> NoteSummaryOut:
+        """
+        一次主键 join：当前正文的 hash + 已存的摘要；缺失或过期时补排队。
+        正文 hash 直接读 notes.content_hash，不用把正文读出来再算一遍
+        """
+        stmt = (
+            select(
+                Note.content_hash.label("note_hash"),
+                NoteSummary.content_hash,
+                NoteSummary.prompt_key,
+                NoteSummary.summary,
+                NoteSummary.updated_at,
+            )
+            .outerjoin(NoteSummary, NoteSummary.note_id == Note.id)
+            .where(Note.id == note_id)
+        )
+        row = db.execute(stmt).one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Note not found")
+
+        worker = get_summary_worker()
+        # note_hash 为空：迁移回填还没到这一行，当作没有最新摘要处理（后台会补上）
+        h = row.note_hash
+        summary = SummaryOut.model_validate_json(row.summary) if row.summary else None
+        fresh = h is not None and row.content_hash == h and row.prompt_key == worker.prompt_key
+
+        if fresh:
+            status = "ready"
+        elif not worker.enabled:
+            status = "unavailable"
+        elif h is not None and worker.failed.get(note_id) == h and not worker.is_queued(note_id):
+            status = "failed"
+        else:
+            worker.enqueue(note_id)
+            status = "stale" if summary is not None else "pending"
+        return NoteSummaryOut(
+            note_id=note_id, status=status, summary=summary, updated_at=row.updated_at
+        )
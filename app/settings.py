@@ -14,3 +14,89 @@ API_KEY = os.getenv("API_KEY")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.siliconflow.cn/v1")
 DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B")
+
+# 多上游 provider 池（OpenAI 兼容接口），JSON 数组，例如：
+# [{"name": "sf", "base_url": "https://api.siliconflow.cn/v1", "model": "...", "weight": 2},
+#  {"name": "ds", "base_url": "https://api.deepseek.com", "model": "deepseek-chat",
+#   "api_key_env": "DS_API_KEY", "weight": 1}]
+# 不配置时只有一个 provider：DEEPSEEK_BASE_URL / DEEPSEEK_MODEL
+AI_PROVIDERS = os.getenv("AI_PROVIDERS", "")
+AI_TIMEOUT_S = float(os.getenv("AI_TIMEOUT_S", "30"))
+
+# 日志：text / json；队列满了丢弃而不是阻塞；按 logger 名采样，如 "request=0.1"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# 在响应里加 Server-Timing 头（auth/db/prompt/upstream/validate/render 耗时拆分）
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# 按需性能剖析：开启后，带 X-Profile: 1（且 X-API-Key 正确）的请求、
+# 或按 PROFILING_SAMPLE_RATE 随机抽中的请求会被剖析，结果写到 PROFILING_DIR
+# PROFILING_MODE=sampling 输出 .folded（flamegraph.pl / speedscope 可直接打开）
+# PROFILING_MODE=cprofile 输出 .prof（pstats / snakeviz）
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_MODE = os.getenv("PROFILING_MODE", "sampling")
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "outputs/profiles")
+
+# 多个 API key（只存 sha256，生成：python -m app.security <key>），JSON 数组：
+# [{"name": "web", "sha256": "...", "ai_rps": 0.5, "ai_burst": 3, "notes_rps": 20}]
+API_KEYS = os.getenv("API_KEYS", "")
+# 每个 key 的默认令牌桶：每秒补充多少、最多攒多少；rps=0 表示不限流
+# 默认都不限流（单 API_KEY 的老部署升级后行为不变），需要时在 API_KEYS 里按 key 打开
+RATE_LIMIT_AI_RPS = float(os.getenv("RATE_LIMIT_AI_RPS", "0"))
+RATE_LIMIT_AI_BURST = float(os.getenv("RATE_LIMIT_AI_BURST", "5"))
+RATE_LIMIT_NOTES_RPS = float(os.getenv("RATE_LIMIT_NOTES_RPS", "0"))
+RATE_LIMIT_NOTES_BURST = float(os.getenv("RATE_LIMIT_NOTES_BURST", "50"))
+
+# 只跑笔记 CRUD 的 worker 可以设 AI_ENABLED=0：不注册 /ai 路由，也不导入 AI 相关模块，启动更快
+AI_ENABLED = os.getenv("AI_ENABLED", "1") == "1"
+
+# 笔记摘要后台物化：创建/更新笔记后排队调用 summarize，结果存 note_summaries 表
+# 读摘要（GET /v1/notes/{id}/summary）只查库，不调用模型；AI_ENABLED=0 时也不启动
+SUMMARY_WORKER = os.getenv("SUMMARY_WORKER", "1") == "1"
+SUMMARY_PROMPT_KEY = os.getenv("SUMMARY_PROMPT_KEY", "summarize_v1")
+SUMMARY_QUEUE_SIZE = int(os.getenv("SUMMARY_QUEUE_SIZE", "1000"))
+# 最多记住多少条“当前正文摘要失败”的笔记（上游长时间故障时不无限增长，最久的先忘）
+SUMMARY_FAILED_ITEMS = int(os.getenv("SUMMARY_FAILED_ITEMS", "10000"))
+
+# 上游模型并发调度：同时最多 AI_MAX_CONCURRENCY 个上游调用，其中 AI_INTERACTIVE_RESERVE 个
+# 只留给交互请求（batch 用不了）；请求头 X-Priority: batch 标记批量调用
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "8"))
+AI_INTERACTIVE_RESERVE = int(os.getenv("AI_INTERACTIVE_RESERVE", "2"))
+
+# Idempotency-Key：POST /v1/notes 和 /ai/* 带这个头时，同一个 key 的重试直接返回第一次的响应
+# - 成功（2xx）的响应在 SQLite 里保存 IDEMPOTENCY_TTL_S 秒，进程内再缓存最近的一批
+# - 同一个 key 的并发重复请求最多等 IDEMPOTENCY_WAIT_S 秒，等第一个处理完
+# - 处理中的占位最多保留 IDEMPOTENCY_LOCK_S 秒（进程崩了，之后的重试可以重新执行）；
+#   请求还在跑时每 1/3 个 IDEMPOTENCY_LOCK_S 续期一次，慢的上游调用不会被别的进程重复执行
+IDEMPOTENCY_TTL_S = float(os.getenv("IDEMPOTENCY_TTL_S", "86400"))
+IDEMPOTENCY_WAIT_S = float(os.getenv("IDEMPOTENCY_WAIT_S", "30"))
+IDEMPOTENCY_LOCK_S = float(os.getenv("IDEMPOTENCY_LOCK_S", "120"))
+IDEMPOTENCY_MEMORY_ITEMS = int(os.getenv("IDEMPOTENCY_MEMORY_ITEMS", "1024"))
+
+# 多 worker 部署：python -m app.serve（父进程先导入 app 再 fork，共享只读内存）
+# 限流令牌桶放进共享内存，各 worker 共用；列表页缓存按 SQLite 里的集合版本号失效
+# AI_MAX_CONCURRENCY 等并发上限是每个 worker 各自的，总量要除以 WORKERS 来配
+HOST = os.getenv("HOST", "127.0.0.1")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHARED_RATE_LIMIT_SLOTS = int(os.getenv("SHARED_RATE_LIMIT_SLOTS", "4096"))
+# 每个进程缓存多少个列表页（不同的分页/排序/过滤组合）；0 表示不缓存
+NOTES_LIST_CACHE_ITEMS = int(os.getenv("NOTES_LIST_CACHE_ITEMS", "256"))
+
+# 上游连接池：空闲连接保留多久（秒），超过就断开，下次调用重新握手
+AI_KEEPALIVE_S = float(os.getenv("AI_KEEPALIVE_S", "30"))
+
+# 启动预热（默认关）：WARMUP=1 时 lifespan 在后台预热，完成之前 GET /health/ready 返回 503
+# - 每个 provider 预先建立 WARMUP_CONNECTIONS 个连接（DNS + TCP + TLS 在上线前付掉）
+# - WARMUP_PROMPT 非空时再对每个 provider 发一次这个小 prompt（max_tokens 很小），走一遍上游冷路径
+# - 把 notes 表和索引读一遍，进 SQLite / 操作系统的页缓存
+# - 最多等 WARMUP_TIMEOUT_S 秒：预热失败或超时也会放行，只是记日志
+WARMUP = os.getenv("WARMUP", "0") == "1"
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_PROMPT = os.getenv("WARMUP_PROMPT", "")
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "20"))
@@ -0,0 +1,133 @@
+# app/warmup.py
+import asyncio
+import logging
+import time
+from typing import Any, Optional
+
+import anyio.to_thread
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app import db, settings
+from app.core.metrics import REGISTRY
+
+logger = logging.getLogger("warmup")
+
+"""
+    启动预热（settings.WARMUP=1 时开启）：
+    - 上线/扩容后的第一批 /ai 请求要付 DNS、TCP、TLS 和上游冷路径的钱，延迟能到好几秒；
+      预热在 lifespan 里后台跑，把这些提前付掉
+    - 预热期间进程已经在接请求（/health 是存活探针，一直 200），
+      但 /health/ready 返回 503，负载均衡/K8s 就绪探针等它变成 200 再把流量切过来
+    - 预热失败或超时（WARMUP_TIMEOUT_S）不会卡住上线：照样变成 ready，只记日志
+    - import 本模块不会导入 httpx / AI 客户端，AI_ENABLED=0 时只预热 SQLite
+"""
+
+
+def prime_sqlite(engine: Optional[Engine] = None) -> dict[str, Any]:
+    """
+    把 notes 表和它的每个索引顺序读一遍：数据页进操作系统的页缓存（所有连接、所有 worker 共享），
+    这条连接自己的 SQLite 页缓存也是热的。返回行数和耗时
+    """
+    engine = engine or db.engine
+    t0 = time.perf_counter()
+    with engine.connect() as conn:
+        if conn.dialect.name != "sqlite":
+            return {"skipped": conn.dialect.name}
+        rows = conn.execute(text("SELECT count(*), sum(length(content)) FROM notes")).one()[0]
+        indexes = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'notes'")
+        ).scalars()
+        for name in list(indexes):
+            column = conn.execute(text(f'PRAGMA index_info("{name}")')).first()[2]
+            # count(列) + INDEXED BY：只扫这个索引（covering index scan），不回表
+            conn.execute(text(f'SELECT count("{column}") FROM notes INDEXED BY "{name}"'))
+    return {"rows": rows, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+async def _warm_upstream() -> dict[str, Any]:
+    from app.ai.provider_pool import get_provider_pool
+
+    return await get_provider_pool().warm(
+        settings.WARMUP_CONNECTIONS, prompt=settings.WARMUP_PROMPT or None
+    )
+
+
+class Warmup:
+    """一次启动的预热状态；start() 在 lifespan 里调用，后台任务跑完 ready 变成 True。"""
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return not self.enabled or self.finished_at is not None
+
+    def start(self) -> None:
+        self.enabled = settings.WARMUP
+        self.finished_at = None
+        self.steps = {}
+        if not self.enabled:
+            return
+        self.started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await asyncio.wait_for(self._steps(), settings.WARMUP_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            self.steps["timeout"] = True
+            logger.warning("warm-up timed out after %.1fs", settings.WARMUP_TIMEOUT_S)
+        finally:
+            self.finished_at = time.monotonic()
+        logger.info(
+            "warm-up finished in %.1fms: %s",
+            (self.finished_at - self.started_at) * 1000,
+            self.steps,
+        )
+
+    async def _steps(self) -> None:
+        jobs = {"sqlite": anyio.to_thread.run_sync(prime_sqlite, abandon_on_cancel=True)}
+        if settings.AI_ENABLED:
+            jobs["upstream"] = _warm_upstream()
+        results = await asyncio.gather(*jobs.values(), return_exceptions=True)
+        for name, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.warning("warm-up step %s failed: %r", name, result)
+                result = {"error": repr(result)[:200]}
+            self.steps[name] = result
+
+    def snapshot(self) -> dict[str, Any]:
+        out: dict[str, Any] = {"status": "ready" if self.ready else "warming_up"}
+        if self.enabled:
+            end = self.finished_at if self.finished_at is not None else time.monotonic()
+            out["warmup"] = {"seconds": round(end - self.started_at, 3), "steps": self.steps}
+        return out
+
+
+_warmup: Warmup | None = None
+
+
+def get_warmup() -> Warmup:
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
+
+
+REGISTRY.gauge(
+    "app_ready", "1 once start-up warm-up has finished", lambda: float(get_warmup().ready)
+)
@@ -10,3 +10,5 @@ sys.path.insert(0, str(ROOT))
 # 2) 在导入 app 之前就设置环境变量（非常关键）
 os.environ.setdefault("API_KEY", "test-key")
 os.environ.setdefault("DATABASE_URL", "sqlite:///./test_notes.db")
+# 后台摘要任务默认不开：测试里不应该真的去调模型（需要时在用例里换成桩 worker）
+os.environ.setdefault("SUMMARY_WORKER", "0")
@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import app.scripts.ab_eval as ab
+from app.scripts.stats import percentile
+
+
+def run_stub(items, done=None):
+    pairs = []
+    counts = asyncio.run(
+        ab.evaluate_ab_async(
+            iter(items),
+            "summarize_v1",
+            "summarize_v1b",
+            "stub",
+            api_key="",
+            base_url="",
+            model="m",
+            concurrency=3,
+            done=done,
+            on_pair=lambda i, a, b: pairs.append((i, a, b)),
+        )
+    )
+    return counts, pairs
+
+
+def test_appender_writes_on_completion_and_compact_restores_order(tmp_path):
+    appender = ab.ResultAppender(tmp_path / "A.jsonl", tmp_path / "B.jsonl")
+    for i in [2, 0, 3, 1]:
+        appender.put({"index": i, "prompt_key": "a"}, {"index": i, "prompt_key": "b"})
+        # 每一条 put 完就已经在磁盘上，不等前面的下标
+        lines = (tmp_path / "A.jsonl").read_text().splitlines()
+        assert json.loads(lines[-1])["index"] == i
+    appender.close()
+
+    rows = ab.compact_results(tmp_path / "A.jsonl")
+    assert [r["index"] for r in rows] == [0, 1, 2, 3]
+
+
+def test_failed_pair_still_produces_rows(monkeypatch):
+    real_render = ab.render_prompt
+
+    def render(prompt_key, **kwargs):
+        if kwargs.get("content") == "bad":
+            raise KeyError("missing variable")
+        return real_render(prompt_key, **kwargs)
+
+    monkeypatch.setattr(ab, "render_prompt", render)
+    items = [{"id": 0, "content": "bad"}, {"id": 1, "content": "好"}]
+
+    _, pairs = run_stub(items)
+
+    by_index = {i: (a, b) for i, a, b in pairs}
+    assert set(by_index) == {0, 1}
+    assert not by_index[0][0]["ok"] and "missing variable" in by_index[0][0]["error"]
+    assert by_index[1][0]["ok"] and by_index[1][1]["ok"]
+
+
+def test_resume_only_calls_model_for_unfinished_items(tmp_path, monkeypatch):
+    items = [{"id": i, "content": f"笔记 {i}"} for i in range(6)]
+    path_a, path_b = tmp_path / "A.jsonl", tmp_path / "B.jsonl"
+
+    # 第一次：id=4 的调用失败（相当于中途崩溃/网络错误）
+    stub = ab.call_model_stub
+
+    def flaky(prompt):
+        if "笔记 4" in prompt:
+            raise RuntimeError("boom")
+        return stub(prompt)
+
+    monkeypatch.setattr(ab, "call_model_stub", flaky)
+    appender = ab.ResultAppender(path_a, path_b)
+    for _, a, b in run_stub(items)[1]:
+        appender.put(a, b)
+    appender.close()
+
+    # 续跑：只有 id=4 的 A/B 需要重新调用
+    monkeypatch.setattr(ab, "call_model_stub", stub)
+    done = ab.load_done_rows(
+        [path_a, path_b], model="stub", prompt_keys={"summarize_v1", "summarize_v1b"}
+    )
+    counts, pairs = run_stub(items, done=done)
+
+    assert counts == {"items": 6, "calls": 2, "reused": 10}
+    assert all(a["ok"] and b["ok"] for _, a, b in pairs)
+
+
+def test_compact_results_keeps_last_row_in_input_order(tmp_path):
+    path = tmp_path / "A.jsonl"
+    ab.dump_jsonl(
+        str(path),
+        [
+            {"index": 0, "prompt_key": "p", "ok": True},
+            {"index": 1, "prompt_key": "p", "ok": False},
+            {"index": 2, "prompt_key": "p", "ok": True},
+            {"index": 1, "prompt_key": "p", "ok": True},
+        ],
+    )
+
+    rows = ab.compact_results(path)
+
+    assert [r["index"] for r in rows] == [0, 1, 2]
+    assert all(r["ok"] for r in rows)
+
+
+def test_percentile_matches_linear_interpolation():
+    xs = [float(x) for x in range(1, 101)]
+    assert percentile(xs, 50) == 50.5
+    assert percentile(xs, 99) == 99.01
+    assert percentile([], 95) == 0.0
+
+
+def test_paired_bootstrap_flags_only_real_differences():
+    a = [100.0 + (i % 7) for i in range(50)]
+    slower = [x + 20 for x in a]
+    same = list(a)
+
+    d = ab.paired_bootstrap(a, slower)
+    assert d["diff"] == -20.0
+    assert d["significant"]
+
+    assert not ab.paired_bootstrap(a, same)["significant"]
+
+
+def test_metrics_report_latency_tokens_and_cost():
+    rows = [
+        {
+            "ok": False,
+            "parsed": None,
+            "latency_ms": float(i),
+            "attempts": 2 if i == 9 else 1,
+            "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+        }
+        for i in range(10)
+    ]
+
+    m = ab.compute_metrics("p", rows, price_in=1.0, price_out=2.0)
+
+    assert m["latency_ms"]["p50"] == 4.5
+    assert m["retry_rate"] == 0.1
+    assert m["tokens_per_item"]["total_tokens"] == 150
+    assert m["estimated_cost"] == (1000 * 1.0 + 500 * 2.0) / 1e6
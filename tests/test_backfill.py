@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.backfill import load_checkpoint, reset_checkpoint, run_backfill
+from app.models import BackfillCheckpoint
+
+
+@pytest.fixture()
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'backfill.db'}")
+    BackfillCheckpoint.__table__.create(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, v TEXT, upper_v TEXT)"))
+        conn.execute(
+            text("INSERT INTO items (id, v) VALUES (:id, :v)"),
+            [{"id": i, "v": f"v{i}"} for i in range(1, 251)],
+        )
+    yield engine
+    engine.dispose()
+
+
+def fill_upper(conn, rows):
+    conn.execute(
+        text("UPDATE items SET upper_v = :u WHERE id = :id"),
+        [{"id": r.id, "u": r.v.upper()} for r in rows],
+    )
+
+
+def backfill(engine, **kwargs):
+    return run_backfill(
+        engine,
+        "items_upper",
+        table="items",
+        columns=["v"],
+        where="upper_v IS NULL",
+        process=fill_upper,
+        batch_size=100,
+        sleep_s=0,
+        **kwargs,
+    )
+
+
+def filled(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT count(*) FROM items WHERE upper_v IS NOT NULL")).scalar()
+
+
+def test_backfill_runs_in_batches_and_resumes_from_checkpoint(engine):
+    first = backfill(engine, max_batches=2)
+    assert (first.rows, first.batches, first.last_key, first.done) == (200, 2, 200, False)
+    assert filled(engine) == 200
+    with engine.connect() as conn:
+        assert load_checkpoint(conn, "items_upper").rows_done == 200
+
+    rest = backfill(engine)
+    assert (rest.rows, rest.done) == (50, True)
+    assert filled(engine) == 250
+
+    # 已完成的回填再跑一次直接返回
+    again = backfill(engine)
+    assert (again.rows, again.batches, again.done) == (0, 0, True)
+
+
+def test_dry_run_estimates_remaining_rows_without_writing(engine):
+    backfill(engine, max_batches=1)
+
+    estimate = backfill(engine, dry_run=True)
+
+    assert (estimate.estimated_rows, estimate.estimated_batches) == (150, 2)
+    assert estimate.last_key == 100
+    assert filled(engine) == 100
+
+
+def test_failed_batch_rolls_back_with_its_checkpoint(engine):
+    calls = 0
+
+    def flaky(conn, rows):
+        nonlocal calls
+        calls += 1
+        fill_upper(conn, rows)
+        if calls == 2:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run_backfill(
+            engine, "items_upper", table="items", columns=["v"], process=flaky, batch_size=100
+        )
+
+    # 第二批连同进度一起回滚：已提交的只有第一批
+    assert filled(engine) == 100
+    with engine.connect() as conn:
+        assert load_checkpoint(conn, "items_upper").last_key == 100
+
+    assert backfill(engine).rows == 150
+    reset_checkpoint(engine, "items_upper")
+    with engine.connect() as conn:
+        assert load_checkpoint(conn, "items_upper") is None
@@ -0,0 +1,45 @@
+import asyncio
+
+from app import settings
+from app.ai import provider_pool
+from app.db import get_db
+from app.main import app
+from app.scripts.bench_http import compare, run_suite
+
+
+def test_run_suite_covers_all_scenarios_without_errors():
+    override = app.dependency_overrides.get(get_db)
+    pool = provider_pool._pool
+    ai_rps = settings.RATE_LIMIT_AI_RPS
+
+    results = asyncio.run(run_suite(app, seed=30, requests=5, concurrency=2))
+
+    assert set(results) == {
+        "create",
+        "get",
+        "list_shallow",
+        "list_deep",
+        "update",
+        "delete",
+        "ai_summarize",
+        "ai_rewrite",
+        "ai_tool_select",
+    }
+    for name, r in results.items():
+        assert r["errors"] == 0, name
+        assert r["requests"] == 5
+        assert r["p99_ms"] >= r["p50_ms"] > 0
+
+    # 跑完要把临时库 / 替身上游 / 限流配置都还原
+    assert app.dependency_overrides.get(get_db) is override
+    assert provider_pool._pool is pool
+    assert settings.RATE_LIMIT_AI_RPS == ai_rps
+
+
+def test_compare_flags_slower_p50_and_lower_throughput():
+    base = {"get": {"rps": 100.0, "p50_ms": 2.0}, "list": {"rps": 50.0, "p50_ms": 4.0}}
+    cur = {"get": {"rps": 95.0, "p50_ms": 2.1}, "list": {"rps": 30.0, "p50_ms": 6.0}}
+    out = compare(cur, base, threshold=0.15)
+    assert len(out) == 2
+    assert all(line.startswith("list:") for line in out)
+    assert compare(cur, {}, threshold=0.15) == []
@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+from app.core.coherence import SharedTokenBuckets, VersionedCache
+from app.security import ApiClient, RateLimiter
+
+
+def test_versioned_cache_drops_everything_when_the_version_moves():
+    cache = VersionedCache("t", maxsize=2)
+    cache.put(1, "a", ["A"])
+    assert cache.get(1, "a") == ["A"]
+
+    # 别的 worker 写过：版本号变了，旧条目全部作废
+    assert cache.get(2, "a") is None
+    # 查询开始时读到的是旧版本号：结果可能已经过时，不存
+    cache.put(1, "a", ["old"])
+    assert cache.get(2, "a") is None
+
+    cache.put(2, "a", ["A2"])
+    cache.put(2, "b", ["B"])
+    cache.put(2, "c", ["C"])  # 超过 maxsize，淘汰最久没用的
+    assert cache.get(2, "a") is None
+    assert cache.get(2, "c") == ["C"]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_shared_buckets_enforce_one_limit_across_forked_workers():
+    buckets = SharedTokenBuckets(slots=16)
+    limiter = RateLimiter(buckets)
+    client = ApiClient("shared", {"notes": (0.001, 5)})
+
+    pids = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            allowed = sum(limiter.take(client, "notes") == 0 for _ in range(4))
+            os._exit(allowed)
+        pids.append(pid)
+    allowed = sum(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) for pid in pids)
+
+    # 3 个进程各试 4 次，一共只放行桶容量那么多；父进程看到的是同一个桶
+    assert allowed == 5
+    assert limiter.take(client, "notes") > 0
+    # 不同的 key / 作用域是不同的桶
+    assert limiter.take(ApiClient("other", {"notes": (0.001, 5)}), "notes") == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_worker_killed_while_holding_the_lock_does_not_wedge_the_others():
+    buckets = SharedTokenBuckets(slots=16)
+
+    pid = os.fork()
+    if pid == 0:
+        lock = buckets._locked()
+        lock.__enter__()
+        os._exit(0)  # 带着锁死掉，不释放
+    os.waitpid(pid, 0)
+
+    t0 = time.monotonic()
+    assert buckets.take("k", 1.0, 1) == 0
+    assert time.monotonic() - t0 < 0.5
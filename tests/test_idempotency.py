@@ -0,0 +1,236 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import security, settings
+from app.ai import inflight as inflight_mod
+from app.ai import provider_pool
+from app.ai.inflight import SingleFlight
+from app.core.idempotency import IdempotencyMiddleware, IdempotencyStore, StoredResponse
+from app.db import Base, SessionLocal, engine
+from app.main import app
+from app.models import IdempotencyKey, Note
+from app.security import RateLimiter, hash_api_key, load_api_keys
+
+HEADERS = {"X-API-Key": "test-key"}
+# 每次运行用不同的 key：保存的响应在库里有 TTL，单独重跑这个文件也不会命中上一次的
+RUN = uuid.uuid4().hex[:8]
+
+Base.metadata.create_all(bind=engine)
+client = TestClient(app)
+
+
+def idempotency_layer() -> IdempotencyMiddleware:
+    # 中间件实例在第一次请求时才构建，沿着 app 往里找
+    client.get("/health")
+    layer = app.middleware_stack
+    while not isinstance(layer, IdempotencyMiddleware):
+        layer = layer.app
+    return layer
+
+
+def count_notes(title: str) -> int:
+    with SessionLocal() as db:
+        return db.query(Note).filter(Note.title == title).count()
+
+
+def test_retried_create_returns_original_response_without_a_second_row():
+    headers = {**HEADERS, "Idempotency-Key": f"create-1-{RUN}"}
+    body = {"title": f"idem-create-{RUN}", "content": "c"}
+
+    first = client.post("/v1/notes", json=body, headers=headers)
+    retry = client.post("/v1/notes", json=body, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["etag"] == first.headers["etag"]
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert count_notes(f"idem-create-{RUN}") == 1
+
+    # 进程内缓存没了（比如换了个 worker），从 SQLite 里回放
+    idempotency_layer().forget()
+    again = client.post("/v1/notes", json=body, headers=headers)
+    assert again.json()["id"] == first.json()["id"]
+    assert count_notes(f"idem-create-{RUN}") == 1
+
+    # 不带 key 的请求照常执行
+    client.post("/v1/notes", json=body, headers=HEADERS)
+    assert count_notes(f"idem-create-{RUN}") == 2
+
+
+def test_key_reused_with_different_body_is_rejected():
+    headers = {**HEADERS, "Idempotency-Key": f"create-2-{RUN}"}
+    client.post("/v1/notes", json={"title": f"idem-a-{RUN}", "content": "c"}, headers=headers)
+
+    other = {"title": f"idem-b-{RUN}", "content": "c"}
+    resp = client.post("/v1/notes", json=other, headers=headers)
+
+    assert resp.status_code == 422
+    assert resp.json()["error"]["code"] == "idempotency_key_reused"
+    assert count_notes(f"idem-b-{RUN}") == 0
+
+
+def test_keys_are_scoped_per_api_key_and_failures_are_not_stored(monkeypatch):
+    headers = {**HEADERS, "Idempotency-Key": f"create-3-{RUN}"}
+    body = {"title": f"idem-scope-{RUN}", "content": "c"}
+
+    # 401 不保存：之后用正确的 key 重试会真正执行
+    wrong = client.post("/v1/notes", json=body, headers={**headers, "X-API-Key": "wrong"})
+    assert wrong.status_code == 401
+    ok = client.post("/v1/notes", json=body, headers=headers)
+    assert ok.status_code == 200
+    assert "idempotent-replayed" not in ok.headers
+    with SessionLocal() as db:
+        assert db.query(IdempotencyKey).filter(IdempotencyKey.status_code.is_(None)).count() == 0
+
+
+def count_claims(idem_key: str) -> int:
+    with SessionLocal() as db:
+        return db.query(IdempotencyKey).filter(IdempotencyKey.key.endswith(f":{idem_key}")).count()
+
+
+def test_unknown_api_key_never_touches_the_store(monkeypatch):
+    statements: list[str] = []
+    monkeypatch.setattr(
+        IdempotencyMiddleware, "store", property(lambda self: statements.append("claim"))
+    )
+    idem_key = f"create-4-{RUN}"
+    headers = {"X-API-Key": "wrong", "Idempotency-Key": idem_key}
+
+    resp = client.post("/v1/notes", json={"title": "t", "content": "c"}, headers=headers)
+
+    assert resp.status_code == 401
+    assert "idempotent-replayed" not in resp.headers
+    assert statements == []
+    assert count_claims(idem_key) == 0
+
+
+def test_replay_rechecks_auth_and_rate_limit(monkeypatch):
+    keys = [
+        {"name": "replayer", "sha256": hash_api_key("replay-key"), "notes_rps": 0},
+        {
+            "name": "limited",
+            "sha256": hash_api_key("limited-key"),
+            "notes_rps": 0.01,
+            "notes_burst": 1,
+        },
+    ]
+    monkeypatch.setattr(security, "_keys", load_api_keys(json.dumps(keys)))
+    monkeypatch.setattr(security, "limiter", RateLimiter())
+    body = {"title": f"idem-auth-{RUN}", "content": "c"}
+
+    # 桶容量 1：第一次执行拿走令牌，回放同样要令牌 -> 429，不返回保存的响应
+    limited = {"X-API-Key": "limited-key", "Idempotency-Key": f"create-5-{RUN}"}
+    assert client.post("/v1/notes", json=body, headers=limited).status_code == 200
+    again = client.post("/v1/notes", json=body, headers=limited)
+    assert again.status_code == 429
+    assert "idempotent-replayed" not in again.headers
+
+    # key 被吊销：之前保存的响应不再回放，直接 401
+    revoked = {"X-API-Key": "replay-key", "Idempotency-Key": f"create-6-{RUN}"}
+    assert client.post("/v1/notes", json=body, headers=revoked).status_code == 200
+    monkeypatch.setattr(security, "_keys", load_api_keys(json.dumps(keys[1:])))
+    assert client.post("/v1/notes", json=body, headers=revoked).status_code == 401
+
+
+class SlowUpstream:
+    def __init__(self, delay: float = 0.1):
+        self.calls = 0
+        self.delay = delay
+
+    async def chat_json(self, user_prompt: str, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"rewritten": f"call-{self.calls}", "style": "formal"}
+
+    def snapshot(self) -> list:
+        return []
+
+
+def test_concurrent_duplicates_wait_for_the_first_request(monkeypatch):
+    up = SlowUpstream()
+    monkeypatch.setattr(provider_pool, "_pool", up)
+    monkeypatch.setattr(settings, "RATE_LIMIT_AI_RPS", 0)
+    monkeypatch.setattr(security, "_keys", None)
+    # 关掉 single-flight：确认去重的是 Idempotency-Key，而不是相同 prompt 的合并
+    monkeypatch.setattr(inflight_mod, "inflight", SingleFlight())
+    monkeypatch.setattr(inflight_mod, "call_key", lambda prompt, **kw: object())
+    idempotency_layer()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            headers = {**HEADERS, "Idempotency-Key": f"rewrite-1-{RUN}"}
+            body = {"content": "c", "style": "s"}
+            return await asyncio.gather(
+                *[ac.post("/ai/rewrite", json=body, headers=headers) for _ in range(3)]
+            )
+
+    responses = asyncio.run(scenario())
+
+    assert up.calls == 1
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert {r.json()["rewritten"] for r in responses} == {"call-1"}
+    assert sum(r.headers.get("idempotent-replayed") == "true" for r in responses) == 2
+
+
+def test_expired_claim_taken_over_cannot_be_completed_or_released_by_its_first_owner():
+    store = IdempotencyStore(engine)
+    key = f"store:POST:/ai/rewrite:takeover-{RUN}"
+    stored = StoredResponse("fp", 200, [], b"first", datetime.utcnow() + timedelta(hours=1))
+
+    assert store.claim(key, "fp", -1, "first")[0] == "claimed"  # 立刻过期
+    assert store.claim(key, "fp", 60, "second")[0] == "claimed"  # 别的进程接手
+
+    # 第一个请求迟迟才结束：既不能覆盖也不能删掉第二个请求的占位
+    assert not store.extend(key, "first", 60)
+    assert not store.complete(key, "first", stored)
+    store.release(key, "first")
+    assert store.claim(key, "fp", 60, "third")[0] == "pending"
+
+    assert store.complete(key, "second", stored)
+    assert store.claim(key, "fp", 60, "third")[1].body == b"first"
+
+
+def test_slow_request_keeps_its_claim_alive(monkeypatch):
+    up = SlowUpstream(delay=0.5)
+    monkeypatch.setattr(provider_pool, "_pool", up)
+    monkeypatch.setattr(settings, "RATE_LIMIT_AI_RPS", 0)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_S", 0.15)
+    monkeypatch.setattr(security, "_keys", None)
+    idem_key = f"rewrite-2-{RUN}"
+    layer = idempotency_layer()
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            headers = {**HEADERS, "Idempotency-Key": idem_key}
+            first = asyncio.create_task(
+                ac.post("/ai/rewrite", json={"content": "c", "style": "s"}, headers=headers)
+            )
+            await asyncio.sleep(0.35)
+            # 另一个进程此时来抢：占位已经续过期了，仍然是别人的
+            key = next(k for k in layer._inflight if k.endswith(idem_key))
+            status, _ = layer.store.claim(key, "other", 60, "intruder")
+            return status, await first
+
+    status, resp = asyncio.run(scenario())
+
+    assert status == "mismatch"
+    assert resp.status_code == 200
+    assert up.calls == 1
+
+
+def test_invalid_idempotency_key_is_rejected():
+    resp = client.post(
+        "/v1/notes",
+        json={"title": "t", "content": "c"},
+        headers={**HEADERS, "Idempotency-Key": "x" * 201},
+    )
+    assert resp.status_code == 400
+    assert resp.json()["error"]["code"] == "invalid_idempotency_key"
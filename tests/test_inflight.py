@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import pytest
+
+from app import security, settings
+from app.ai import inflight as inflight_mod
+from app.ai import provider_pool
+from app.ai.inflight import (
+    CLIENT_DISCONNECTS,
+    INFLIGHT_SHARED,
+    UPSTREAM_CANCELLED,
+    SingleFlight,
+)
+from app.main import app
+
+
+class SlowUpstream:
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.started = 0
+        self.cancelled = 0
+        self.finished = 0
+
+    async def chat_json(self, user_prompt: str, **kwargs):
+        self.started += 1
+        try:
+            await asyncio.sleep(self.delay_s)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.finished += 1
+        return {"rewritten": "ok", "style": "formal"}
+
+
+def test_single_flight_shares_and_keeps_work_while_someone_waits():
+    async def scenario():
+        sf = SingleFlight()
+        up = SlowUpstream(0.05)
+        shared_before = INFLIGHT_SHARED.value()
+        cancelled_before = UPSTREAM_CANCELLED.value()
+
+        a = asyncio.ensure_future(sf.run("k", lambda: up.chat_json("p")))
+        b = asyncio.ensure_future(sf.run("k", lambda: up.chat_json("p")))
+        await asyncio.sleep(0.01)
+        a.cancel()  # a 走了，但 b 还在等：上游调用不能取消
+        out = await b
+
+        assert out["rewritten"] == "ok"
+        assert a.cancelled()
+        assert (up.started, up.cancelled, up.finished) == (1, 0, 1)
+        assert INFLIGHT_SHARED.value() == shared_before + 1
+        assert UPSTREAM_CANCELLED.value() == cancelled_before
+        assert sf.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_cancels_upstream_when_last_waiter_leaves():
+    async def scenario():
+        sf = SingleFlight()
+        up = SlowUpstream(10)
+        cancelled_before = UPSTREAM_CANCELLED.value()
+
+        a = asyncio.ensure_future(sf.run("k", lambda: up.chat_json("p")))
+        b = asyncio.ensure_future(sf.run("k", lambda: up.chat_json("p")))
+        await asyncio.sleep(0.01)
+        a.cancel()
+        b.cancel()
+        await asyncio.gather(a, b, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert up.cancelled == 1
+        assert UPSTREAM_CANCELLED.value() == cancelled_before + 1
+        assert sf.in_flight() == 0
+
+    asyncio.run(scenario())
+
+
+async def _post_then_disconnect(path: str, body: dict, disconnect_after_s: float):
+    """直接按 ASGI 调用 app：发完请求体，过一会儿发 http.disconnect（模拟用户关掉页面）。"""
+    payload = json.dumps(body).encode()
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    sent: list[dict] = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(disconnect_after_s)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"x-api-key", settings.API_KEY.encode()),
+        ],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await app(scope, receive, send)
+    return sent
+
+
+def test_ai_route_cancels_upstream_on_client_disconnect(monkeypatch):
+    up = SlowUpstream(10)
+    monkeypatch.setattr(provider_pool, "_pool", up)
+    monkeypatch.setattr(settings, "RATE_LIMIT_AI_RPS", 0)
+    monkeypatch.setattr(security, "_keys", None)
+    monkeypatch.setattr(inflight_mod, "inflight", SingleFlight())
+    before = CLIENT_DISCONNECTS.value(route="rewrite")
+
+    async def scenario():
+        return await asyncio.wait_for(
+            _post_then_disconnect("/ai/rewrite", {"content": "c", "style": "s"}, 0.05),
+            timeout=5,
+        )
+
+    sent = asyncio.run(scenario())
+
+    assert up.started == 1
+    assert up.cancelled == 1
+    assert CLIENT_DISCONNECTS.value(route="rewrite") == before + 1
+    assert sent[0]["status"] == 499
+
+
+@pytest.mark.parametrize("kwargs", [{"max_tokens": 1}, {"temperature": 0.5}])
+def test_call_key_depends_on_prompt_and_params(kwargs):
+    base = inflight_mod.call_key("p", max_tokens=600, temperature=0.2)
+    assert base == inflight_mod.call_key("p", temperature=0.2, max_tokens=600)
+    assert base != inflight_mod.call_key("q", max_tokens=600, temperature=0.2)
+    assert base != inflight_mod.call_key("p", **{"max_tokens": 600, "temperature": 0.2, **kwargs})
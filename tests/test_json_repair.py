@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.ai.deepseek_client import DeepSeekClient
+from app.ai.json_repair import JsonRepairError, parse_model_json
+from app.core.metrics import AI_JSON_PARSE, UPSTREAM_RETRIES
+
+
+@pytest.mark.parametrize(
+    "content, expected, how",
+    [
+        ('{"a": 1}', {"a": 1}, "clean"),
+        ('```json\n{"a": 1}\n```', {"a": 1}, "fenced"),
+        ('好的，结果如下：{"a": {"b": 2}} 希望有帮助', {"a": {"b": 2}}, "extracted"),
+        ('<think>先想想 {x}</think>\n{"a": 1}', {"a": 1}, "extracted"),
+        (
+            '{"summary": "s", "bullets": ["x", "y',
+            {"summary": "s", "bullets": ["x", "y"]},
+            "truncated",
+        ),
+        ('{"summary": "s", "bullets": [], "extra":', {"summary": "s", "bullets": []}, "truncated"),
+        # 截断的外层对象里有完整的内层对象：补全外层，不能把内层对象当结果
+        (
+            '{"title":"t","meta":{"lang":"zh"},"bullets":["a","b',
+            {"title": "t", "meta": {"lang": "zh"}, "bullets": ["a", "b"]},
+            "truncated",
+        ),
+        (
+            '{"tools":[{"name":"x","args":{}}],"reason":"bec',
+            {"tools": [{"name": "x", "args": {}}], "reason": "bec"},
+            "truncated",
+        ),
+        ('说明 "引号 {"a": {"b": 1}}', {"a": {"b": 1}}, "extracted"),
+    ],
+)
+def test_parse_model_json_repairs_common_formatting_problems(content, expected, how):
+    assert parse_model_json(content) == (expected, how)
+
+
+def test_parse_model_json_falls_back_to_last_object_in_reasoning():
+    reasoning = '草稿 {"a": 0} ... 定稿 {"a": 1, "m": {"k": 2}}'
+    assert parse_model_json("", reasoning) == ({"a": 1, "m": {"k": 2}}, "reasoning")
+
+
+@pytest.mark.parametrize("content", ["no json here", "[1, 2]", '{"a": }'])
+def test_parse_model_json_raises_when_not_repairable(content):
+    with pytest.raises(JsonRepairError):
+        parse_model_json(content)
+
+
+def _mock_upstream(monkeypatch, contents: list[str]) -> list[dict]:
+    calls: list[dict] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(json.loads(request.content))
+        content = contents[len(calls) - 1]
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    real_client = httpx.AsyncClient
+
+    def client_factory(**kwargs):
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", client_factory)
+    return calls
+
+
+def test_client_repairs_locally_without_a_second_request(monkeypatch):
+    calls = _mock_upstream(monkeypatch, ['```json\n{"summary": "s", "bullets": []}\n```'])
+    client = DeepSeekClient("k", model="m-repair")
+
+    out = asyncio.run(client.chat_json("p"))
+
+    assert out == {"summary": "s", "bullets": []}
+    assert len(calls) == 1
+    assert AI_JSON_PARSE.value(model="m-repair", outcome="fenced") == 1
+    assert UPSTREAM_RETRIES.value(model="m-repair", reason="invalid_json") == 0
+
+
+def test_client_re_requests_only_when_repair_fails(monkeypatch):
+    calls = _mock_upstream(monkeypatch, ["抱歉，我无法完成", '{"summary": "s", "bullets": []}'])
+    client = DeepSeekClient("k", model="m-retry")
+
+    out = asyncio.run(client.chat_json("p"))
+
+    assert out["summary"] == "s"
+    assert len(calls) == 2
+    assert AI_JSON_PARSE.value(model="m-retry", outcome="failed") == 1
+    assert UPSTREAM_RETRIES.value(model="m-retry", reason="invalid_json") == 1
+
+
+def test_client_raises_after_last_unrepairable_attempt(monkeypatch):
+    _mock_upstream(monkeypatch, ["nope", "still nope"])
+    with pytest.raises(JsonRepairError):
+        asyncio.run(DeepSeekClient("k", model="m-fail").chat_json("p"))
@@ -0,0 +1,104 @@
+import io
+import json
+import logging
+import queue
+import sys
+
+from app.core.logging import (
+    LOG_DROPPED,
+    DroppingQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    parse_sample_rates,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+def make_record(name="request", level=logging.INFO, msg="GET / -> 200", **extra):
+    record = logging.LogRecord(name, level, __file__, 1, msg, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    before = LOG_DROPPED.value()
+
+    for _ in range(5):
+        handler.emit(make_record())
+
+    assert handler.queue.qsize() == 2
+    assert LOG_DROPPED.value() - before == 3
+
+
+def test_sampling_keeps_warnings_and_other_loggers():
+    f = SamplingFilter({"request": 0.0})
+
+    assert not f.filter(make_record())
+    assert f.filter(make_record(level=logging.WARNING))
+    assert f.filter(make_record(name="ai.service"))
+
+
+def test_json_formatter_includes_extra_fields():
+    line = JsonFormatter().format(make_record(timing={"db": 1.5}))
+    data = json.loads(line)
+
+    assert data["logger"] == "request"
+    assert data["msg"] == "GET / -> 200"
+    assert data["timing"] == {"db": 1.5}
+
+
+def test_json_exc_field_survives_the_queue():
+    handler = DroppingQueueHandler(queue.Queue())
+    logger = logging.getLogger("test.exc")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        try:
+            raise ValueError("kaput")
+        except ValueError:
+            logger.exception("boom %s", 1)
+    finally:
+        logger.removeHandler(handler)
+        logger.propagate = True
+
+    record = handler.queue.get_nowait()
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["msg"] == "boom 1"
+    assert data["exc"].startswith("Traceback")
+    assert "ValueError: kaput" in data["exc"]
+    # 文本格式照样在消息后面带上 traceback
+    text = logging.Formatter("%(message)s").format(record)
+    assert text.startswith("boom 1\nTraceback")
+
+
+def test_shutdown_flushes_the_queue_and_keeps_logging_afterwards(monkeypatch):
+    shutdown_logging()
+    out = io.StringIO()
+    monkeypatch.setattr(sys, "stdout", out)
+    root = logging.getLogger()
+    saved = root.handlers, root.level
+    try:
+        setup_logging()
+        logger = logging.getLogger("test.shutdown")
+        for i in range(200):
+            logger.warning("queued %s", i)
+        # worker 退出（os._exit）前调用：队列里的日志全部写出
+        shutdown_logging()
+        assert out.getvalue().count("queued") == 200
+
+        logger.warning("after shutdown")
+        assert "after shutdown" in out.getvalue()
+    finally:
+        shutdown_logging()
+        root.handlers, root.level = saved
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("request=0.1, ai.service=0.5") == {
+        "request": 0.1,
+        "ai.service": 0.5,
+    }
+    assert parse_sample_rates("") == {}
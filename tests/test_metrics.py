@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+from app.core.metrics import Counter, Histogram
+from app.main import app
+
+HEADERS = {"X-API-Key": "test-key"}
+
+client = TestClient(app)
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", ("op",), buckets=(0.1, 1))
+    h.observe(0.05, op="select")
+    h.observe(0.5, op="select")
+    h.observe(5, op="select")
+
+    text = "\n".join(h.render())
+
+    assert 't_seconds_bucket{op="select",le="0.1"} 1' in text
+    assert 't_seconds_bucket{op="select",le="1.0"} 2' in text
+    assert 't_seconds_bucket{op="select",le="+Inf"} 3' in text
+    assert 't_seconds_count{op="select"} 3' in text
+
+
+def test_counter_labels():
+    c = Counter("t_total", "test", ("model",))
+    c.inc(model="m1")
+    c.inc(2, model="m1")
+    assert c.value(model="m1") == 3.0
+    assert 't_total{model="m1"} 3.0' in c.render()
+
+
+def test_metrics_endpoint_exposes_route_db_and_threadpool():
+    client.get("/v1/notes/12345", headers=HEADERS)
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+
+    # 按路由模板打 label，而不是具体 id
+    assert 'route="/v1/notes/{note_id}",status="404"' in text
+    assert "/v1/notes/12345" not in text
+    assert 'db_query_duration_seconds_count{op="select"}' in text
+    assert "threadpool_max_threads " in text
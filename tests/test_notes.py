@@ -1,7 +1,8 @@
+import hashlib
 from datetime import datetime
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 
 from app.db import Base, get_db
@@ -23,6 +24,8 @@ TestingSessionLocal = sessionmaker(
     autocommit=False,
 )
 
+# 每次从干净的库开始：表结构变了（比如新加列）也不会被上次留下的旧库卡住
+Base.metadata.drop_all(bind=test_engine)
 Base.metadata.create_all(bind=test_engine)
 
 
@@ -162,3 +165,341 @@ def test_list_notes_sort_created_at_asc_desc():
     d_asc = r_asc.json()
     assert len(d_asc) == 2
     assert _iso_to_dt(d_asc[0]["created_at"]) <= _iso_to_dt(d_asc[1]["created_at"])
+
+
+def test_json_responses_declare_utf8_charset():
+    resp = client.get("/v1/notes", headers=HEADERS)
+    assert resp.headers["content-type"] == "application/json; charset=utf-8"
+
+    # 错误响应同样经过中间件
+    resp = client.get("/v1/notes/999", headers=HEADERS)
+    assert resp.headers["content-type"] == "application/json; charset=utf-8"
+
+
+def test_server_timing_header_breaks_down_request(monkeypatch):
+    from app import settings
+
+    resp = client.get("/v1/notes", headers=HEADERS)
+    assert "server-timing" not in resp.headers
+
+    monkeypatch.setattr(settings, "SERVER_TIMING", True)
+    client.post("/v1/notes", json={"title": "t1", "content": "c1"}, headers=HEADERS)
+    resp = client.get("/v1/notes", headers=HEADERS)
+
+    st = resp.headers["server-timing"]
+    names = [part.split(";")[0].strip() for part in st.split(",")]
+    assert {"auth", "db", "render", "total"} <= set(names)
+
+
+def test_writes_are_single_statement_with_returning():
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        created = client.post("/v1/notes", json={"title": "t", "content": "c"}, headers=HEADERS)
+        note_id = created.json()["id"]
+        client.put(f"/v1/notes/{note_id}", json={"title": "t2", "content": "c2"}, headers=HEADERS)
+        client.delete(f"/v1/notes/{note_id}", headers=HEADERS)
+        missing_put = client.put(
+            f"/v1/notes/{note_id}", json={"title": "t3", "content": "c3"}, headers=HEADERS
+        )
+        missing_delete = client.delete(f"/v1/notes/{note_id}", headers=HEADERS)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+
+    # 每次写入只有一条语句（没有先 SELECT、也没有 refresh）
+    # 更新没命中时才多查一次当前行：区分不存在 / 内容没变（no-op）
+    assert statements == ["INSERT", "UPDATE", "DELETE", "UPDATE", "SELECT", "DELETE"]
+    assert created.json()["created_at"]
+    assert_error(missing_put, 404, code="not_found", message="Note not found")
+    assert_error(missing_delete, 404, code="not_found", message="Note not found")
+
+
+def test_note_etag_if_none_match_returns_304_with_version_lookup_only():
+    created = client.post("/v1/notes", json={"title": "e", "content": "c"}, headers=HEADERS)
+    etag = created.headers["etag"]
+    note_id = created.json()["id"]
+
+    resp = client.get(f"/v1/notes/{note_id}", headers=HEADERS)
+    assert resp.headers["etag"] == etag
+    assert resp.headers["cache-control"] == "private, no-cache"
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        resp = client.get(f"/v1/notes/{note_id}", headers={**HEADERS, "If-None-Match": etag})
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["etag"] == etag
+    # 只查了版本号，没有查正文
+    assert len(statements) == 1
+    assert "content" not in statements[0]
+
+    # 弱校验形式同样命中
+    weak = client.get(f"/v1/notes/{note_id}", headers={**HEADERS, "If-None-Match": f"W/{etag}"})
+    assert weak.status_code == 304
+
+    # 更新后版本变了：旧 ETag 拿到完整的 200
+    client.put(f"/v1/notes/{note_id}", json={"title": "e2", "content": "c2"}, headers=HEADERS)
+    resp = client.get(f"/v1/notes/{note_id}", headers={**HEADERS, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.json()["version"] == 2
+    assert resp.headers["etag"] != etag
+
+
+def test_list_etag_changes_on_any_write():
+    resp = client.get("/v1/notes?limit=5", headers=HEADERS)
+    etag = resp.headers["etag"]
+
+    resp = client.get("/v1/notes?limit=5", headers={**HEADERS, "If-None-Match": etag})
+    assert resp.status_code == 304
+
+    # 分页参数不同，ETag 也不同
+    other = client.get("/v1/notes?limit=5&offset=5", headers=HEADERS)
+    assert other.headers["etag"] != etag
+
+    client.post("/v1/notes", json={"title": "new", "content": "c"}, headers=HEADERS)
+    resp = client.get("/v1/notes?limit=5", headers={**HEADERS, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+
+def test_if_match_guards_update_and_delete():
+    created = client.post("/v1/notes", json={"title": "m", "content": "c"}, headers=HEADERS)
+    note_id = created.json()["id"]
+    v1 = created.headers["etag"]
+
+    ok = client.put(
+        f"/v1/notes/{note_id}",
+        json={"title": "m2", "content": "c2"},
+        headers={**HEADERS, "If-Match": v1},
+    )
+    assert ok.status_code == 200
+    v2 = ok.headers["etag"]
+    assert v2 != v1
+
+    # 拿着旧版本再改：412，内容保持不变
+    stale = client.put(
+        f"/v1/notes/{note_id}",
+        json={"title": "lost", "content": "lost"},
+        headers={**HEADERS, "If-Match": v1},
+    )
+    assert_error(stale, 412, code="precondition_failed", message="Note has been modified")
+    assert client.get(f"/v1/notes/{note_id}", headers=HEADERS).json()["title"] == "m2"
+
+    stale_delete = client.delete(f"/v1/notes/{note_id}", headers={**HEADERS, "If-Match": v1})
+    assert stale_delete.status_code == 412
+
+    # If-Match 是强比较：弱 ETag 即使版本对得上也不算数
+    weak = client.put(
+        f"/v1/notes/{note_id}",
+        json={"title": "weak", "content": "weak"},
+        headers={**HEADERS, "If-Match": f"W/{v2}"},
+    )
+    assert weak.status_code == 412
+    weak_delete = client.delete(f"/v1/notes/{note_id}", headers={**HEADERS, "If-Match": f"W/{v2}"})
+    assert weak_delete.status_code == 412
+    # If-None-Match 仍然是弱比较
+    cached = client.get(f"/v1/notes/{note_id}", headers={**HEADERS, "If-None-Match": f"W/{v2}"})
+    assert cached.status_code == 304
+
+    deleted = client.delete(f"/v1/notes/{note_id}", headers={**HEADERS, "If-Match": v2})
+    assert deleted.status_code == 200
+
+    # 不存在的笔记仍然是 404（不是 412）
+    missing = client.put(
+        f"/v1/notes/{note_id}",
+        json={"title": "x", "content": "x"},
+        headers={**HEADERS, "If-Match": v2},
+    )
+    assert missing.status_code == 404
+
+
+def test_recreated_note_does_not_reuse_id_or_etag():
+    # 删掉的是当前最大 id 的笔记：没有 AUTOINCREMENT 时 SQLite 会把这个 id 给下一条
+    old = client.post("/v1/notes", json={"title": "old", "content": "secret"}, headers=HEADERS)
+    old_id, old_etag = old.json()["id"], old.headers["etag"]
+    assert client.delete(f"/v1/notes/{old_id}", headers=HEADERS).status_code == 200
+
+    new = client.post("/v1/notes", json={"title": "new", "content": "new"}, headers=HEADERS)
+    assert new.json()["id"] != old_id
+    assert new.headers["etag"] != old_etag
+
+    # 旧 ETag 拿不到 304，也过不了 If-Match
+    gone = client.get(f"/v1/notes/{old_id}", headers={**HEADERS, "If-None-Match": old_etag})
+    assert gone.status_code == 404
+    stale = client.put(
+        f"/v1/notes/{new.json()['id']}",
+        json={"title": "x", "content": "x"},
+        headers={**HEADERS, "If-Match": old_etag},
+    )
+    assert stale.status_code == 412
+
+
+def _seed_dated_notes():
+    db = TestingSessionLocal()
+    try:
+        for day, title in [(1, "alpha"), (8, "Alpha"), (15, "alpine"), (22, "beta")]:
+            ts = datetime(2026, 3, day, 12, 0, 0)
+            db.add(Note(title=title, content="c", created_at=ts, updated_at=ts))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_list_notes_time_window_and_title_prefix_filters():
+    _seed_dated_notes()
+
+    def titles(query: str) -> list[str]:
+        resp = client.get(f"/v1/notes?{query}", headers=HEADERS)
+        assert resp.status_code == 200
+        return [n["title"] for n in resp.json()]
+
+    # 左闭右开：3/8 12:00 这条包含在内，3/22 12:00 不包含
+    window = "created_after=2026-03-08T12:00:00&created_before=2026-03-22T12:00:00"
+    assert titles(window) == ["alpine", "Alpha"]
+    # 带时区的参数按 UTC 比较
+    assert titles("created_after=2026-03-22T20:00:00%2B08:00") == ["beta"]
+    assert titles("updated_before=2026-03-09T00:00:00&sort=updated_at_asc") == ["alpha", "Alpha"]
+    # 前缀区分大小写
+    assert titles("title_prefix=alp&sort=created_at_asc") == ["alpha", "alpine"]
+    assert titles("title_prefix=alp&created_after=2026-03-02T00:00:00") == ["alpine"]
+
+    # 过滤条件不同，列表 ETag 也不同
+    plain = client.get("/v1/notes", headers=HEADERS).headers["etag"]
+    filtered = client.get("/v1/notes?title_prefix=alp", headers=HEADERS).headers["etag"]
+    assert plain != filtered
+
+
+def test_list_filters_use_index_range_scans():
+    _seed_dated_notes()
+    queries = [
+        "created_after=2026-03-01T00:00:00",
+        "created_after=2026-03-01T00:00:00&created_before=2026-04-01T00:00:00&sort=created_at_asc",
+        "updated_after=2026-03-01T00:00:00",
+        "updated_after=2026-03-01T00:00:00&sort=updated_at_desc",
+        "title_prefix=alp",
+        "title_prefix=alp&updated_before=2026-04-01T00:00:00&sort=updated_at_asc",
+        f"content_hash={'0' * 64}",
+    ]
+    for query in queries:
+        statements: list[tuple[str, tuple]] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(test_engine, "before_cursor_execute", record)
+        try:
+            assert client.get(f"/v1/notes?{query}", headers=HEADERS).status_code == 200
+        finally:
+            event.remove(test_engine, "before_cursor_execute", record)
+
+        statement, parameters = next(s for s in statements if "FROM notes" in s[0])
+        with test_engine.connect() as conn:
+            plan = [
+                row[3]
+                for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            ]
+        # 只允许索引上的范围查询（SEARCH），不能出现 SCAN notes（全表/全索引扫描）
+        assert plan[0].startswith("SEARCH notes USING INDEX"), (query, plan)
+        assert not any(step.startswith("SCAN") for step in plan), (query, plan)
+
+
+def test_unchanged_put_skips_the_write_and_keeps_etags():
+    created = client.post("/v1/notes", json={"title": "s", "content": "same"}, headers=HEADERS)
+    note = created.json()
+    assert note["content_hash"] == hashlib.sha256("same".encode("utf-8")).hexdigest()
+    list_etag = client.get("/v1/notes", headers=HEADERS).headers["etag"]
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split(None, 1)[0].upper())
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        same = client.put(
+            f"/v1/notes/{note['id']}",
+            json={"title": "s", "content": "same"},
+            headers={**HEADERS, "If-Match": created.headers["etag"]},
+        )
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+
+    # UPDATE 没命中任何行（不写库、触发器不触发），再读一次当前行返回
+    assert statements == ["UPDATE", "SELECT"]
+    assert same.status_code == 200
+    assert same.json() == note
+    assert same.headers["etag"] == created.headers["etag"]
+    resp = client.get("/v1/notes", headers={**HEADERS, "If-None-Match": list_etag})
+    assert resp.status_code == 304
+
+    # 只改标题也是真正的更新
+    renamed = client.put(
+        f"/v1/notes/{note['id']}", json={"title": "s2", "content": "same"}, headers=HEADERS
+    )
+    assert renamed.json()["version"] == 2
+    assert renamed.json()["content_hash"] == note["content_hash"]
+
+    # 内容没变但 If-Match 是旧版本：仍然 412
+    stale = client.put(
+        f"/v1/notes/{note['id']}",
+        json={"title": "s2", "content": "same"},
+        headers={**HEADERS, "If-Match": created.headers["etag"]},
+    )
+    assert_error(stale, 412, code="precondition_failed")
+
+
+def test_list_notes_by_content_hash_finds_duplicates():
+    client.post("/v1/notes", json={"title": "a", "content": "dup"}, headers=HEADERS)
+    client.post("/v1/notes", json={"title": "b", "content": "dup"}, headers=HEADERS)
+    client.post("/v1/notes", json={"title": "c", "content": "other"}, headers=HEADERS)
+
+    h = hashlib.sha256("dup".encode("utf-8")).hexdigest()
+    resp = client.get(f"/v1/notes?content_hash={h}&sort=created_at_asc", headers=HEADERS)
+    assert [n["title"] for n in resp.json()] == ["a", "b"]
+
+    bad = client.get("/v1/notes?content_hash=xyz", headers=HEADERS)
+    assert bad.status_code == 422
+
+
+def test_list_cache_follows_writes_from_other_processes():
+    client.post("/v1/notes", json={"title": "cached", "content": "c"}, headers=HEADERS)
+    assert [n["title"] for n in client.get("/v1/notes", headers=HEADERS).json()] == ["cached"]
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine, "before_cursor_execute", record)
+    try:
+        again = client.get("/v1/notes", headers=HEADERS)
+    finally:
+        event.remove(test_engine, "before_cursor_execute", record)
+    # 命中进程内缓存：只查了一次集合版本号
+    assert len(statements) == 1
+    assert "collection_versions" in statements[0]
+    assert [n["title"] for n in again.json()] == ["cached"]
+
+    # 另一个 worker（另一个连接）写入：触发器让版本号 +1，这边的缓存随之作废
+    other = create_engine(TEST_DATABASE_URL)
+    with other.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO notes (title, content, created_at, updated_at, version) "
+                "VALUES ('elsewhere', 'c', '2999-01-01 00:00:00', '2999-01-01 00:00:00', 1)"
+            )
+        )
+    other.dispose()
+    titles = [n["title"] for n in client.get("/v1/notes", headers=HEADERS).json()]
+    assert titles == ["elsewhere", "cached"]
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+
+from app import settings
+from app.main import app
+
+client = TestClient(app)
+
+
+def enable(monkeypatch, tmp_path, mode="sampling"):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(settings, "PROFILING_MODE", mode)
+    monkeypatch.setattr(settings, "PROFILING_INTERVAL_MS", 1.0)
+    monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+
+
+def test_profile_requires_valid_api_key(monkeypatch, tmp_path):
+    enable(monkeypatch, tmp_path)
+
+    resp = client.get("/health", headers={"X-Profile": "1"})
+    assert "x-profile-id" not in resp.headers
+
+    resp = client.get("/health", headers={"X-Profile": "1", "X-API-Key": "wrong"})
+    assert "x-profile-id" not in resp.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profile_writes_folded_stacks(monkeypatch, tmp_path):
+    enable(monkeypatch, tmp_path)
+
+    resp = client.get("/health", headers={"X-Profile": "1", "X-API-Key": "test-key"})
+
+    assert resp.status_code == 200
+    name = resp.headers["x-profile-id"]
+    assert name.endswith("_GET_health.folded")
+    assert (tmp_path / name).exists()
+
+
+def test_profile_cprofile_mode(monkeypatch, tmp_path):
+    enable(monkeypatch, tmp_path, mode="cprofile")
+
+    resp = client.get("/health", headers={"X-Profile": "1", "X-API-Key": "test-key"})
+
+    assert (tmp_path / resp.headers["x-profile-id"]).stat().st_size > 0
+
+
+def test_disabled_profiling_ignores_header(tmp_path):
+    resp = client.get("/health", headers={"X-Profile": "1", "X-API-Key": "test-key"})
+    assert "x-profile-id" not in resp.headers
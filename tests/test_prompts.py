@@ -32,3 +32,9 @@ def test_prompt_render_missing_placeholder_gives_friendly_error():
     assert "Missing placeholder" in msg
     assert "rewrite_v1" in msg
     assert "style" in msg
+
+
+def test_prompt_render_tool_select():
+    text = render_prompt("tool_select_v2", request="搜索 docker")
+    assert "搜索 docker" in text
+    assert '{"query": "string"}' in text
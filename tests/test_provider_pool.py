@@ -0,0 +1,110 @@
+import asyncio
+import random
+
+import pytest
+
+from app.ai.deepseek_client import UpstreamError
+from app.ai.provider_pool import ProviderPool, ProviderSpec, load_provider_specs
+
+
+class FakeClient:
+    def __init__(self, name: str, fail: UpstreamError | None = None):
+        self.name = name
+        self.fail = fail
+        self.calls = 0
+
+    async def chat_json(self, user_prompt: str, **kwargs):
+        self.calls += 1
+        if self.fail is not None:
+            raise self.fail
+        return {"provider": self.name}
+
+    async def warm(self, connections: int) -> int:
+        return connections
+
+
+def make_pool(fails: dict[str, UpstreamError | None]) -> tuple[ProviderPool, dict]:
+    clients = {name: FakeClient(name, err) for name, err in fails.items()}
+    specs = [ProviderSpec(name=n, base_url=f"http://{n}", model="m") for n in fails]
+    pool = ProviderPool(
+        specs,
+        client_factory=lambda spec, timeout_s: clients[spec.name],
+        rng=random.Random(0),
+    )
+    return pool, clients
+
+
+def test_pool_fails_over_on_retryable_error():
+    pool, clients = make_pool(
+        {"a": UpstreamError("HTTP 503", status_code=503, retryable=True), "b": None}
+    )
+    pool.stats["a"].ewma_latency_ms = 1.0  # 让 a 几乎总是首选
+    pool.stats["b"].ewma_latency_ms = 1000.0
+
+    data = asyncio.run(pool.chat_json("hi"))
+
+    assert data == {"provider": "b"}
+    assert clients["a"].calls == 1
+    assert pool.stats["a"].errors == 1
+    assert pool.stats["b"].failovers == 1
+    assert pool.stats["a"].ewma_error_rate > 0
+
+
+def test_pool_does_not_fail_over_on_client_error():
+    pool, clients = make_pool(
+        {"a": UpstreamError("HTTP 400", status_code=400, retryable=False), "b": None}
+    )
+    pool.stats["a"].ewma_latency_ms = 1.0
+    pool.stats["b"].ewma_latency_ms = 1000.0
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(pool.chat_json("hi"))
+    assert clients["b"].calls == 0
+
+
+def test_pool_prefers_fast_and_healthy_provider():
+    pool, _ = make_pool({"fast": None, "slow": None, "flaky": None})
+    pool.stats["fast"].ewma_latency_ms = 100.0
+    pool.stats["slow"].ewma_latency_ms = 2000.0
+    pool.stats["flaky"].ewma_latency_ms = 100.0
+    pool.stats["flaky"].ewma_error_rate = 0.9
+
+    firsts = [pool.order()[0] for _ in range(500)]
+
+    assert firsts.count("fast") > firsts.count("flaky") > firsts.count("slow")
+
+
+def test_load_provider_specs_defaults_to_single_provider():
+    specs = load_provider_specs("")
+    assert len(specs) == 1
+    assert specs[0].name == "default"
+
+    specs = load_provider_specs('[{"name": "x", "model": "m1", "weight": 3}]')
+    assert specs[0].name == "x"
+    assert specs[0].model == "m1"
+    assert specs[0].weight == 3.0
+
+
+def test_warm_up_prompt_records_latency_but_never_errors():
+    pool, _ = make_pool(
+        {
+            "empty": UpstreamError("DeepSeek returned empty content", retryable=True),
+            "denied": UpstreamError("HTTP 401", status_code=401),
+            "ok": None,
+        }
+    )
+
+    out = asyncio.run(pool.warm(2, prompt="ping"))
+
+    assert {name: r["connections"] for name, r in out.items()} == {
+        "empty": 2,
+        "denied": 2,
+        "ok": 2,
+    }
+    assert [out[n]["prompt_ok"] for n in ("empty", "denied", "ok")] == [False, False, True]
+    for st in pool.stats.values():
+        assert (st.requests, st.errors, st.ewma_error_rate) == (0, 0, 0.0)
+    # 空 content 也是上游完整走了一遍：记延迟；秒回的 401 不记
+    assert pool.stats["empty"].ewma_latency_ms is not None
+    assert pool.stats["ok"].ewma_latency_ms is not None
+    assert pool.stats["denied"].ewma_latency_ms is None
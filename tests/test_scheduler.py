@@ -0,0 +1,183 @@
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import security, settings
+from app.ai import inflight as inflight_mod
+from app.ai import provider_pool
+from app.ai import scheduler as scheduler_mod
+from app.ai.inflight import SingleFlight
+from app.ai.scheduler import BATCH, INTERACTIVE, FairScheduler, RequestClass, current_request_class
+from app.main import app
+
+HEADERS = {"X-API-Key": "test-key"}
+
+
+async def _hold(s: FairScheduler, rc: RequestClass, order: list, gate: asyncio.Event):
+    async with s.slot(rc):
+        order.append(rc.caller)
+        await gate.wait()
+
+
+def test_batch_cannot_take_the_interactive_reserve():
+    async def scenario():
+        s = FairScheduler(capacity=3, interactive_reserve=1)
+        gate = asyncio.Event()
+        order: list[str] = []
+        batch = [
+            asyncio.ensure_future(_hold(s, RequestClass(f"b{i}", BATCH), order, gate))
+            for i in range(4)
+        ]
+        await asyncio.sleep(0.01)
+        assert s.snapshot()["running"] == {INTERACTIVE: 0, BATCH: 2}
+        assert s.snapshot()["waiting"][BATCH] == 2
+
+        # 批量任务排着队，交互请求照样立刻拿到预留的名额
+        inter = asyncio.ensure_future(_hold(s, RequestClass("i", INTERACTIVE), order, gate))
+        await asyncio.sleep(0.01)
+        assert order == ["b0", "b1", "i"]
+
+        gate.set()
+        await asyncio.gather(inter, *batch)
+        assert s.snapshot()["running"] == {INTERACTIVE: 0, BATCH: 0}
+
+    asyncio.run(scenario())
+
+
+def test_interactive_waiters_go_before_batch_waiters():
+    async def scenario():
+        s = FairScheduler(capacity=1)
+        first = asyncio.Event()
+        order: list[str] = []
+        holder = asyncio.ensure_future(_hold(s, RequestClass("h", INTERACTIVE), order, first))
+        await asyncio.sleep(0.01)
+
+        done = asyncio.Event()
+        done.set()
+        b = asyncio.ensure_future(_hold(s, RequestClass("b", BATCH), order, done))
+        await asyncio.sleep(0.01)
+        i = asyncio.ensure_future(_hold(s, RequestClass("i", INTERACTIVE), order, done))
+        await asyncio.sleep(0.01)
+
+        first.set()
+        await asyncio.gather(holder, b, i)
+        assert order == ["h", "i", "b"]
+
+    asyncio.run(scenario())
+
+
+def test_fair_queueing_interleaves_callers_by_weight():
+    async def scenario():
+        s = FairScheduler(capacity=1)
+        gate = asyncio.Event()
+        order: list[str] = []
+        holder = asyncio.ensure_future(_hold(s, RequestClass("h"), order, gate))
+        await asyncio.sleep(0.01)
+
+        done = asyncio.Event()
+        done.set()
+        tasks = []
+        # a 先一口气排 6 个，b 后来排 3 个，但 b 的权重是 2
+        for _ in range(6):
+            tasks.append(asyncio.ensure_future(_hold(s, RequestClass("a"), order, done)))
+            await asyncio.sleep(0)
+        for _ in range(3):
+            tasks.append(asyncio.ensure_future(_hold(s, RequestClass("b", weight=2), order, done)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+        # a 的完成时间 1,2,3...；b 的 0.5,1,1.5：b 没有被 a 的 6 个请求堵在后面
+        assert order[1:6] == ["b", "a", "b", "b", "a"]
+        assert order.count("a") == 6
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        s = FairScheduler(capacity=1)
+        gate = asyncio.Event()
+        order: list[str] = []
+        holder = asyncio.ensure_future(_hold(s, RequestClass("h"), order, gate))
+        await asyncio.sleep(0.01)
+
+        gone = asyncio.ensure_future(_hold(s, RequestClass("gone"), order, gate))
+        await asyncio.sleep(0.01)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        assert s.snapshot()["waiting"][INTERACTIVE] == 0
+
+        gate.set()
+        await holder
+        await asyncio.wait_for(_hold(s, RequestClass("next"), order, gate), timeout=1)
+        assert order == ["h", "next"]
+        assert s.snapshot()["running"][INTERACTIVE] == 0
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_wakes_waiters_on_other_event_loops():
+    s = FairScheduler(capacity=1)
+    order: list[str] = []
+
+    async def main_loop():
+        gate = asyncio.Event()
+        holder = asyncio.ensure_future(_hold(s, RequestClass("main"), order, gate))
+        await asyncio.sleep(0.01)
+
+        # 摘要后台线程有自己的事件循环，释放名额时要跨循环唤醒它
+        thread = threading.Thread(target=lambda: asyncio.run(_other_loop()))
+        thread.start()
+        while s.snapshot()["waiting"][BATCH] == 0:
+            await asyncio.sleep(0.01)
+        gate.set()
+        await holder
+        await asyncio.to_thread(thread.join, 5)
+
+    async def _other_loop():
+        async with s.slot(RequestClass("worker", BATCH)):
+            order.append("worker")
+
+    asyncio.run(main_loop())
+    assert order == ["main", "worker"]
+
+
+class RecordingUpstream:
+    def __init__(self):
+        self.classes: list[RequestClass] = []
+
+    async def chat_json(self, user_prompt: str, **kwargs):
+        self.classes.append(current_request_class())
+        return {"rewritten": "ok", "style": "formal"}
+
+    def snapshot(self) -> list:
+        return []
+
+
+def test_ai_route_schedules_by_api_key_and_priority_header(monkeypatch):
+    up = RecordingUpstream()
+    monkeypatch.setattr(provider_pool, "_pool", up)
+    monkeypatch.setattr(settings, "RATE_LIMIT_AI_RPS", 0)
+    monkeypatch.setattr(security, "_keys", None)
+    monkeypatch.setattr(inflight_mod, "inflight", SingleFlight())
+    monkeypatch.setattr(scheduler_mod, "_scheduler", FairScheduler(2, 1))
+    client = TestClient(app)
+
+    body = {"content": "c", "style": "s"}
+    assert client.post("/ai/rewrite", json=body, headers=HEADERS).status_code == 200
+    resp = client.post("/ai/rewrite", json=body, headers={**HEADERS, "X-Priority": "batch"})
+    assert resp.status_code == 200
+    assert [(c.caller, c.priority) for c in up.classes] == [
+        ("default", INTERACTIVE),
+        ("default", BATCH),
+    ]
+
+    resp = client.post("/ai/rewrite", json=body, headers={**HEADERS, "X-Priority": "urgent"})
+    assert resp.status_code == 422
+
+    snap = client.get("/ai/providers", headers=HEADERS).json()["scheduler"]
+    assert snap["capacity"] == 2
+    assert snap["running"] == {INTERACTIVE: 0, BATCH: 0}
@@ -0,0 +1,68 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import app.security as security
+from app.main import app
+from app.security import RateLimiter, hash_api_key, load_api_keys
+
+client = TestClient(app)
+
+
+def use_keys(monkeypatch, items):
+    monkeypatch.setattr(security, "_keys", load_api_keys(json.dumps(items)))
+    monkeypatch.setattr(security, "limiter", RateLimiter())
+
+
+def test_multiple_hashed_keys(monkeypatch):
+    use_keys(
+        monkeypatch,
+        [
+            {"name": "web", "sha256": hash_api_key("web-key")},
+            {"name": "batch", "sha256": hash_api_key("batch-key")},
+        ],
+    )
+
+    assert security.lookup_api_key("web-key").name == "web"
+    assert security.lookup_api_key("batch-key").name == "batch"
+    assert security.lookup_api_key("test-key").name == "default"  # 旧的 API_KEY 仍然可用
+    assert security.lookup_api_key("nope") is None
+
+    resp = client.get("/v1/notes", headers={"X-API-Key": "nope"})
+    assert resp.status_code == 401
+
+
+def test_rate_limits_are_off_unless_a_key_opts_in(monkeypatch):
+    use_keys(monkeypatch, [{"name": "web", "sha256": hash_api_key("web-key"), "ai_rps": 2}])
+
+    # 旧的单 API_KEY 升级后不会突然被限流
+    assert security.lookup_api_key("test-key").limits["ai"][0] == 0
+    assert security.lookup_api_key("test-key").limits["notes"][0] == 0
+    assert security.lookup_api_key("web-key").limits["ai"][0] == 2
+
+
+def test_rate_limit_returns_429_with_retry_after(monkeypatch):
+    use_keys(
+        monkeypatch,
+        [
+            {
+                "name": "tiny",
+                "sha256": hash_api_key("tiny-key"),
+                "notes_rps": 0.1,
+                "notes_burst": 2,
+            }
+        ],
+    )
+    headers = {"X-API-Key": "tiny-key"}
+
+    assert client.get("/v1/notes", headers=headers).status_code == 200
+    assert client.get("/v1/notes", headers=headers).status_code == 200
+    resp = client.get("/v1/notes", headers=headers)
+
+    assert resp.status_code == 429
+    assert resp.json()["error"]["code"] == "rate_limited"
+    assert 1 <= int(resp.headers["retry-after"]) <= 10
+    assert security.API_REQUESTS.value(key="tiny", scope="notes", outcome="limited") >= 1
+
+    # 其它 key 的桶互不影响
+    assert client.get("/v1/notes", headers={"X-API-Key": "test-key"}).status_code == 200
@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+from sqlalchemy import inspect
+
+from app.db import engine
+from app.main import app
+
+HEAVY = ("httpx", "app.ai.provider_pool", "app.ai.deepseek_client", "app.ai.tool_select")
+
+
+def _imported_after_main(ai_enabled: str) -> list[str]:
+    # 新进程里 import，才能看到“导入 app.main 到底带进来了哪些模块”
+    code = f"import sys, app.main; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    env = {**os.environ, "AI_ENABLED": ai_enabled}
+    out = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def test_import_does_not_load_ai_client_stack():
+    assert _imported_after_main("1") == []
+    assert _imported_after_main("0") == []
+
+
+def test_ai_routes_can_be_disabled():
+    code = "import app.main as m; print(any(r.path.startswith('/ai') for r in m.app.routes))"
+    env = {**os.environ, "AI_ENABLED": "0"}
+    out = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "False"
+    assert any(r.path == "/ai/summarize" for r in app.routes)
+
+
+def test_lifespan_creates_tables_in_dev():
+    with TestClient(app) as c:
+        assert c.get("/health").json() == {"status": "ok"}
+    assert "notes" in inspect(engine).get_table_names()
@@ -0,0 +1,169 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import app.services.summary_service as summary_service
+from app.ai import provider_pool
+from app.ai.output_schemas import SummaryOut
+from app.db import Base, SessionLocal, engine
+from app.main import app
+from app.models import NoteSummary
+from app.services.summary_service import SummaryWorker
+
+HEADERS = {"X-API-Key": "test-key"}
+
+# 和 test_notes 用的是同一个库文件（conftest 里的 DATABASE_URL）
+Base.metadata.create_all(bind=engine)
+client = TestClient(app)
+
+
+class StubSummarizer:
+    def __init__(self, fail: bool = False):
+        self.calls: list[str] = []
+        self.fail = fail
+
+    async def __call__(self, content: str, prompt_key: str) -> SummaryOut:
+        self.calls.append(content)
+        if self.fail:
+            raise RuntimeError("model down")
+        return SummaryOut(summary=f"sum:{content}", bullets=[])
+
+
+def use_worker(monkeypatch, summarizer) -> SummaryWorker:
+    worker = SummaryWorker(SessionLocal, summarize=summarizer, queue_size=100)
+    monkeypatch.setattr(summary_service, "_worker", worker)
+    return worker
+
+
+def test_summary_is_materialized_in_background_and_tracks_content(monkeypatch):
+    stub = StubSummarizer()
+    worker = use_worker(monkeypatch, stub)
+
+    note = client.post("/v1/notes", json={"title": "t", "content": "v1"}, headers=HEADERS).json()
+    url = f"/v1/notes/{note['id']}/summary"
+
+    resp = client.get(url, headers=HEADERS)
+    assert resp.json()["status"] == "pending"
+    assert resp.json()["summary"] is None
+
+    assert worker.run_pending() == 1
+    resp = client.get(url, headers=HEADERS).json()
+    assert resp["status"] == "ready"
+    assert resp["summary"]["summary"] == "sum:v1"
+
+    # 只改标题：正文 hash 没变，不会重新调模型
+    client.put(f"/v1/notes/{note['id']}", json={"title": "t2", "content": "v1"}, headers=HEADERS)
+    worker.run_pending()
+    assert stub.calls == ["v1"]
+
+    # 改正文：旧摘要先顶着（stale），后台算完变成 ready
+    client.put(f"/v1/notes/{note['id']}", json={"title": "t2", "content": "v2"}, headers=HEADERS)
+    resp = client.get(url, headers=HEADERS).json()
+    assert resp["status"] == "stale"
+    assert resp["summary"]["summary"] == "sum:v1"
+
+    worker.run_pending()
+    resp = client.get(url, headers=HEADERS).json()
+    assert resp["status"] == "ready"
+    assert resp["summary"]["summary"] == "sum:v2"
+    assert stub.calls == ["v1", "v2"]
+
+
+def test_reading_summary_is_one_query_and_no_model_call(monkeypatch):
+    stub = StubSummarizer()
+    worker = use_worker(monkeypatch, stub)
+    note = client.post("/v1/notes", json={"title": "t", "content": "x"}, headers=HEADERS).json()
+    worker.run_pending()
+
+    statements: list[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        resp = client.get(f"/v1/notes/{note['id']}/summary", headers=HEADERS)
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+
+    assert resp.json()["status"] == "ready"
+    assert len(statements) == 1
+    assert len(stub.calls) == 1
+
+
+def test_failed_summary_and_deleted_note(monkeypatch):
+    worker = use_worker(monkeypatch, StubSummarizer(fail=True))
+    note = client.post("/v1/notes", json={"title": "t", "content": "y"}, headers=HEADERS).json()
+    worker.run_pending()
+
+    url = f"/v1/notes/{note['id']}/summary"
+    assert client.get(url, headers=HEADERS).json()["status"] == "failed"
+
+    client.delete(f"/v1/notes/{note['id']}", headers=HEADERS)
+    assert client.get(url, headers=HEADERS).status_code == 404
+    # 删掉的笔记不再占着失败记录
+    assert note["id"] not in worker.failed
+
+
+def test_note_deleted_during_summarize_leaves_no_orphan(monkeypatch):
+    class DeletingSummarizer(StubSummarizer):
+        async def __call__(self, content: str, prompt_key: str) -> SummaryOut:
+            # 模型还在算的时候笔记被删了
+            client.delete(f"/v1/notes/{note['id']}", headers=HEADERS)
+            return await super().__call__(content, prompt_key)
+
+    worker = use_worker(monkeypatch, DeletingSummarizer())
+    note = client.post("/v1/notes", json={"title": "t", "content": "private"}, headers=HEADERS)
+    note = note.json()
+    worker.run_pending()
+
+    with SessionLocal() as db:
+        assert db.get(NoteSummary, note["id"]) is None
+    assert note["id"] not in worker.failed
+
+
+def test_failed_records_are_capped(monkeypatch):
+    worker = use_worker(monkeypatch, StubSummarizer(fail=True))
+    worker.failed_items = 2
+    notes = [
+        client.post("/v1/notes", json={"title": "t", "content": f"f{i}"}, headers=HEADERS).json()
+        for i in range(3)
+    ]
+    ids = [n["id"] for n in notes]
+    worker.run_pending()
+
+    # 上游一直失败也只记最近的 failed_items 条，最早的先忘
+    assert list(worker.failed) == ids[1:]
+
+
+def test_summary_unavailable_when_worker_disabled(monkeypatch):
+    worker = use_worker(monkeypatch, StubSummarizer())
+    worker.enabled = False
+    note = client.post("/v1/notes", json={"title": "t", "content": "z"}, headers=HEADERS).json()
+
+    assert worker.depth() == 0
+    resp = client.get(f"/v1/notes/{note['id']}/summary", headers=HEADERS).json()
+    assert resp["status"] == "unavailable"
+
+
+class ClosingPool:
+    def __init__(self):
+        self.closed_on: list = []
+
+    async def aclose(self):
+        self.closed_on.append(asyncio.get_running_loop())
+
+
+def test_worker_closes_upstream_connections_on_its_own_loop(monkeypatch):
+    pool = ClosingPool()
+    monkeypatch.setattr(provider_pool, "_pool", pool)
+    worker = use_worker(monkeypatch, StubSummarizer())
+    client.post("/v1/notes", json={"title": "t", "content": "close"}, headers=HEADERS)
+
+    worker.run_pending()
+
+    # 后台 loop 上建的连接在这个 loop 关闭之前关掉
+    assert len(pool.closed_on) == 1
+    assert pool.closed_on[0].is_closed()
@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import app.ai.tool_select as tool_select
+from app.ai.tool_select import ToolSelector
+
+
+def test_rules_pick_tool_and_args():
+    selector = ToolSelector()
+
+    d = selector.classify_local("搜索关于 docker 的笔记")
+    assert d.source == "rules"
+    assert d.out.tool_name == "search_notes"
+    assert d.out.args == {"query": "docker"}
+
+    d = selector.classify_local("新建一条笔记：明天下午开会")
+    assert d.out.tool_name == "create_note"
+    assert d.out.args["content"] == "明天下午开会"
+
+    d = selector.classify_local("把第 3 条笔记的内容改成：会议改到周四")
+    assert d.out.tool_name == "update_note"
+    assert d.out.args == {"note_id": 3, "title": None, "content": "会议改到周四"}
+
+
+def test_tfidf_handles_paraphrases():
+    d = ToolSelector().classify_local("上周关于部署的笔记")
+    assert d.source == "tfidf"
+    assert d.out.tool_name == "search_notes"
+
+
+def test_uncertain_input_is_left_to_the_model():
+    selector = ToolSelector()
+    # 想修改，但没有 note_id：本地不该猜
+    assert selector.classify_local("把那条笔记改一下") is None
+    assert selector.classify_local("天气怎么样") is None
+
+
+def test_select_falls_back_to_llm_and_counts_fast_path(monkeypatch):
+    calls = []
+
+    class FakePool:
+        async def chat_json(self, prompt, **kwargs):
+            calls.append(prompt)
+            return {"tool_name": "search_notes", "args": {"query": "天气"}}
+
+    monkeypatch.setattr(tool_select, "get_provider_pool", lambda: FakePool())
+    selector = ToolSelector()
+
+    fast = asyncio.run(selector.select("搜索关于 docker 的笔记"))
+    slow = asyncio.run(selector.select("天气怎么样"))
+
+    assert fast.source == "rules"
+    assert slow.source == "llm"
+    assert len(calls) == 1
+    assert "天气怎么样" in calls[0]
+    assert selector.stats.snapshot()["fast_path_rate"] == 0.5
+
+
+def test_failed_llm_calls_still_count_towards_total(monkeypatch):
+    class BrokenPool:
+        async def chat_json(self, prompt, **kwargs):
+            raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(tool_select, "get_provider_pool", lambda: BrokenPool())
+    selector = ToolSelector()
+
+    asyncio.run(selector.select("搜索关于 docker 的笔记"))
+    with pytest.raises(HTTPException):
+        asyncio.run(selector.select("天气怎么样"))
+
+    snap = selector.stats.snapshot()
+    assert snap["by_source"]["llm_failed"] == 1
+    assert snap["fast_path_rate"] == 0.5
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import settings
+from app.ai import provider_pool
+from app.ai.deepseek_client import DeepSeekClient
+from app.main import app
+
+
+class GatedPool:
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls: list[tuple] = []
+
+    async def warm(self, connections: int, *, prompt=None):
+        self.calls.append((connections, prompt))
+        await asyncio.to_thread(self.gate.wait, 5)
+        return {"default": {"connections": connections}}
+
+
+def test_readiness_is_held_until_warm_up_finishes(monkeypatch):
+    pool = GatedPool()
+    monkeypatch.setattr(provider_pool, "_pool", pool)
+    monkeypatch.setattr(settings, "WARMUP", True)
+    monkeypatch.setattr(settings, "WARMUP_CONNECTIONS", 3)
+    monkeypatch.setattr(settings, "WARMUP_PROMPT", "ping, reply json")
+
+    with TestClient(app) as c:
+        # 预热没完成：存活探针照常 200，就绪探针 503
+        assert c.get("/health").status_code == 200
+        resp = c.get("/health/ready")
+        assert resp.status_code == 503
+        assert resp.json()["status"] == "warming_up"
+
+        pool.gate.set()
+        deadline = time.monotonic() + 5
+        while (resp := c.get("/health/ready")).status_code != 200:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+    body = resp.json()
+    assert body["status"] == "ready"
+    assert body["warmup"]["steps"]["upstream"] == {"default": {"connections": 3}}
+    assert "rows" in body["warmup"]["steps"]["sqlite"]
+    assert pool.calls == [(3, "ping, reply json")]
+
+
+def test_readiness_is_immediate_without_warm_up(monkeypatch):
+    monkeypatch.setattr(settings, "WARMUP", False)
+    with TestClient(app) as c:
+        assert c.get("/health/ready").json() == {"status": "ready"}
+
+
+def test_client_warms_and_reuses_one_pooled_connection_set(monkeypatch):
+    seen: list[tuple[str, str]] = []
+    created = 0
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.method, request.url.path))
+        if request.url.path.endswith("/models"):
+            return httpx.Response(401)  # 状态码无所谓，连接已经建好了
+        content = json.dumps({"ok": True})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    real_client = httpx.AsyncClient
+
+    def client_factory(**kwargs):
+        nonlocal created
+        created += 1
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", client_factory)
+    client = DeepSeekClient("k", base_url="https://upstream.test/v1", model="m-warm")
+
+    async def scenario():
+        warmed = await client.warm(3)
+        first = await client.chat_json("p")
+        second = await client.chat_json("p")
+        await client.aclose()
+        return warmed, first, second
+
+    warmed, first, second = asyncio.run(scenario())
+
+    assert warmed == 3
+    assert first == second == {"ok": True}
+    assert seen.count(("GET", "/v1/models")) == 3
+    assert seen.count(("POST", "/v1/chat/completions")) == 2
+    # 同一个事件循环里只建了一个 AsyncClient：预热的连接就是后面请求用的连接
+    assert created == 1